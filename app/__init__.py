@@ -1,38 +1,50 @@
 from flask import Flask
-from config import Config
+from config import get_config
 from app.extensions import db
-from flask_security import Security, SQLAlchemySessionUserDatastore
+from flask_security import Security
 from app.extensions import login_manager, bcrypt
 
 
-def create_app(config_class=Config):
+def create_app(config_class=None):
     """ Factory function to create a Flask application instance.
 
     Parameters:
-        config_class: The configuration class to use.
+        config_class: The configuration class to use; defaults to the
+        profile named by the APP_ENV environment variable.
 
     Returns: app: The Flask application instance.
     """
     app = Flask(__name__)
-    app.config.from_object(config_class)
+    app.config.from_object(config_class or get_config())
     app.config['SECRET_KEY'] = 'amira'
     UPLOAD_FOLDER = 'uploads/'
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
     # Initialize Flask extensions
     db.init_app(app)
+    from app.lookups import init_lookups
+    init_lookups(app)
+    from app.user_cache import CachedUserDatastore, init_user_cache, load_user
+    init_user_cache(app)
+    from app.fragments import init_fragment_cache
+    init_fragment_cache(app)
+    from app.pool_metrics import init_pool_metrics
+    from app.instrumentation import init_instrumentation
+    with app.app_context():
+        init_pool_metrics(db.engines)
+        init_instrumentation(app, db.engines)
     bcrypt.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
-    from app.models.user import User, Role, create_roles
-    create_roles()
-    datastore = SQLAlchemySessionUserDatastore(db.session, User, Role)
+    # roles are seeded by `flask seed-roles`; nothing is written at boot
+    from app.models.user import User, Role
+    datastore = CachedUserDatastore(db.session, User, Role)
     security = Security(app, datastore)
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(user_id)
+    # the session stores the fs_uniquifier; user and roles come from the
+    # user cache, or from one joined query
+    login_manager.user_loader(load_user)
 
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp)
@@ -53,6 +65,18 @@ def create_app(config_class=Config):
     from app.customers import bp as customers_bp
     app.register_blueprint(customers_bp, url_prefix='/customers')
 
+    from app.imports import bp as imports_bp
+    app.register_blueprint(imports_bp, url_prefix='/imports')
+
+    from app.reports import bp as reports_bp
+    app.register_blueprint(reports_bp, url_prefix='/reports')
+
+    from app.changes import bp as changes_bp
+    app.register_blueprint(changes_bp, url_prefix='/changes')
+
+    from app.cli import register_commands
+    register_commands(app)
+
     return app
 
 
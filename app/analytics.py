@@ -0,0 +1,319 @@
+"""Vectorized sales analytics over an on-disk columnar snapshot
+
+The sales columns the analyses need are copied out of the database in
+cursor batches into NumPy arrays and kept on disk under ANALYTICS_DIR as
+``.npz`` segments, one per refresh, listed in a JSON manifest together
+with the highest sale id they hold. A refresh only reads the sales above
+that watermark and appends them as a new segment; segments are merged
+once there are more than MAX_SEGMENTS. Sales are never updated in place
+by the watermark: when rows at or below it were deleted the snapshot is
+rebuilt, and ``refresh_snapshot(full=True)`` (``flask
+analytics-snapshot --full``) picks up edits to existing sales. Reports
+refresh the snapshot when it is older than ANALYTICS_REFRESH_SECONDS;
+worker processes sharing the directory take turns through a lock file.
+
+The analyses (cohorts, RFM segments, moving averages, stock forecasts)
+work on the snapshot as a pandas DataFrame with groupbys and rolling
+windows; no ORM objects are built.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import func, select
+from app.extensions import db
+from app.import_export.stream_export import iter_export_batches
+from app.models.product import Product
+from app.models.sale import Sale
+
+
+SNAPSHOT_COLUMNS = [Sale.id, Sale.product_id, Sale.customer_id, Sale.user_id,
+                    Sale.product_quantity, Sale.unit_price, Sale.date]
+MANIFEST = 'manifest.json'
+MAX_SEGMENTS = 16
+MAX_FORECAST_DAYS = 3660
+RFM_SEGMENTS = [
+    # (segment, minimum recency score, minimum frequency+monetary score)
+    ('champions', 4, 8),
+    ('loyal', 3, 6),
+    ('promising', 4, 0),
+    ('needs attention', 3, 0),
+    ('at risk', 0, 6),
+    ('lost', 0, 0),
+]
+
+_lock = threading.Lock()
+# snapshot directory -> (segment names, DataFrame) loaded by this process
+_loaded = {}
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST)) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {'watermark': 0, 'rows': 0, 'segments': []}
+
+
+@contextmanager
+def _locked(path):
+    """Hold the refresh lock of a snapshot directory."""
+    with _lock, open(os.path.join(path, 'refresh.lock'), 'w') as handle:
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def _write_manifest(path, manifest):
+    temporary = os.path.join(path, MANIFEST + '.tmp')
+    with open(temporary, 'w') as handle:
+        json.dump(manifest, handle)
+    os.replace(temporary, os.path.join(path, MANIFEST))
+
+
+def _batch_arrays(batch):
+    """ Convert one cursor batch of SNAPSHOT_COLUMNS rows to arrays.
+
+    Missing product, customer and user ids become 0 and missing unit
+    prices 0, like in the rollups.
+    """
+    frame = pd.DataFrame.from_records(
+        batch, columns=[column.key for column in SNAPSHOT_COLUMNS])
+    arrays = {key: frame[key].fillna(0).to_numpy(np.int64)
+              for key in frame.columns if key != 'date'}
+    arrays['date'] = pd.to_datetime(frame['date']).to_numpy(
+        'datetime64[us]')
+    return arrays
+
+
+def _read_sales(after):
+    """ Read the sales with an id above ``after`` as column arrays.
+
+    Returns:
+        dict: column name -> array, or None when there is no such sale.
+    """
+    chunks = [_batch_arrays(batch) for batch in iter_export_batches(
+        SNAPSHOT_COLUMNS, Sale.id > after) if batch]
+    if not chunks:
+        return None
+    return {key: np.concatenate([chunk[key] for chunk in chunks])
+            for key in chunks[0]}
+
+
+def _load_segments(path, segments):
+    arrays = {column.key: [np.array([], np.int64)]
+              for column in SNAPSHOT_COLUMNS}
+    arrays['date'] = [np.array([], 'datetime64[us]')]
+    for name in segments:
+        with np.load(os.path.join(path, name)) as segment:
+            for key in segment.files:
+                arrays[key].append(segment[key])
+    return {key: np.concatenate(parts) for key, parts in arrays.items()}
+
+
+def _save_segment(path, arrays):
+    name = f"sales-{arrays['id'][0]}-{arrays['id'][-1]}.npz"
+    np.savez(os.path.join(path, name), **arrays)
+    return name
+
+
+def refresh_snapshot(path=None, full=False):
+    """ Bring the on-disk snapshot of the sales up to date.
+
+    Parameters:
+        path (str): The snapshot directory; ANALYTICS_DIR when None.
+        full (bool): Rebuild the snapshot from scratch.
+
+    Returns:
+        dict: The manifest: watermark, row count and segment files.
+    """
+    path = path or current_app.config['ANALYTICS_DIR']
+    os.makedirs(path, exist_ok=True)
+    with _locked(path):
+        manifest = _read_manifest(path)
+        if not full and manifest['watermark']:
+            kept = db.session.scalar(select(func.count()).where(
+                Sale.id <= manifest['watermark']))
+            full = kept != manifest['rows']
+        if full:
+            old_segments = manifest['segments']
+            manifest = {'watermark': 0, 'rows': 0, 'segments': []}
+        else:
+            old_segments = []
+        arrays = _read_sales(manifest['watermark'])
+        if arrays is not None:
+            manifest['segments'].append(_save_segment(path, arrays))
+            manifest['watermark'] = int(arrays['id'][-1])
+            manifest['rows'] += len(arrays['id'])
+        if len(manifest['segments']) > MAX_SEGMENTS:
+            old_segments += manifest['segments']
+            merged = _load_segments(path, manifest['segments'])
+            manifest['segments'] = [_save_segment(path, merged)]
+            old_segments.remove(manifest['segments'][0])
+        manifest['refreshed_at'] = datetime.now().isoformat()
+        _write_manifest(path, manifest)
+        for name in set(old_segments) - set(manifest['segments']):
+            os.remove(os.path.join(path, name))
+    return manifest
+
+
+def _is_stale(manifest, max_age):
+    refreshed_at = manifest.get('refreshed_at')
+    return (refreshed_at is None or datetime.now()
+            - datetime.fromisoformat(refreshed_at)
+            > timedelta(seconds=max_age))
+
+
+def load_sales(path=None):
+    """ Return the sales snapshot as a DataFrame.
+
+    The snapshot is refreshed first when it is older than
+    ANALYTICS_REFRESH_SECONDS. The frame stays in memory; after a refresh
+    only the new segments are read from disk.
+
+    Parameters:
+        path (str): The snapshot directory; ANALYTICS_DIR when None.
+
+    Returns:
+        DataFrame: One row per sale with the SNAPSHOT_COLUMNS and a
+        ``revenue`` column, ordered by id.
+    """
+    path = path or current_app.config['ANALYTICS_DIR']
+    manifest = _read_manifest(path)
+    if _is_stale(manifest, current_app.config['ANALYTICS_REFRESH_SECONDS']):
+        manifest = refresh_snapshot(path)
+    segments = manifest['segments']
+    loaded, frame = _loaded.get(path, ([], None))
+    if loaded != segments[:len(loaded)] or frame is None:
+        loaded, frame = [], None
+    if frame is None or len(loaded) < len(segments):
+        new = pd.DataFrame(_load_segments(path, segments[len(loaded):]))
+        new['revenue'] = new['product_quantity'] * new['unit_price']
+        frame = new if frame is None else pd.concat([frame, new],
+                                                     ignore_index=True)
+        _loaded[path] = (list(segments), frame)
+    return frame
+
+
+def cohorts(sales, period='M'):
+    """ Count the active customers of each acquisition cohort.
+
+    Parameters:
+        sales (DataFrame): The snapshot from ``load_sales``.
+        period (str): The pandas period of a cohort, 'M' or 'W'.
+
+    Returns:
+        DataFrame: One row per cohort (period of the first purchase) and
+        one column per number of periods since it, holding the number of
+        customers who bought in that period.
+    """
+    sales = sales[sales['customer_id'] != 0]
+    periods = sales['date'].dt.to_period(period)
+    first = periods.groupby(sales['customer_id']).transform('min')
+    age = periods.array.asi8 - first.array.asi8
+    return (pd.DataFrame({'cohort': first, 'age': age,
+                          'customer_id': sales['customer_id']})
+            .groupby(['cohort', 'age'])['customer_id'].nunique()
+            .unstack(fill_value=0))
+
+
+def rfm(sales, now=None):
+    """ Score the customers on recency, frequency and monetary value.
+
+    Parameters:
+        sales (DataFrame): The snapshot from ``load_sales``.
+        now (datetime): The reference date; the latest sale when None.
+
+    Returns:
+        DataFrame: One row per customer id with the days since the last
+        sale, the number of sales, the revenue, their 1-5 quintile scores
+        and the RFM segment.
+    """
+    sales = sales[sales['customer_id'] != 0]
+    now = pd.Timestamp(now) if now is not None else sales['date'].max()
+    table = sales.groupby('customer_id').agg(
+        last_sale=('date', 'max'), frequency=('id', 'size'),
+        monetary=('revenue', 'sum'))
+    table['recency'] = (now - table.pop('last_sale')).dt.days
+
+    def score(values, ascending=True):
+        ranks = values.rank(method='first', ascending=ascending, pct=True)
+        return np.ceil(ranks * 5).clip(1, 5).astype(np.int64)
+
+    table['r'] = score(table['recency'], ascending=False)
+    table['f'] = score(table['frequency'])
+    table['m'] = score(table['monetary'])
+    value = table['f'] + table['m']
+    table['segment'] = np.select(
+        [(table['r'] >= recency) & (value >= worth)
+         for _, recency, worth in RFM_SEGMENTS],
+        [name for name, _, _ in RFM_SEGMENTS], default='lost')
+    return table
+
+
+def moving_average(sales, window=7, product_id=None):
+    """ Average the units sold per day over a sliding window.
+
+    Parameters:
+        sales (DataFrame): The snapshot from ``load_sales``.
+        window (int): The window in days.
+        product_id (int): Restrict to one product; all when None.
+
+    Returns:
+        DataFrame: One row per calendar day with the units sold and their
+        moving average.
+    """
+    if product_id is not None:
+        sales = sales[sales['product_id'] == product_id]
+    daily = (sales.set_index('date')['product_quantity']
+             .resample('D').sum())
+    return pd.DataFrame({'quantity': daily,
+                         'moving_average': daily.rolling(
+                             window, min_periods=1).mean()})
+
+
+def stock_forecast(sales, window=28, now=None):
+    """ Forecast when each product runs out of stock.
+
+    The selling rate of a product is its average units per day over the
+    last ``window`` days.
+
+    Parameters:
+        sales (DataFrame): The snapshot from ``load_sales``.
+        window (int): The number of days the rate is measured over.
+        now (datetime): The end of the window; the latest sale when None.
+
+    Returns:
+        DataFrame: One row per product sold in the window with its stock,
+        daily rate, days of stock left and expected stock-out date (NaT
+        beyond MAX_FORECAST_DAYS), the soonest first; empty when there
+        are no sales.
+    """
+    now = pd.Timestamp(now) if now is not None else sales['date'].max()
+    if sales.empty or pd.isnull(now):
+        return pd.DataFrame({'stock': pd.Series(dtype='int64'),
+                             'daily_rate': pd.Series(dtype='float64'),
+                             'days_left': pd.Series(dtype='float64'),
+                             'stockout_date': pd.Series(
+                                 dtype='datetime64[ns]')})
+    recent = sales[(sales['date'] > now - pd.Timedelta(days=window))
+                   & (sales['product_id'] != 0)]
+    rate = recent.groupby('product_id')['product_quantity'].sum() / window
+    stock = pd.Series(dict(db.session.execute(
+        select(Product.id, Product.product_quantity)
+        .where(Product.id.in_(rate.index.tolist()))).all()), dtype='int64')
+    table = pd.DataFrame({'stock': stock, 'daily_rate': rate}).dropna()
+    table['days_left'] = table['stock'] / table['daily_rate']
+    horizon = table['days_left'].where(
+        table['days_left'] <= MAX_FORECAST_DAYS)
+    table['stockout_date'] = now.normalize() + pd.to_timedelta(
+        horizon.round(), unit='D')
+    return table.sort_values('days_left')
@@ -0,0 +1,51 @@
+from flask import render_template, request, redirect, url_for
+from flask_login import login_user, logout_user
+from app.auth import bp
+from app.extensions import db
+from app.models.user import User
+from app.passwords import (PasswordServiceBusy, hash_password, needs_rehash,
+                           verify_password)
+
+
+@bp.route('/', methods=['GET', 'POST'])
+def login():
+    """ Log a user in with their email and password.
+
+    Methods:
+        GET: Render the login template.
+        POST: Check the credentials and start the user's session.
+
+    Returns:
+        Template or redirect: Render the login template again on bad
+        credentials (401) or when the password checks are saturated
+        (503), or redirect to the dashboard.
+    """
+    if request.method == 'POST':
+        password = request.form['password']
+        user = User.query.filter_by(user_email=request.form['email']).first()
+        try:
+            valid = (user is not None and user.active
+                     and verify_password(password, user.password))
+        except PasswordServiceBusy:
+            return render_template('login.html', error='Too many sign-ins '
+                                   'at the moment, please retry'), 503
+        if valid:
+            if needs_rehash(user.password):
+                user.password = hash_password(password)
+                db.session.commit()
+            login_user(user)
+            return redirect(url_for('main.index'))
+        return render_template('login.html',
+                               error='Invalid email or password'), 401
+    return render_template('login.html')
+
+
+@bp.route('/logout')
+def logout():
+    """ Log the current user out.
+
+    Returns:
+        Redirect: Redirect to the login page.
+    """
+    logout_user()
+    return redirect(url_for('auth.login'))
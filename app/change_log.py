@@ -0,0 +1,245 @@
+"""Change log of the sales, products, customers and users, and its feed
+
+Every ORM flush appends one ``change_log`` row per inserted, updated or
+deleted row of the captured tables, in the same transaction, so a change
+is logged if and only if it commits. Core statements bypass the ORM
+events: the writers that insert or update rows with them call
+``log_changes`` next to ``adjust_counters``. The log holds the operation,
+table, primary key and updated columns, not the values; the feed can
+embed the current rows. Foreign keys cleared by ON DELETE SET NULL are
+not logged: they follow from the logged delete.
+
+``read_changes`` serves the /changes feed in sequence order, so a
+consumer replicates with one query per page of changes instead of
+re-reading the tables. Sequence numbers are taken when a transaction
+writes its changes, not when it commits: on a database with concurrent
+writers, seq 12 can be visible while the transaction holding 11 has not
+committed. A page therefore ends before any gap in the sequence younger
+than CHANGE_FEED_GAP_SECONDS; older gaps are rolled back transactions.
+The feed is read from the primary: the gap age is measured from the
+write time, and a replica lagging by more than the window would show an
+old gap for a transaction it has not applied yet, which would be skipped.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+import pytz
+from flask import current_app
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session, selectinload
+from app.extensions import db
+from app.models.change import Change
+from app.models.customer import Customer
+from app.models.product import Product
+from app.models.sale import Sale
+from app.models.user import User
+
+
+# Captured table -> model
+CAPTURED = {model.__tablename__: model
+            for model in (Sale, Product, Customer, User)}
+PRUNE_BATCH_SIZE = 10000
+# Notified after every commit of this process, to wake the long polls
+_committed = threading.Condition()
+
+
+def _changed_keys(state):
+    """The columns (and association collections) a flush updates."""
+    mapper = state.mapper
+    keys = [prop.key for prop in mapper.column_attrs]
+    keys += [rel.key for rel in mapper.relationships
+             if rel.secondary is not None]
+    return [key for key in keys if state.attrs[key].history.has_changes()]
+
+
+@event.listens_for(Session, 'after_flush')
+def _log_flushed_rows(session, flush_context):
+    """Append the inserts, updates and deletes of a flush to the log."""
+    rows = []
+    for op, instances in (('insert', session.new),
+                          ('update', session.dirty),
+                          ('delete', session.deleted)):
+        for instance in instances:
+            table = getattr(instance, '__tablename__', None)
+            if table not in CAPTURED:
+                continue
+            state = inspect(instance)
+            columns = None
+            if op == 'update':
+                columns = _changed_keys(state)
+                if not columns:
+                    continue
+            row_id = state.identity[0] if state.has_identity else instance.id
+            rows.append((op, table, row_id, columns))
+    if rows:
+        now = datetime.now(pytz.UTC)
+        session.connection().execute(Change.__table__.insert(), [
+            {'op': op, 'table_name': table, 'row_id': row_id,
+             'columns': ','.join(columns) if columns else None,
+             'changed_at': now} for op, table, row_id, columns in rows])
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_waiters(session):
+    with _committed:
+        _committed.notify_all()
+
+
+def _gap_cutoff():
+    seconds = current_app.config['CHANGE_FEED_GAP_SECONDS']
+    return (datetime.now(pytz.UTC).replace(tzinfo=None)
+            - timedelta(seconds=seconds))
+
+
+def _settled_through(after, last):
+    """ Return the last seq of (after, last] that no young gap precedes.
+
+    A gap is young when the change following it was written within the
+    gap window, so only those changes of the range are read.
+    """
+    young = list(db.session.scalars(
+        select(Change.seq)
+        .where(Change.seq > after, Change.seq <= last,
+               Change.changed_at >= _gap_cutoff())
+        .order_by(Change.seq)))
+    if not young:
+        return last
+    previous = db.session.scalar(
+        select(func.max(Change.seq))
+        .where(Change.seq > after, Change.seq < young[0])) or after
+    for seq in young:
+        if seq != previous + 1:
+            return previous
+        previous = seq
+    return last
+
+
+def change_seq():
+    """ Return the sequence number a new consumer should start after.
+
+    Every change up to it has been committed, so data read now and the
+    changes after it together miss nothing; a few of those changes may
+    already be in the data.
+
+    Returns:
+        int: The newest seq older than the gap window, 0 if none.
+    """
+    return db.session.scalar(
+        select(Change.seq).where(Change.changed_at < _gap_cutoff())
+        .order_by(Change.seq.desc()).limit(1)) or 0
+
+
+def is_pruned(after):
+    """ Return whether the changes following ``after`` were pruned.
+
+    The change ``after`` was read by the consumer, so it is gone only if
+    the oldest change kept is newer. Pruning always keeps the newest one.
+
+    Parameters:
+        after (int): The last seq the consumer applied.
+
+    Returns:
+        bool: True if the consumer must start over from a full export.
+    """
+    oldest = db.session.scalar(select(func.min(Change.seq)))
+    return bool(after) and oldest is not None and oldest > after
+
+
+def _embed_rows(changes):
+    """Add the current row of every inserted or updated row."""
+    ids = {}
+    for change in changes:
+        if change['op'] != 'delete':
+            ids.setdefault(change['table'], set()).add(change['id'])
+    rows = {}
+    for table, keys in ids.items():
+        model = CAPTURED[table]
+        query = select(model).where(model.id.in_(keys))
+        if model is User:
+            query = query.options(selectinload(User.roles))
+        rows.update(((table, row.id), row.to_dict())
+                    for row in db.session.scalars(query))
+    for change in changes:
+        change['row'] = rows.get((change['table'], change['id']))
+
+
+def read_changes(after, table=None, limit=100, rows=False):
+    """ Return a page of the changes committed after a sequence number.
+
+    Parameters:
+        after (int): The last seq the consumer applied; 0 for all.
+        table (str): Only the changes of this captured table when given.
+        limit (int): The largest number of changes returned.
+        rows (bool): Whether to embed the current row of every inserted
+        or updated row (None when it was deleted since).
+
+    Returns:
+        list: The changes as dictionaries, in sequence order.
+    """
+    statement = (select(Change).where(Change.seq > after)
+                 .order_by(Change.seq).limit(limit))
+    if table is not None:
+        statement = statement.where(Change.table_name == table)
+    changes = list(db.session.scalars(statement))
+    if changes:
+        settled = _settled_through(after, changes[-1].seq)
+        changes = [change.to_dict() for change in changes
+                   if change.seq <= settled]
+    if rows and changes:
+        _embed_rows(changes)
+    return changes
+
+
+def wait_for_changes(after, table=None, limit=100, rows=False,
+                     timeout=0):
+    """ Like ``read_changes``, but wait up to ``timeout`` seconds for a
+    change when there is none yet.
+
+    Commits of this process wake the wait at once; those of other
+    processes are seen within CHANGE_FEED_POLL_SECONDS.
+
+    Returns:
+        list: The changes as dictionaries, empty if none came in time.
+    """
+    deadline = time.monotonic() + timeout
+    poll = current_app.config['CHANGE_FEED_POLL_SECONDS']
+    while True:
+        changes = read_changes(after, table, limit, rows)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        # end the read transaction, so the next poll sees new commits
+        db.session.rollback()
+        with _committed:
+            _committed.wait(min(remaining, poll))
+
+
+def prune_changes(days):
+    """ Delete the changes older than ``days``, in batches, keeping the
+    newest change.
+
+    Parameters:
+        days (int): The retention in days.
+
+    Returns:
+        int: The number of changes deleted.
+    """
+    cutoff = (datetime.now(pytz.UTC).replace(tzinfo=None)
+              - timedelta(days=days))
+    newest = db.session.scalar(select(func.max(Change.seq)))
+    last = db.session.scalar(
+        select(Change.seq)
+        .where(Change.changed_at < cutoff, Change.seq < newest)
+        .order_by(Change.seq.desc()).limit(1)) if newest else None
+    first = db.session.scalar(select(func.min(Change.seq)))
+    deleted = 0
+    if last is not None:
+        for start in range(first, last + 1, PRUNE_BATCH_SIZE):
+            deleted += db.session.execute(
+                delete(Change).where(
+                    Change.seq >= start,
+                    Change.seq <= min(start + PRUNE_BATCH_SIZE - 1, last))
+            ).rowcount
+            db.session.commit()
+    return deleted
+
@@ -0,0 +1,7 @@
+from flask import Blueprint
+
+
+bp = Blueprint('changes', __name__)
+
+
+from app.changes import routes
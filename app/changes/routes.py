@@ -0,0 +1,71 @@
+import json
+import time
+from flask import (Response, current_app, jsonify, request,
+                   stream_with_context)
+from flask_security import roles_accepted
+from app.changes import bp
+from app.change_log import CAPTURED, is_pruned, wait_for_changes
+
+
+def _event(change):
+    return (f"id: {change['seq']}\nevent: change\n"
+            f"data: {json.dumps(change)}\n\n")
+
+
+@bp.route('/', methods=['GET'])
+@roles_accepted('admin')
+def index():
+    """ Stream the changes to sales, products, customers and users.
+
+    Methods:
+        GET: Return the changes after the sequence number ``after`` (the
+        Last-Event-ID header when reconnecting an event stream), at most
+        ``limit``, only those of ``table`` when given, and with the
+        current rows embedded with ``rows=1``. With ``wait`` seconds an
+        empty page is held until a change arrives (long poll). With
+        ``Accept: text/event-stream`` the changes are sent as server-sent
+        events until CHANGE_FEED_MAX_WAIT seconds have passed. Always
+        read from the primary (see ``app.change_log``).
+
+    Returns:
+        JSON response or event stream: The changes and the ``last_seq``
+        to pass as ``after`` next; 410 when the changes after ``after``
+        were pruned and the consumer must start over from an export.
+    """
+    config = current_app.config
+    table = request.args.get('table') or None
+    try:
+        after = int(request.headers.get('Last-Event-ID')
+                    or request.args.get('after', 0))
+        limit = min(int(request.args.get('limit', 100)),
+                    config['CHANGE_FEED_MAX_LIMIT'])
+        wait = min(float(request.args.get('wait', 0)),
+                   config['CHANGE_FEED_MAX_WAIT'])
+    except ValueError:
+        return jsonify({"error": "Invalid after, limit or wait"}), 400
+    if (table is not None and table not in CAPTURED) or limit < 1:
+        return jsonify({"error": "Invalid table or limit"}), 400
+    rows = request.args.get('rows') == '1'
+    if is_pruned(after):
+        return jsonify({"error": "Changes pruned, resync from an export"}), 410
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        def generate(after):
+            deadline = time.monotonic() + config['CHANGE_FEED_MAX_WAIT']
+            yield 'retry: 1000\n\n'
+            while time.monotonic() < deadline:
+                changes = wait_for_changes(after, table, limit, rows,
+                                           deadline - time.monotonic())
+                for change in changes:
+                    yield _event(change)
+                if changes:
+                    after = changes[-1]['seq']
+        response = Response(stream_with_context(generate(after)),
+                            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    changes = wait_for_changes(after, table, limit, rows, max(wait, 0))
+    return jsonify({"changes": changes,
+                    "last_seq": changes[-1]['seq'] if changes else after})
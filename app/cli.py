@@ -0,0 +1,128 @@
+"""Flask CLI commands for database maintenance"""
+import click
+from flask.cli import AppGroup
+from app.extensions import db
+from app.search import create_search_indexes
+from app.counters import reconcile_counters
+from app.rollups import rebuild_rollups
+from app.change_log import prune_changes
+from app.lookups import clear_lookups, lookup_stats
+from app.routing import REPLICA_BIND, sync_sqlite_replica
+from app.models.user import create_roles
+from app import migrations
+from app.migrations.plans import check_query_plans
+
+
+db_cli = AppGroup('db', help='Manage the database schema.')
+
+
+@db_cli.command('upgrade')
+@click.option('--revision', type=int, default=None,
+              help='Stop after this revision.')
+def upgrade(revision):
+    """Apply the pending schema migrations."""
+    applied = migrations.upgrade(db.engine, revision, echo=click.echo)
+    click.echo(f'{len(applied)} migration(s) applied.')
+
+
+@db_cli.command('status')
+def status():
+    """List the migrations and whether they are applied."""
+    for revision, description, applied in migrations.status(db.engine):
+        mark = 'x' if applied else ' '
+        click.echo(f'[{mark}] {revision:04d} {description}')
+
+
+@db_cli.command('check-plans')
+def check_plans():
+    """EXPLAIN the hot queries and fail if any scans a whole table."""
+    with db.engine.connect() as connection:
+        failures = check_query_plans(connection)
+    for name, plan in failures.items():
+        click.echo(f'FULL SCAN in {name}:', err=True)
+        for step in plan:
+            click.echo(f'    {step}', err=True)
+    if failures:
+        raise click.ClickException(
+            f'{len(failures)} hot query plan(s) scan a whole table')
+    click.echo('All hot queries use indexes.')
+
+
+def register_commands(app):
+    """ Register the maintenance commands on the application's CLI.
+
+    Parameters:
+        app: The Flask application instance.
+    """
+    app.cli.add_command(db_cli)
+
+    @app.cli.command('seed-roles')
+    def seed_roles():
+        """Add the default roles that are missing; safe to rerun."""
+        added = create_roles()
+        click.echo(f"Added roles: {', '.join(added)}." if added
+                   else 'All default roles already exist.')
+
+    @app.cli.command('search-index')
+    def search_index():
+        """Create the full-text indexes and rebuild them from the tables."""
+        with db.engine.begin() as connection:
+            create_search_indexes(connection)
+        click.echo('Search indexes are up to date.')
+
+    @app.cli.command('reconcile-counters')
+    def reconcile():
+        """Recompute the dashboard counters with COUNT(*)."""
+        for key, count in reconcile_counters().items():
+            click.echo(f'{key}: {count}')
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild():
+        """Recompute the sales rollups of the reports from the sales."""
+        with db.engine.begin() as connection:
+            rebuild_rollups(connection)
+        click.echo('Sales rollups rebuilt.')
+
+    @app.cli.command('prune-changes')
+    @click.option('--days', type=int, default=None,
+                  help='Retention; CHANGE_LOG_RETENTION_DAYS by default.')
+    def prune(days):
+        """Delete the old entries of the change log."""
+        if days is None:
+            days = app.config['CHANGE_LOG_RETENTION_DAYS']
+        click.echo(f'{prune_changes(days)} change(s) older than {days} '
+                   'days deleted.')
+
+    @app.cli.command('analytics-snapshot')
+    @click.option('--full', is_flag=True,
+                  help='Rebuild it, e.g. after sales were edited.')
+    def analytics_snapshot(full):
+        """Append the new sales to the analytics snapshot."""
+        from app.analytics import refresh_snapshot
+        manifest = refresh_snapshot(full=full)
+        click.echo(f"{manifest['rows']} sales up to id "
+                   f"{manifest['watermark']} in "
+                   f"{len(manifest['segments'])} segment(s).")
+
+    @app.cli.command('lookup-cache')
+    @click.option('--clear', is_flag=True,
+                  help='Drop every entry, e.g. after editing rows by hand.')
+    def lookup_cache(clear):
+        """Show the size of the lookup cache, or clear it."""
+        if clear:
+            clear_lookups()
+            click.echo('Lookup cache cleared.')
+        stats = lookup_stats()
+        click.echo(f"{stats['backend']} lookup cache: {stats['size']} of "
+                   f"{stats['max_size']} entries, ttl {stats['ttl']}s")
+
+    @app.cli.command('replica-sync')
+    def replica_sync():
+        """Copy a SQLite primary onto its SQLite replica."""
+        if REPLICA_BIND not in db.engines:
+            raise click.ClickException('no replica database is configured')
+        try:
+            sync_sqlite_replica(db.engines)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+        click.echo('Replica is up to date.')
@@ -0,0 +1,203 @@
+"""Row counters for the dashboard, maintained incrementally
+
+Every ORM flush adds the number of inserted and deleted rows of the
+counted tables to the counters inside the same transaction, and the bulk
+import writers call ``adjust_counters`` for the rows they write with core
+statements. A counter is a base row of ``table_counters`` plus
+COUNTER_SLOTS rows of ``table_counter_slots``, summed on read: each write
+goes to a random slot, so concurrent writers of a table rarely wait on
+one row lock (InnoDB holds it until commit). ``reconcile_counters``
+corrects the base rows by their difference with COUNT(*); ``get_counts``
+runs it only when the counters are missing, and ``flask
+reconcile-counters`` (run from cron) otherwise.
+
+Each counter also holds a version of its table, incremented by every
+flush that inserts, updates or deletes its rows (the user version also
+by those of the role and user_roles rows) and by every
+``adjust_counters`` call naming it; core writers that update rows in
+place pass a delta of 0. The list page caches key on ``get_versions``;
+the exports also send the time of the last write (``changed_at``).
+"""
+import threading
+from collections import Counter
+from datetime import datetime
+import pytz
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.counter import CounterSlot, TableCounter, add_to_counters
+from app.models.customer import Customer
+from app.models.product import Product
+from app.models.sale import Sale
+from app.models.user import User
+
+
+# Dashboard key -> counted model
+COUNTED = {'user_count': User,
+           'customer_count': Customer,
+           'product_count': Product,
+           'sale_count': Sale}
+_COUNTED_TABLES = {model.__tablename__ for model in COUNTED.values()}
+# Uncounted table -> the counted table whose version its writes bump: the
+# users pages show role names
+_VERSIONED_WITH = {'role': 'user', 'user_roles': 'user'}
+# one bootstrap reconciliation at a time per process
+_reconcile_lock = threading.Lock()
+
+
+def adjust_counters(connection, deltas):
+    """ Add row deltas to the counters within the caller's transaction.
+
+    The version of every table named is incremented, even with a delta
+    of 0. See ``add_to_counters``.
+
+    Parameters:
+        connection: The connection (or session) of the writing transaction.
+        deltas (dict): table name -> number of rows added (negative for
+        deleted rows).
+    """
+    add_to_counters(connection, deltas)
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_flushed_rows(session, flush_context):
+    """Apply the inserts and deletes of a flush to the counters."""
+    deltas = Counter()
+    for instance in session.dirty:
+        table = getattr(instance, '__tablename__', None)
+        table = _VERSIONED_WITH.get(table, table)
+        if table in _COUNTED_TABLES and session.is_modified(instance):
+            deltas.setdefault(table, 0)
+    for instance in (*session.new, *session.deleted):
+        table = _VERSIONED_WITH.get(getattr(instance, '__tablename__', None))
+        if table is not None:
+            deltas.setdefault(table, 0)
+    for instance in session.new:
+        table = getattr(instance, '__tablename__', None)
+        if table in _COUNTED_TABLES:
+            deltas[table] += 1
+    for instance in session.deleted:
+        table = getattr(instance, '__tablename__', None)
+        if table in _COUNTED_TABLES:
+            deltas[table] -= 1
+    if deltas:
+        adjust_counters(session.connection(), deltas)
+
+
+def _slot_totals(tables):
+    """The slot sums of tables, as a subquery keyed by table name."""
+    return (select(CounterSlot.name,
+                   func.sum(CounterSlot.count).label('count'),
+                   func.sum(CounterSlot.version).label('version'),
+                   func.max(CounterSlot.changed_at).label('changed_at'))
+            .where(CounterSlot.name.in_(tables))
+            .group_by(CounterSlot.name).subquery())
+
+
+def _read_counters(tables):
+    """ Return the counters of tables, their base row plus their slots.
+
+    Returns:
+        dict: table name -> (version, row count, changed_at), without the
+        tables that have no base row yet.
+    """
+    slots = _slot_totals(tables)
+    rows = db.session.execute(
+        select(TableCounter.name,
+               func.coalesce(TableCounter.version, 0)
+               + func.coalesce(slots.c.version, 0),
+               TableCounter.count + func.coalesce(slots.c.count, 0),
+               TableCounter.changed_at, slots.c.changed_at)
+        .outerjoin(slots, slots.c.name == TableCounter.name)
+        .where(TableCounter.name.in_(tables)))
+    return {name: (version, count,
+                   max(filter(None, (changed_at, slot_changed_at)),
+                       default=None))
+            for name, version, count, changed_at, slot_changed_at in rows}
+
+
+def get_versions(tables):
+    """ Return the current version of counted tables in one query.
+
+    Parameters:
+        tables (list): The table names.
+
+    Returns:
+        dict: table name -> (version, row count), without the tables that
+        have no counter yet.
+    """
+    return {name: (version, count) for name, (version, count, _)
+            in _read_counters(tables).items()}
+
+
+def get_table_state(name):
+    """ Return the version of a counted table and when it last changed.
+
+    Parameters:
+        name (str): The table name.
+
+    Returns:
+        tuple: (version, changed_at), both None when the table has no
+        counter yet; changed_at is None until its first write.
+    """
+    version, _, changed_at = _read_counters([name]).get(
+        name, (None, None, None))
+    return version, changed_at
+
+
+def reconcile_counters():
+    """ Correct every counter by the difference with COUNT(*) and commit.
+
+    The exact count and the counter are read by one statement, so they
+    see the same snapshot, and the counter is moved by their difference
+    rather than overwritten: the deltas other writers commit meanwhile
+    are kept.
+
+    Returns:
+        dict: Dashboard key -> exact row count.
+    """
+    now = datetime.now(pytz.UTC)
+    table = TableCounter.__table__
+    counts = {}
+    for key, model in COUNTED.items():
+        name = model.__tablename__
+        # Counted on the primary: a lagging replica would bake its lag
+        # into the counters.
+        exact, base, slotted = db.session.execute(
+            select(select(func.count()).select_from(model)
+                   .scalar_subquery(),
+                   select(table.c.count).where(table.c.name == name)
+                   .scalar_subquery(),
+                   select(func.coalesce(func.sum(CounterSlot.count), 0))
+                   .where(CounterSlot.name == name).scalar_subquery()),
+            bind_arguments={'bind': db.engine}).one()
+        # the difference goes to the base row, which writers never lock
+        if base is None:
+            db.session.add(TableCounter(name=name, count=exact - slotted,
+                                        reconciled_at=now))
+        else:
+            db.session.execute(
+                update(table).where(table.c.name == name)
+                .values(count=table.c.count + (exact - base - slotted),
+                        reconciled_at=now))
+        counts[key] = exact
+    db.session.commit()
+    return counts
+
+
+def get_counts():
+    """ Return the dashboard counts from the counter tables in one query.
+
+    The counters are created by the first call on a database that has
+    none; afterwards only ``flask reconcile-counters`` recomputes them,
+    so dashboard requests never run COUNT(*).
+
+    Returns:
+        dict: Dashboard key -> row count.
+    """
+    rows = get_versions(_COUNTED_TABLES)
+    if any(model.__tablename__ not in rows for model in COUNTED.values()):
+        with _reconcile_lock:
+            return reconcile_counters()
+    return {key: rows[model.__tablename__][1]
+            for key, model in COUNTED.items()}
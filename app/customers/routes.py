@@ -1,33 +1,48 @@
 
-from flask import render_template, Response, jsonify
+from flask import render_template, jsonify
 from flask import render_template, request
 from flask_security import roles_accepted
 from app.customers import bp
-import io
-import csv
-import json
-from app.import_export.export_customer import export_customer_json
+from app.import_export.export_customer import CUSTOMER_EXPORT_COLUMNS
+from app.import_export.stream_export import (EXPORT_FORMATS,
+                                             export_filter,
+                                             export_response,
+                                             negotiate_encoding)
 from app.models.customer import Customer, get_customer
+from app.pagination import paginate_keyset
+from app.fragments import json_table_page, render_table_page
+from app.routing import read_only
 
 
 @bp.route('/', methods=['GET'])
 @roles_accepted('admin', 'editor', 'supervisor')
+@read_only
 def index():
-    """ Display the list of customers.
+    """ Display one page of the list of customers.
 
     Methods:
-        GET: Retrieve and display all customer records, ordered by date
-          in descending order.
+        GET: Retrieve and display a page of customer records, ordered by
+          date in descending order. ``cursor`` and ``per_page`` select
+          the page and ``format=json`` returns it as JSON.
 
     Returns:
-        Template: Render the customers/index.html template with customer data.
+        Template or JSON response: Render the customers/index.html
+        template with customer data, or the page as JSON.
     """
-    customers = Customer.query.order_by(Customer.date.desc()).all()
-    return render_template('customers/index.html', customers=customers)
+    def load_page():
+        return paginate_keyset(Customer.query, [(Customer.date, True),
+                                                (Customer.id, True)])
+
+    if request.args.get('format') == 'json':
+        return json_table_page(['customers'], load_page)
+    return render_table_page('customers/index.html',
+                             'customers/_table.html', ['customers'],
+                             load_page, 'customers')
 
 
 @bp.route('/search_customer/', methods=['GET', 'POST'])
 @roles_accepted('admin', 'editor', 'supervisor')
+@read_only
 def search_customer():
     """ Search for customers based on a search string.
 
@@ -47,33 +62,30 @@ def search_customer():
 
 @bp.route('/download_customers')
 @roles_accepted('admin')
+@read_only
 def download_customers():
-    """ Download customer data in the specified format (CSV or JSON).
+    """ Download customer data as CSV, NDJSON, JSON, Parquet or Arrow.
 
     Methods:
-        GET: Retrieve customer data and export it in the specified format.
+        GET: Stream customer data in the specified format, limited to the
+        ``start``/``end`` date range and to the rows above ``since_id``
+        or dated after ``since`` when given. The body is compressed with
+        zstd or gzip as Accept-Encoding allows (always gzip with
+        ``gzip=1``), and an unchanged export answers 304 to
+        If-None-Match or If-Modified-Since.
 
     Returns:
-        Response: A response containing the customer data file for download.
+        Response: A streamed response containing the customer data file
+        for download.
     """
     format = request.args.get('format')
-    customers_dict = export_customer_json()
-
-    if format == 'csv':
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(customers_dict[0].keys())
-        for row in customers_dict:
-            writer.writerow(row.values())
-        output.seek(0)
-        response = Response(output, mimetype='test/csv')
-        response.headers['Content-Disposition'] = 'attachment; \
-            filename=customers.csv'
-    elif format == 'json':
-        json_data = json.dumps(customers_dict, indent=4)
-        response = Response(json_data, mimetype='application/json')
-        response.headers['Content-Disposition'] = 'attachment; \
-            filename=customers.json'
-    else:
+    if format not in EXPORT_FORMATS:
         return jsonify("Invalid format"), 400
-    return response
+    try:
+        where = export_filter(Customer.id, Customer.date, request.args)
+    except ValueError:
+        return jsonify("Invalid export range"), 400
+    return export_response(CUSTOMER_EXPORT_COLUMNS, 'customers', format, where,
+                           date_column=Customer.date,
+                           encoding=negotiate_encoding(
+                               request.args.get('gzip') == '1'))
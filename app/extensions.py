@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
+from app.routing import RoutingSession
 
 
 bcrypt = Bcrypt() 
 login_manager = LoginManager()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
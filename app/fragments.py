@@ -0,0 +1,148 @@
+"""Cached table fragments and ETags for the list pages
+
+The sales, products, customers and users pages render their table (rows
+and pagination links) from a fragment template. The rendered fragment is
+cached under the fragment template, the request arguments (cursor,
+per_page) and the versions of the tables it shows, which every write
+transaction increments in the table counters (see ``app.counters``). A
+write therefore never has to find and delete cached pages: the next
+request reads the new versions and misses. Stale entries age out of the
+LRU store.
+
+The store is private to the process, or shared by the worker processes
+of a host through a SQLite file when FRAGMENT_CACHE_PATH is set. The
+versions live in the database, so every process sees a write at once.
+
+The page is also sent with an ETag derived from the same versions, the
+viewer's roles (which decide the buttons around the table) and the
+deployed templates; a browser revalidating an unchanged page gets an
+empty 304 without any row being read or rendered. The JSON pages
+(``format=json``) are conditional in the same way.
+"""
+import hashlib
+import json
+import os
+from flask import jsonify, make_response, render_template, request
+from flask_security import current_user
+from markupsafe import Markup
+from app.counters import get_versions
+from app.lookups import MemoryLookupStore, SQLiteLookupStore
+
+
+_store = MemoryLookupStore()
+_templates_digest = ''
+
+
+def _digest_templates(folder):
+    """Fingerprint the template files by name, size and mtime."""
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f'{root}/{name}:{stat.st_size}:'
+                          f'{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()
+
+
+def init_fragment_cache(app):
+    """ Create the fragment store described by the application config.
+
+    Parameters:
+        app: The Flask application.
+    """
+    global _store, _templates_digest
+    max_size = app.config['FRAGMENT_CACHE_SIZE']
+    ttl = app.config['FRAGMENT_CACHE_TTL']
+    path = app.config.get('FRAGMENT_CACHE_PATH')
+    if path:
+        _store = SQLiteLookupStore(path, max_size, ttl)
+    else:
+        _store = MemoryLookupStore(max_size, ttl)
+    _templates_digest = _digest_templates(
+        os.path.join(app.root_path, app.template_folder))
+
+
+def fragment_stats():
+    """ Return the counters of the fragment store.
+
+    Returns:
+        dict: The backend, size, hits, misses, hit rate, evictions,
+        expirations and invalidations.
+    """
+    return _store.stats()
+
+
+def _page_etag(versions, args):
+    """Hash what a list page depends on into its ETag."""
+    roles = sorted(role.name for role in current_user.roles)
+    return hashlib.sha1(json.dumps(
+        [_templates_digest, request.endpoint, versions, args, roles]
+    ).encode()).hexdigest()
+
+
+def _conditional(response, etag):
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def json_table_page(tables, load_page):
+    """ Return a list page as JSON, conditional on the table versions.
+
+    Parameters:
+        tables (list): The tables shown by the page.
+        load_page (callable): Returns the KeysetPage to show.
+
+    Returns:
+        Response: The page as JSON with its ETag, or an empty 304 response
+        when the client's copy is current.
+    """
+    versions = get_versions(tables)
+    if len(versions) < len(tables):
+        return jsonify(load_page().to_dict())
+    etag = _page_etag(tuple(sorted(versions.items())),
+                      tuple(sorted(request.args.items(multi=True))))
+    if etag in request.if_none_match:
+        return _conditional(make_response('', 304), etag)
+    return _conditional(jsonify(load_page().to_dict()), etag)
+
+
+def render_table_page(template, fragment, tables, load_page, name):
+    """ Render a list page whose table fragment is cached.
+
+    Parameters:
+        template (str): The page template; it outputs the rendered
+        fragment passed as ``table``.
+        fragment (str): The template of the table and its pagination.
+        tables (list): The tables shown by the fragment.
+        load_page (callable): Returns the KeysetPage to show.
+        name (str): The name of the page rows in the fragment template,
+        e.g. 'sales'.
+
+    Returns:
+        Response: The page with its ETag, or an empty 304 response when
+        the browser's copy is current.
+    """
+    versions = get_versions(tables)
+    if len(versions) < len(tables):
+        # no counters yet (reconciled on the dashboard): render uncached
+        page = load_page()
+        return render_template(template, table=Markup(render_template(
+            fragment, page=page, **{name: page.items})))
+    versions = tuple(sorted(versions.items()))
+    args = tuple(sorted(request.args.items(multi=True)))
+    etag = _page_etag(versions, args)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        key = (fragment, versions, args)
+        cached = _store.get_many([key]).get(key)
+        if cached is None:
+            page = load_page()
+            cached = (render_template(fragment, page=page,
+                                      **{name: page.items}),)
+            _store.set_many({key: cached})
+        response = make_response(render_template(template,
+                                                 table=Markup(cached[0])))
+    return _conditional(response, etag)
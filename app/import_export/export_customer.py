@@ -1,4 +1,10 @@
 from app.models.customer import Customer
+from app.import_export.stream_export import export_rows
+
+
+CUSTOMER_EXPORT_COLUMNS = [Customer.id, Customer.customer_name,
+                           Customer.customer_email, Customer.customer_phone,
+                           Customer.frequentcy_pay, Customer.date]
 
 
 def export_customer_json():
@@ -8,13 +14,4 @@ def export_customer_json():
     Returns:
         list: A list of dictionaries, each representing a customer record.
     """
-    customers = Customer.query.all()
-    customer_list = [{"id": customer.id,
-                      "customer_name": customer.customer_name,
-                      "customer_email": customer.customer_email,
-                      "customer_phone": customer.customer_phone,
-                      "frequentcy_pay": customer.frequentcy_pay,
-                      "date": customer.date.isoformat()
-                      } for customer in customers]
-
-    return customer_list
+    return export_rows(CUSTOMER_EXPORT_COLUMNS)
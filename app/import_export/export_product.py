@@ -1,4 +1,9 @@
 from app.models.product import Product
+from app.import_export.stream_export import export_rows
+
+
+PRODUCT_EXPORT_COLUMNS = [Product.id, Product.product_name, Product.price,
+                          Product.product_quantity, Product.date]
 
 
 def export_product_json():
@@ -8,12 +13,4 @@ def export_product_json():
     Returns:
         list: A list of dictionaries, each representing a product record.
     """
-    products = Product.query.all()
-    product_list = [{"id": product.id,
-                     "product_name": product.product_name,
-                     "price": product.price,
-                     "product_quantity": product.product_quantity,
-                     "date": product.date.isoformat()
-                     } for product in products]
-
-    return product_list
+    return export_rows(PRODUCT_EXPORT_COLUMNS)
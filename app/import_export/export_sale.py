@@ -1,4 +1,11 @@
 from app.models.sale import Sale
+from app.import_export.stream_export import export_rows
+
+
+SALE_EXPORT_COLUMNS = [Sale.id, Sale.product_name, Sale.product_quantity,
+                       Sale.customer_name, Sale.customer_email,
+                       Sale.customer_phone, Sale.user_name, Sale.product_id,
+                       Sale.customer_id, Sale.user_id, Sale.date]
 
 
 def export_sale_json():
@@ -7,15 +14,4 @@ def export_sale_json():
     Returns:
         list: A list of dictionaries, each representing a sale record.
     """
-    sales = Sale.query.all()
-    sale_list = [{"id": sale.id,
-                  "product_name": sale.product_name,
-                  "product_quantity": sale.product_quantity,
-                  "customer_name": sale.customer_name,
-                  "customer_email": sale.customer_email,
-                  "customer_phone": sale.customer_phone,
-                  "user_name": sale.user_name,
-                  "date": sale.date.isoformat()
-                  } for sale in sales]
-
-    return sale_list
+    return export_rows(SALE_EXPORT_COLUMNS)
@@ -1,137 +1,204 @@
 import json
-from flask import jsonify
-from app.models.sale import Sale
+from flask import jsonify, current_app
+from sqlalchemy import insert, update, bindparam
 from app.extensions import db
 from app.models.product import Product
-import pandas as pd
-from app.import_export.import_sale import validate_sales_csv_file
+from app.counters import adjust_counters
+from app.models.change import log_changes
+from app.lookups import invalidate_lookups, lookup_ids
+from app.import_export.validate import validate_frame
+from app.import_export.stream_reader import (ImportProgress,
+                                             iter_csv_batches,
+                                             iter_json_batches)
 
 
-def validate_products_json_file(data):
-    """ Validate the product data from a JSON file.
+def validate_products_json_file(data, first_row=1):
+    """ Validate a batch of product items from a JSON file.
 
     Parameters:
         data (list): A list of dictionaries containing product data.
+        first_row (int): The position of the first item in the file.
+
     Returns:
         tuple: A tuple containing a boolean indicating validation success,
-          and a JSON response if validation fails.
+          and a JSON response with the per-row error report if it fails.
     """
-    for item in data:
-        if 'product_name' not in item or\
-                'product_quantity' not in item or 'price' not in item:
-            return False, jsonify("missing columns")
-        if not isinstance(item['product_name'], str) or \
-            not isinstance(item['product_quantity'], int) or \
-                not isinstance(item['price'], int):
-            return False, jsonify("data type error")
+    import pandas as pd
+    report = validate_frame(pd.DataFrame.from_records(data), 'products',
+                            strict=True, first_row=first_row)
+    if report:
+        return False, jsonify(report)
     return True, None
 
 
-def parse_products_json_file(file_path):
-    """ Parse and import product data from a JSON file.
+def parse_products_json_file(file_path, progress=None):
+    """ Stream and import product data from a JSON array file in batches.
 
     Parameters:
         file_path (str): The path to the JSON file.
+        progress (ImportProgress): Optional progress tracker updated
+        after every committed batch.
 
     Returns:
         JSON response: A JSON response indicating the result of the
         operation.
     """
+    progress = progress or ImportProgress()
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
     try:
-        with open(file_path) as file:
-            data = json.load(file)
+        for data in iter_json_batches(file_path, batch_size):
+            first_row = progress.rows_read + 1
+            progress.batch_read(len(data))
+            stat, mesg = validate_products_json_file(data, first_row)
+            if not stat:
+                return mesg
+            stat, mesg = import_products_bulk(data)
+            if not stat:
+                return mesg
+            progress.batch_committed(len(data))
     except json.JSONDecodeError as e:
         return jsonify({"error": f"JSONDecodeError:{e.msg} at line {e.lineno} column {e.colno} (char {e.pos})"})
-    stat, mesg = validate_products_json_file(data)
-    if not stat:
-        return mesg
-    for item in data:
-        prod = Product.query.filter_by(
-            product_name=item['product_name']).first()
-        if prod:
-            prod.product_quantity += item['product_quantity']
-            prod.price = item['price']
-            try:
-                db.session.commit()
-            except:
-                return jsonify({"error": 'There was an issue \
-                                updating product quantity'})
-        else:
-            product = Product(product_name=item['product_name'],
-                              product_quantity=item['product_quantity'],
-                              price=item['price'])
-            try:
-                db.session.add(product)
-                db.session.commit()
-            except:
-                return jsonify({"error": "database error"})
-    return jsonify({"message": "Products added successfully"})
-
-
-def validate_products_csv_file(inspector, table, csvData):
-    """ Validate the product data from a CSV file.
+    return jsonify({"message": "Products added successfully",
+                    **progress.as_dict()})
+
+
+def validate_products_csv_file(inspector, table, csvData, first_row=1):
+    """ Validate a batch of product rows from a CSV file.
 
     Parameters:
         inspector: Database inspector object.
         table (str): The name of the database table.
         csvData (DataFrame): A pandas DataFrame containing CSV data.
+        first_row (int): The file row number of the first row.
 
     Returns:
         tuple: A tuple containing a boolean indicating validation success,
-        and a JSON response if validation fails.
+        and a JSON response with the per-row error report if it fails.
     """
-    columns = inspector.get_columns(table)
-    db_columns = {col['name']:
-                  str(col['type']) for col in columns if col['name'] != 'id'
-                  and col['name'] != 'date'}
-    missing_columns = [col for col in db_columns if col
-                       not in csvData.columns]
-    if missing_columns:
-        return False, jsonify({"missing columns": missing_columns})
-    try:
-        csvData['product_quantity'].apply(int)
-    except ValueError:
-        return False, jsonify({"incorrect data type": f"data type of product_quantity is Integer put fount {type(csvData['product_quantity'].iloc[0]).__name__}"})
-    try:
-        csvData['price'].apply(int)
-    except ValueError:
-        return False, jsonify({"incorrect data type": f"data type of price is Integer put fount {type(csvData['price'].iloc[0]).__name__}"})
+    report = validate_frame(csvData, table, inspector, first_row=first_row)
+    if report:
+        return False, jsonify(report)
     return True, None
 
 
-def parse_products_csv_file(inspector, file_path):
-    """ Parse and import product data from a CSV file.
+def parse_products_csv_file(inspector, file_path, progress=None):
+    """ Stream and import product data from a CSV file in batches.
 
     Parameters:
         inspector: Database inspector object.
         file_path (str): The path to the CSV file.
+        progress (ImportProgress): Optional progress tracker updated
+        after every committed batch.
 
     Returns:
         JSON response: A JSON response indicating the result of the
         operation.
     """
-    csvData = pd.read_csv(file_path)
-    stat, mesg = validate_sales_csv_file(inspector, 'product', csvData)
-    if not stat:
-        return mesg
-    for i, row in csvData.iterrows():
-        prod = Product.query.filter_by(
-            product_name=row['product_name']).first()
-        if prod:
-            prod.product_quantity += row['product_quantity']
-            prod.price = row['price']
-            try:
-                db.session.commit()
-            except:
-                return jsonify({"error": 'There was an issue updating \
-                                product quantity'})
-        else:
-            product = Product(product_name=row['product_name'],
-                              product_quantity=row['product_quantity'],
-                              price=row['price'])
-            try:
-                db.session.add(product)
-                db.session.commit()
-            except:
-                return jsonify({"error": "database error"})
-    return jsonify({"message": "Products added successfully"})
+    progress = progress or ImportProgress()
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    for csvData in iter_csv_batches(file_path, batch_size):
+        first_row = progress.rows_read + 1
+        progress.batch_read(len(csvData))
+        stat, mesg = validate_products_csv_file(inspector, 'products',
+                                                csvData, first_row)
+        if not stat:
+            return mesg
+        records = csvData[['product_name', 'product_quantity', 'price']]
+        stat, mesg = import_products_bulk(records.to_dict('records'))
+        if not stat:
+            return mesg
+        progress.batch_committed(len(csvData))
+    return jsonify({"message": "Products added successfully",
+                    **progress.as_dict()})
+
+
+def parse_products_columnar_file(file_path, progress=None):
+    """ Stream and import product data from a Parquet or Arrow IPC file.
+
+    Parameters:
+        file_path (str): The path to the .parquet or .arrow file.
+        progress (ImportProgress): Optional progress tracker updated
+        after every committed batch.
+
+    Returns:
+        JSON response: A JSON response indicating the result of the
+        operation.
+    """
+    from app.import_export.columnar import iter_columnar_frames
+    progress = progress or ImportProgress()
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    for frame in iter_columnar_frames(file_path, batch_size):
+        first_row = progress.rows_read + 1
+        progress.batch_read(len(frame))
+        stat, mesg = validate_products_csv_file(None, 'products', frame,
+                                                first_row)
+        if not stat:
+            return mesg
+        records = frame[['product_name', 'product_quantity', 'price']]
+        stat, mesg = import_products_bulk(records.to_dict('records'))
+        if not stat:
+            return mesg
+        progress.batch_committed(len(frame))
+    return jsonify({"message": "Products added successfully",
+                    **progress.as_dict()})
+
+
+def import_products_bulk(items):
+    """ Add or restock a batch of products in one transaction.
+
+    Rows are aggregated per product name (quantities summed, the last
+    price wins), existing products are resolved through the lookup cache
+    and updated with one executemany statement, and the rest are inserted
+    in bulk. The cached prices of the restocked products are invalidated
+    on commit.
+
+    Parameters:
+        items (list): Dictionaries with product_name, product_quantity
+        and price keys.
+
+    Returns:
+        tuple: A tuple containing a boolean indicating import success,
+        and a JSON response if the import fails.
+    """
+    batch = {}
+    for item in items:
+        name = item['product_name']
+        quantity, _ = batch.get(name, (0, None))
+        batch[name] = (quantity + int(item['product_quantity']),
+                       int(item['price']))
+    existing = lookup_ids('product', batch)
+
+    restocks = [{'b_id': existing[name], 'b_quantity': quantity,
+                 'b_price': price}
+                for name, (quantity, price) in batch.items()
+                if name in existing]
+    new_products = [{'product_name': name, 'product_quantity': quantity,
+                     'price': price}
+                    for name, (quantity, price) in batch.items()
+                    if name not in existing]
+    table = Product.__table__
+    try:
+        if restocks:
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('b_id'))
+                .values(product_quantity=table.c.product_quantity
+                        + bindparam('b_quantity'),
+                        price=bindparam('b_price')),
+                restocks)
+            invalidate_lookups('product', [name for name in batch
+                                           if name in existing])
+        if new_products:
+            db.session.execute(insert(Product), new_products)
+        adjust_counters(db.session, {'products': len(new_products)})
+        log_changes(db.session, 'update', 'products',
+                    [item['b_id'] for item in restocks],
+                    ['product_quantity', 'price'])
+        log_changes(db.session, 'insert', 'products', lookup_ids(
+            'product', [item['product_name']
+                        for item in new_products]).values())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        return False, jsonify({"error": "database error"})
+    return True, None
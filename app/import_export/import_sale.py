@@ -1,121 +1,345 @@
 import json
-from flask import jsonify
+from datetime import datetime
+import pytz
+from flask import jsonify, current_app
+from sqlalchemy import insert, update, bindparam, select, text
 from app.models.sale import Sale
 from app.extensions import db
 from app.models.product import Product
-from app.models.customer import add_customer
-import pandas as pd
-import numpy as np
-
-
-ALLOWED_EXTENSIONS = {'csv', 'json'}
-
-
-def allowed_file(filename):
-    return ('.' in filename and filename.rsplit('.', 1)[1].lower()
-            in ALLOWED_EXTENSIONS)
-
-
-def validate_sales_json_file(data):
-    for item in data:
-        if 'product_name' not in item or\
-         'product_quantity' not in item or\
-         'customer_name' not in item or\
-         'customer_email' not in item or\
-         'customer_phone' not in item or\
-         'user_name' not in item:
-            return False, jsonify("missing columns")
-        if (not isinstance(item['product_name'], str) or
-            not isinstance(item['product_quantity'], int) or
-            not isinstance(item['customer_name'], str) or
-            not isinstance(item['customer_email'], str) or
-            not isinstance(item['customer_phone'], str) or
-                not isinstance(item['user_name'], str)):
-            return False, jsonify("data type error")
+from app.models.customer import Customer
+from app.lookups import lookup_ids, lookup_rows
+from app.counters import adjust_counters
+from app.models.change import log_changes
+from app.rollups import apply_sales
+from app.import_export.validate import validate_frame
+from app.import_export.stream_reader import (ImportProgress,
+                                             iter_csv_batches,
+                                             iter_json_batches)
+
+
+SALE_COLUMNS = ['product_name', 'product_quantity', 'customer_name',
+                'customer_email', 'customer_phone', 'user_name']
+# engine -> whether multi-row inserts take consecutive ids
+_consecutive_ids = {}
+
+
+def validate_sales_json_file(data, first_row=1):
+    """ Validate a batch of sale items from a JSON file.
+
+    Parameters:
+        data (list): A list of dictionaries containing sale data.
+        first_row (int): The position of the first item in the file.
+
+    Returns:
+        tuple: A tuple containing a boolean indicating validation success,
+        and a JSON response with the per-row error report if it fails.
+    """
+    import pandas as pd
+    report = validate_frame(pd.DataFrame.from_records(data), 'sales',
+                            strict=True, first_row=first_row)
+    if report:
+        return False, jsonify(report)
     return True, None
 
 
-def parse_sales_json_file(file_path):
+def parse_sales_json_file(file_path, progress=None):
+    """ Stream and import sale data from a JSON array file in batches.
+
+    Parameters:
+        file_path (str): The path to the JSON file.
+        progress (ImportProgress): Optional progress tracker updated
+        after every committed batch.
+
+    Returns:
+        JSON response: A JSON response indicating the result of the
+        operation.
+    """
+    import pandas as pd
+    progress = progress or ImportProgress()
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
     try:
-        with open(file_path) as file:
-            data = json.load(file)
+        for data in iter_json_batches(file_path, batch_size):
+            first_row = progress.rows_read + 1
+            progress.batch_read(len(data))
+            stat, mesg = validate_sales_json_file(data, first_row)
+            if not stat:
+                return mesg
+            stat, mesg = import_sales_bulk(pd.DataFrame(data,
+                                                        columns=SALE_COLUMNS))
+            if not stat:
+                return mesg
+            progress.batch_committed(len(data))
     except json.JSONDecodeError as e:
         return jsonify({"error": f"JSONDecodeError: {e.msg} at line {e.lineno} column {e.colno}(char {e.pos})"})
-    stat, mesg = validate_sales_json_file(data)
-    if not stat:
-        return mesg
-    for item in data:
-        prod = Product.query.filter_by(product_name=item['product_name']
-                                       ).first()
-        if prod:
-            if prod.product_quantity < int(item['product_quantity']):
-                return jsonify({"error": 'Not enough quantity'})
-            else:
-                prod.product_quantity -= int(item['product_quantity'])
-                try:
-                    db.session.commit()
-                except:
-                    return jsonify({"error": 'There was an issue updating\
-                                    the product quantity'})
-        else:
-            return jsonify({"error": 'Product not found'})
-
-        sale = Sale(product_name=item['product_name'],
-                    product_quantity=item['product_quantity'],
-                    customer_name=item['customer_name'],
-                    customer_email=item['customer_email'],
-                    customer_phone=item['customer_phone'],
-                    user_name=item['user_name'])
-        db.session.add(sale)
-        db.session.commit()
-        add_customer(sale)
-    return jsonify({"message": "Sales added successfully"})
+    return jsonify({"message": "Sales added successfully",
+                    **progress.as_dict()})
 
 
-def validate_sales_csv_file(inspector, table, csvData):
-    columns = inspector.get_columns(table)
-    db_columns = {col['name']: str(col['type']) for col in
-                  columns if col['name'] != 'id' and col['name'] != 'date'}
-    missing_columns = [col for col in db_columns if col not in csvData.columns]
-    if missing_columns:
-        return False, jsonify({"missing columns": missing_columns})
-    try:
-        csvData['product_quantity'].apply(int)
-    except ValueError:
-        return False, jsonify({"incorrect data type": f"data type of product_quantity is Integer put fount {type(csvData['product_quantity'].iloc[0]).__name__}"})
+def validate_sales_csv_file(inspector, table, csvData, first_row=1):
+    """ Validate a batch of sale rows from a CSV file.
+
+    Parameters:
+        inspector: Database inspector object.
+        table (str): The name of the database table.
+        csvData (DataFrame): A pandas DataFrame containing CSV data.
+        first_row (int): The file row number of the first row.
+
+    Returns:
+        tuple: A tuple containing a boolean indicating validation success,
+        and a JSON response with the per-row error report if it fails.
+    """
+    report = validate_frame(csvData, table, inspector, first_row=first_row)
+    if report:
+        return False, jsonify(report)
     return True, None
 
 
-def parse_sales_csv_file(inspector, file_path):
-    csvData = pd.read_csv(file_path)
-    stat, mesg = validate_sales_csv_file(inspector, 'sales', csvData)
-    if not stat:
-        return mesg
-    for i, row in csvData.iterrows():
-        prod = Product.query.filter_by(product_name=row['product_name']
-                                       ).first()
-        if prod:
-            if prod.product_quantity < int(row['product_quantity']):
-                return jsonify({"error": 'Not enough quantity'})
-            else:
-                prod.product_quantity -= int(row['product_quantity'])
-                try:
-                    db.session.commit()
-                except:
-                    return jsonify({"error": 'There was an issue updating\
-                                    product quantity'})
-        else:
-            return jsonify({"error": 'Product not found'})
-        sale = Sale(product_name=row['product_name'],
-                    product_quantity=row['product_quantity'],
-                    customer_name=row['customer_name'],
-                    customer_email=row['customer_email'],
-                    customer_phone=row['customer_phone'],
-                    user_name=row['user_name'])
-        try:
-            db.session.add(sale)
-            db.session.commit()
-            add_customer(sale)
-        except:
-            return jsonify({"error": "database error"})
-    return jsonify({"message": "Sales added successfully"})
+def parse_sales_csv_file(inspector, file_path, progress=None):
+    """ Stream and import sale data from a CSV file in batches.
+
+    Parameters:
+        inspector: Database inspector object.
+        file_path (str): The path to the CSV file.
+        progress (ImportProgress): Optional progress tracker updated
+        after every committed batch.
+
+    Returns:
+        JSON response: A JSON response indicating the result of the
+        operation.
+    """
+    progress = progress or ImportProgress()
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    for csvData in iter_csv_batches(file_path, batch_size,
+                                    dtype={'customer_phone': str}):
+        first_row = progress.rows_read + 1
+        progress.batch_read(len(csvData))
+        stat, mesg = validate_sales_csv_file(inspector, 'sales', csvData,
+                                             first_row)
+        if not stat:
+            return mesg
+        stat, mesg = import_sales_bulk(csvData)
+        if not stat:
+            return mesg
+        progress.batch_committed(len(csvData))
+    return jsonify({"message": "Sales added successfully",
+                    **progress.as_dict()})
+
+
+def parse_sales_columnar_file(file_path, progress=None):
+    """ Stream and import sale data from a Parquet or Arrow IPC file.
+
+    Parameters:
+        file_path (str): The path to the .parquet or .arrow file.
+        progress (ImportProgress): Optional progress tracker updated
+        after every committed batch.
+
+    Returns:
+        JSON response: A JSON response indicating the result of the
+        operation.
+    """
+    from app.import_export.columnar import iter_columnar_frames
+    progress = progress or ImportProgress()
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    for frame in iter_columnar_frames(file_path, batch_size):
+        first_row = progress.rows_read + 1
+        progress.batch_read(len(frame))
+        stat, mesg = validate_sales_csv_file(None, 'sales', frame,
+                                             first_row)
+        if not stat:
+            return mesg
+        stat, mesg = import_sales_bulk(frame)
+        if not stat:
+            return mesg
+        progress.batch_committed(len(frame))
+    return jsonify({"message": "Sales added successfully",
+                    **progress.as_dict()})
+
+
+def _normalize_sales(records):
+    """ Coerce a frame of sale rows to the column types of the sales table.
+
+    Parameters:
+        records (DataFrame): The raw sale rows.
+
+    Returns:
+        DataFrame: A copy holding only the sale columns, with integer
+        quantities and string (or None) customer phones.
+    """
+    import numpy as np
+    frame = records[SALE_COLUMNS].copy()
+    frame['product_quantity'] = frame['product_quantity'].astype(np.int64)
+    for col in ('product_name', 'customer_name', 'customer_email',
+                'user_name'):
+        frame[col] = frame[col].astype(str)
+    phones = frame['customer_phone']
+    frame['customer_phone'] = phones.astype(str).where(phones.notna(), None)
+    return frame
+
+
+def _reserve_batch(stock_updates):
+    """ Decrement the stock of every product in a batch, never below zero.
+
+    Each product gets one conditional ``UPDATE ... WHERE product_quantity
+    >= :quantity``; the batch is reserved only if every statement matched,
+    so a concurrent sale that took the stock first makes the import fail
+    instead of overselling.
+
+    Parameters:
+        stock_updates (list): Dictionaries with b_id and b_quantity keys.
+
+    Returns:
+        bool: True if all products were reserved.
+    """
+    table = Product.__table__
+    statement = (update(table)
+                 .where(table.c.id == bindparam('b_id'),
+                        table.c.product_quantity >= bindparam('b_quantity'))
+                 .values(product_quantity=table.c.product_quantity
+                         - bindparam('b_quantity')))
+    if db.engine.dialect.supports_sane_multi_rowcount:
+        reserved = db.session.execute(statement, stock_updates).rowcount
+    else:
+        reserved = sum(db.session.execute(statement, params).rowcount
+                       for params in stock_updates)
+    return reserved == len(stock_updates)
+
+
+def _has_consecutive_ids():
+    """ Return whether one multi-row insert takes consecutive ids.
+
+    Only MySQL with innodb_autoinc_lock_mode 0 or 1 guarantees it; the
+    default of MySQL 8 (2) interleaves concurrent inserts. Read once per
+    engine.
+    """
+    engine = db.engine
+    if engine not in _consecutive_ids:
+        mode = None
+        if engine.dialect.name == 'mysql':
+            mode = db.session.scalar(
+                text('SELECT @@innodb_autoinc_lock_mode'))
+        _consecutive_ids[engine] = mode is not None and int(mode) <= 1
+    return _consecutive_ids[engine]
+
+
+def _insert_sales(rows):
+    """ Insert sale rows and return their ids, with one statement where
+    possible.
+
+    Without RETURNING (MySQL) the ids follow the first id of a multi-row
+    insert when they are consecutive, and otherwise come from row by row
+    inserts; they are never read back from the table, which may hold a
+    concurrent import's sales.
+
+    Parameters:
+        rows (list): The sale rows as dictionaries.
+
+    Returns:
+        list: The ids of the inserted sales.
+    """
+    if db.engine.dialect.insert_executemany_returning:
+        return list(db.session.scalars(insert(Sale).returning(Sale.id),
+                                       rows))
+    if _has_consecutive_ids():
+        first = db.session.execute(insert(Sale).values(rows)).lastrowid
+        return list(range(first, first + len(rows)))
+    return [db.session.execute(insert(Sale), row).inserted_primary_key[0]
+            for row in rows]
+
+
+def import_sales_bulk(records):
+    """ Import a batch of sales in one transaction with set-based writes.
+
+    Products, customers and users are resolved to ids through the lookup
+    cache (the unit prices are read from the reserved products), stock
+    decrements are aggregated per product and reserved with one
+    conditional update each, and sales and customer payment frequencies
+    are written with executemany statements and committed together with
+    the sales rollups and the change log.
+    Nothing is written if any row fails the checks or a concurrent sale
+    took the stock first.
+
+    Parameters:
+        records (DataFrame): Sale rows holding at least the sales table
+        columns.
+
+    Returns:
+        tuple: A tuple containing a boolean indicating import success,
+        and a JSON response if the import fails.
+    """
+    if records.empty:
+        return True, None
+    sales = _normalize_sales(records)
+
+    demand = sales.groupby('product_name', sort=False)[
+        'product_quantity'].sum()
+    products = lookup_rows('product', demand.index)
+    if len(products) != len(demand):
+        return False, jsonify({"error": 'Product not found'})
+    stock_updates = [{'b_id': products[name][0],
+                      'b_quantity': int(quantity)}
+                     for name, quantity in demand.items()]
+
+    customers = sales.groupby('customer_email', sort=False).agg(
+        customer_name=('customer_name', 'first'),
+        customer_phone=('customer_phone', 'first'),
+        frequentcy_pay=('customer_email', 'size'))
+    existing = lookup_ids('customer', customers.index)
+    is_existing = customers.index.isin(list(existing))
+    customer_updates = [
+        {'b_id': existing[email], 'b_count': int(count)}
+        for email, count in customers.loc[is_existing,
+                                          'frequentcy_pay'].items()]
+    new_customers = (customers.loc[~is_existing].reset_index()
+                     .to_dict('records'))
+    user_ids = lookup_ids('user', sales['user_name'].unique())
+
+    customers_table = Customer.__table__
+    try:
+        if not _reserve_batch(stock_updates):
+            db.session.rollback()
+            return False, jsonify({"error": 'Not enough quantity'})
+        # the cache only resolves ids: the price is read live, after the
+        # reservation locked the rows, like the ORM path's before_flush
+        prices = dict(db.session.execute(
+            select(Product.id, Product.price).where(Product.id.in_(
+                [item['b_id'] for item in stock_updates]))).all())
+        if customer_updates:
+            db.session.execute(
+                update(customers_table)
+                .where(customers_table.c.id == bindparam('b_id'))
+                .values(frequentcy_pay=customers_table.c.frequentcy_pay
+                        + bindparam('b_count')),
+                customer_updates)
+        if new_customers:
+            db.session.execute(insert(Customer), new_customers)
+            existing.update(lookup_ids(
+                'customer',
+                [customer['customer_email'] for customer in new_customers]))
+        rows = sales.to_dict('records')
+        now = datetime.now(pytz.UTC)
+        for row in rows:
+            row['product_id'] = products[row['product_name']][0]
+            row['unit_price'] = prices.get(row['product_id'])
+            row['customer_id'] = existing.get(row['customer_email'])
+            row['user_id'] = user_ids.get(row['user_name'])
+            row['date'] = now
+        sale_ids = _insert_sales(rows)
+        adjust_counters(db.session, {'sales': len(sales),
+                                     'customers': len(new_customers),
+                                     'products': 0})
+        apply_sales(db.session, rows)
+        log_changes(db.session, 'update', 'products',
+                    [item['b_id'] for item in stock_updates],
+                    ['product_quantity'])
+        log_changes(db.session, 'update', 'customers',
+                    [item['b_id'] for item in customer_updates],
+                    ['frequentcy_pay'])
+        log_changes(db.session, 'insert', 'customers',
+                    [existing[customer['customer_email']]
+                     for customer in new_customers])
+        log_changes(db.session, 'insert', 'sales', sale_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        return False, jsonify({"error": "database error"})
+    return True, None
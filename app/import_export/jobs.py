@@ -0,0 +1,293 @@
+"""Background import jobs run on a local worker pool
+
+The parsers, and pandas and NumPy with them, are imported by the first
+job rather than when the routes are loaded, so workers that never receive
+an upload do not pay for them.
+
+The pool lives in the process that received the upload, so its jobs die
+with it. Each job records that process as its owner, and the process
+refreshes the updated_at of its queued and running jobs every
+IMPORT_HEARTBEAT_SECONDS, however long they wait or a batch takes. Every
+upload first fails the unfinished jobs of other processes that were not
+refreshed for IMPORT_STALE_SECONDS: their owner is gone. A worker only
+starts a job that is still queued, and a failed job is never moved to
+another state, so a job failed that way stays failed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import socket
+import threading
+import time
+import pytz
+from flask import current_app
+from sqlalchemy import func, inspect, or_, select, update
+from app.extensions import db
+from app.models.import_job import ImportJob
+from app.import_export.stream_reader import ImportProgress
+
+
+ALLOWED_EXTENSIONS = {'csv', 'json', 'parquet', 'arrow'}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def allowed_file(filename):
+    return ('.' in filename and filename.rsplit('.', 1)[1].lower()
+            in ALLOWED_EXTENSIONS)
+
+
+def get_executor(app):
+    """ Return the process-wide import worker pool, creating it on first use.
+
+    Parameters:
+        app: The Flask application whose IMPORT_WORKERS sizes the pool.
+
+    Returns:
+        ThreadPoolExecutor: The shared worker pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config['IMPORT_WORKERS'],
+                thread_name_prefix='import')
+            threading.Thread(target=_heartbeat, args=(app, worker_id()),
+                             name='import-heartbeat', daemon=True).start()
+    return _executor
+
+
+def worker_id():
+    """Return the owner recorded on the jobs this process queues."""
+    # read on every call: a pre-forking server copies the module
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _heartbeat(app, owner):
+    """ Refresh the updated_at of the unfinished jobs of this process
+    for as long as it lives.
+
+    Parameters:
+        app: The Flask application.
+        owner (str): The worker id of this process.
+    """
+    while True:
+        time.sleep(app.config['IMPORT_HEARTBEAT_SECONDS'])
+        with app.app_context():
+            try:
+                db.session.execute(
+                    update(ImportJob)
+                    .where(ImportJob.owner == owner,
+                           ImportJob.state.in_(('queued', 'running')))
+                    .values(updated_at=datetime.now(pytz.UTC)))
+                db.session.commit()
+            except Exception:
+                # the next beat retries; a missed one is not fatal
+                db.session.rollback()
+
+
+def _remove_upload(file_path):
+    """Delete an uploaded file once its job is over."""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def fail_stale_jobs():
+    """ Fail the queued and running jobs whose process died, and delete
+    their files.
+
+    A job's process is gone when it stopped refreshing the job; the jobs
+    of the calling process are never failed.
+
+    Returns:
+        int: The number of jobs failed.
+    """
+    now = datetime.now(pytz.UTC)
+    cutoff = now.replace(tzinfo=None) - timedelta(
+        seconds=current_app.config['IMPORT_STALE_SECONDS'])
+    is_stale = (ImportJob.state.in_(('queued', 'running')),
+                or_(ImportJob.owner.is_(None),
+                    ImportJob.owner != worker_id()),
+                func.coalesce(ImportJob.updated_at, ImportJob.date) < cutoff)
+    stale = db.session.execute(
+        select(ImportJob.id, ImportJob.file_path, ImportJob.rows_read,
+               ImportJob.rows_committed).where(*is_stale)).all()
+    failed = 0
+    for job_id, file_path, rows_read, rows_committed in stale:
+        # the job may have moved on since it was read
+        if db.session.execute(
+                update(ImportJob).where(ImportJob.id == job_id, *is_stale)
+                .values(state='failed', finished_at=now, updated_at=now,
+                        message=f'Import interrupted: {rows_committed} of '
+                                f'{rows_read} rows read were committed'
+                )).rowcount:
+            failed += 1
+            _remove_upload(file_path)
+    db.session.commit()
+    return failed
+
+
+def submit_import(kind, file_path, file_name):
+    """ Queue an uploaded file for import and return immediately.
+
+    Parameters:
+        kind (str): 'sales' or 'products'.
+        file_path (str): Where the uploaded file was saved.
+        file_name (str): The original name of the uploaded file.
+
+    Returns:
+        ImportJob: The queued job.
+    """
+    fail_stale_jobs()
+    job = ImportJob(kind=kind, file_path=file_path, file_name=file_name,
+                    state='queued', owner=worker_id())
+    db.session.add(job)
+    db.session.commit()
+    app = current_app._get_current_object()
+    get_executor(app).submit(run_import, app, job.id)
+    return job
+
+
+def _set_job(job_id, **values):
+    """ Update and commit the columns of a job row, and its updated_at.
+
+    A failed job is left as it is. The message is cut to the length of
+    its column.
+
+    Parameters:
+        job_id (int): The job to update.
+        values: Column values to set.
+
+    Returns:
+        bool: False if the job had failed already.
+    """
+    if values.get('message') is not None:
+        values['message'] = values['message'][:ImportJob.message.type.length]
+    updated = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job_id, ImportJob.state != 'failed')
+        .values(updated_at=datetime.now(pytz.UTC), **values)).rowcount
+    db.session.commit()
+    return bool(updated)
+
+
+def _parse(kind, file_path, progress):
+    """ Run the streaming parser matching the job kind and file extension.
+
+    Parameters:
+        kind (str): 'sales' or 'products'.
+        file_path (str): The path to the uploaded file.
+        progress (ImportProgress): Tracker updated after every batch.
+
+    Returns:
+        JSON response: The parser's result.
+    """
+    from app.import_export.import_sale import (parse_sales_csv_file,
+                                               parse_sales_json_file,
+                                               parse_sales_columnar_file)
+    from app.import_export.import_product import (
+        parse_products_csv_file, parse_products_json_file,
+        parse_products_columnar_file)
+    extention = file_path.rsplit('.', 1)[1].lower()
+    if extention == 'json':
+        parser = (parse_sales_json_file if kind == 'sales'
+                  else parse_products_json_file)
+        return parser(file_path, progress)
+    if extention in ('parquet', 'arrow'):
+        parser = (parse_sales_columnar_file if kind == 'sales'
+                  else parse_products_columnar_file)
+        return parser(file_path, progress)
+    parser = (parse_sales_csv_file if kind == 'sales'
+              else parse_products_csv_file)
+    return parser(inspect(db.engine), file_path, progress)
+
+
+def run_import(app, job_id):
+    """ Execute a queued import job inside its own application context.
+
+    Progress is committed to the job row after every batch; the final
+    state, message and errors are recorded when the parser returns. The
+    uploaded file is deleted when the job is over, whatever its outcome.
+
+    Parameters:
+        app: The Flask application.
+        job_id (int): The job to run.
+    """
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        kind, file_path = job.kind, job.file_path
+        now = datetime.now(pytz.UTC)
+        started = db.session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == job_id, ImportJob.state == 'queued')
+            .values(state='running', started_at=now, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        if not started:
+            # failed as stale while it waited in the queue
+            return
+        try:
+            _run_parser(job_id, kind, file_path)
+        finally:
+            _remove_upload(file_path)
+
+
+def _run_parser(job_id, kind, file_path):
+    """ Parse a running job's file and record the outcome on its row.
+
+    Every batch commits on its own, so a failed import keeps the batches
+    committed before the failing one; its message says how many rows
+    that is.
+
+    Parameters:
+        job_id (int): The job.
+        kind (str): 'sales' or 'products'.
+        file_path (str): The path to the uploaded file.
+    """
+    def report(progress):
+        _set_job(job_id, rows_read=progress.rows_read,
+                 rows_committed=progress.rows_committed)
+
+    progress = ImportProgress(report)
+    try:
+        result = _parse(kind, file_path, progress).get_json()
+    except Exception as e:
+        db.session.rollback()
+        result = {"error": f"{type(e).__name__}: {e}"}
+    failed = not isinstance(result, dict) or 'message' not in result
+    if not failed:
+        errors = []
+        message = result['message']
+    elif isinstance(result, dict) and 'errors' in result:
+        errors = result['errors']
+        message = result.get('error')
+    else:
+        errors = result if isinstance(result, list) else [result]
+        message = None
+    counts = (f'{progress.rows_committed} of {progress.rows_read} rows '
+              'read were committed')
+    if failed:
+        # the counts go first, so cutting a long message keeps them
+        message = f'Import failed, {counts}' + (f': {message}'
+                                                if message else '')
+    try:
+        _set_job(job_id, state='failed' if failed else 'succeeded',
+                 rows_read=progress.rows_read,
+                 rows_committed=progress.rows_committed,
+                 message=message, errors=json.dumps(errors),
+                 finished_at=datetime.now(pytz.UTC))
+    except Exception as e:
+        # e.g. an error report too long for its column: the job must not
+        # stay running, so it fails without the report
+        db.session.rollback()
+        current_app.logger.exception('import job %s: result not recorded',
+                                     job_id)
+        _set_job(job_id, state='failed',
+                 rows_read=progress.rows_read,
+                 rows_committed=progress.rows_committed,
+                 message=f'Import failed, {counts}: result not recorded '
+                         f'({type(e).__name__})',
+                 finished_at=datetime.now(pytz.UTC))
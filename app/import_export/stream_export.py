@@ -0,0 +1,340 @@
+"""Streaming CSV, NDJSON and JSON exports with constant memory
+
+Rows are read with ``yield_per`` (server-side cursors where the driver
+supports them) as plain column tuples, never ORM objects, and every batch
+is encoded and sent before the next one is fetched.
+
+Exports are conditional and incremental. Before any row is read, one
+query finds the watermark of the export (its highest id and newest
+date), and the table counter gives the table's version and last write.
+These make the ETag and Last-Modified validators, so a puller whose copy
+is current gets an empty 304. The export stops at the watermark, which
+is sent as X-Export-Last-Id; passing it back as ``since_id`` (or a date
+as ``since``) fetches only the newer rows. The body is compressed with
+zstd (when the optional ``zstandard`` package is installed) or gzip,
+whichever the client accepts. X-Change-Seq is where a replica loaded from
+the export starts following the /changes feed (see ``app.change_log``).
+"""
+import csv
+import hashlib
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+import pytz
+from flask import Response, current_app, request, stream_with_context
+from sqlalchemy import and_, func, select
+from app.change_log import change_seq
+from app.counters import get_table_state
+from app.extensions import db
+
+
+EXPORT_MIMETYPES = {'csv': 'text/csv',
+                    'ndjson': 'application/x-ndjson',
+                    'json': 'application/json'}
+COLUMNAR_FORMATS = {'parquet', 'arrow'}
+EXPORT_FORMATS = set(EXPORT_MIMETYPES) | COLUMNAR_FORMATS
+
+
+def _plain(value):
+    """Return ``value`` as a CSV/JSON friendly scalar."""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def date_range_filter(column, start=None, end=None):
+    """ Build a filter restricting an export to a date range.
+
+    Parameters:
+        column: The DateTime column to filter on.
+        start (str): ISO date or datetime of the first included row.
+        end (str): ISO date (whole day included) or datetime of the last
+        included row.
+
+    Returns:
+        ClauseElement: The filter, or None when neither bound is given.
+
+    Raises:
+        ValueError: If a bound is not an ISO date or datetime.
+    """
+    clauses = []
+    if start:
+        clauses.append(column >= datetime.fromisoformat(start))
+    if end:
+        bound = datetime.fromisoformat(end)
+        if len(end) == 10:
+            clauses.append(column < bound + timedelta(days=1))
+        else:
+            clauses.append(column <= bound)
+    return and_(*clauses) if clauses else None
+
+
+def export_filter(id_column, date_column, args):
+    """ Build the filter of an export from its request arguments.
+
+    ``start`` and ``end`` restrict it to a date range (see
+    ``date_range_filter``), ``since_id`` to the rows above an id and
+    ``since`` to the rows dated after an ISO date or datetime. Rows are
+    dated when inserted, so neither picks up later updates; replicas
+    follow /changes for those.
+
+    Parameters:
+        id_column: The primary key column.
+        date_column: The DateTime column of the rows.
+        args: The request arguments.
+
+    Returns:
+        ClauseElement: The filter, or None when no argument is given.
+
+    Raises:
+        ValueError: If an argument is malformed.
+    """
+    clauses = []
+    date_range = date_range_filter(date_column, args.get('start'),
+                                   args.get('end'))
+    if date_range is not None:
+        clauses.append(date_range)
+    if args.get('since_id'):
+        clauses.append(id_column > int(args['since_id']))
+    if args.get('since'):
+        clauses.append(date_column > datetime.fromisoformat(args['since']))
+    return and_(*clauses) if clauses else None
+
+
+def iter_export_batches(columns, where=None, batch_size=None):
+    """ Stream the rows of a table as lists of tuples, ordered by id.
+
+    Parameters:
+        columns (list): The model columns to export; the first one must
+        be the primary key.
+        where: An optional filter clause.
+        batch_size (int): Rows per batch; EXPORT_BATCH_SIZE when None.
+
+    Returns:
+        generator: Lists of row tuples.
+    """
+    batch_size = batch_size or current_app.config['EXPORT_BATCH_SIZE']
+    statement = select(*columns).order_by(columns[0])
+    if where is not None:
+        statement = statement.where(where)
+    result = db.session.execute(
+        statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield partition
+
+
+def export_rows(columns, where=None):
+    """ Return every exported row as a dictionary.
+
+    Parameters:
+        columns (list): The model columns to export.
+        where: An optional filter clause.
+
+    Returns:
+        list: One dictionary per row, keyed by column name.
+    """
+    names = [column.key for column in columns]
+    return [dict(zip(names, map(_plain, row)))
+            for batch in iter_export_batches(columns, where)
+            for row in batch]
+
+
+def _csv_chunks(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_plain(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(names, batches):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(zip(names, map(_plain, row)))) + '\n'
+                      for row in batch)
+
+
+def _json_chunks(names, batches):
+    yield '['
+    separator = '\n'
+    for batch in batches:
+        chunk = ',\n'.join(json.dumps(dict(zip(names, map(_plain, row))))
+                           for row in batch)
+        if chunk:
+            yield separator + chunk
+            separator = ',\n'
+    yield '\n]\n'
+
+
+_ENCODERS = {'csv': _csv_chunks, 'ndjson': _ndjson_chunks,
+             'json': _json_chunks}
+
+
+def gzip_chunks(chunks):
+    """ Gzip a stream of text chunks incrementally.
+
+    Parameters:
+        chunks (iterable): The text chunks to compress.
+
+    Returns:
+        generator: Compressed byte chunks.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _zstandard():
+    """Return the optional zstandard module, or None."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def zstd_chunks(chunks):
+    """ Compress a stream of text chunks incrementally with zstd.
+
+    Parameters:
+        chunks (iterable): The text chunks to compress.
+
+    Returns:
+        generator: Compressed byte chunks.
+    """
+    compressor = _zstandard().ZstdCompressor(level=3).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+_COMPRESSORS = {'zstd': zstd_chunks, 'gzip': gzip_chunks}
+
+
+def negotiate_encoding(force_gzip=False):
+    """ Pick the content encoding of an export from Accept-Encoding.
+
+    Parameters:
+        force_gzip (bool): Gzip even when the client did not ask for it
+        (the ``gzip=1`` argument).
+
+    Returns:
+        str: 'zstd', 'gzip' or None for an uncompressed body.
+    """
+    if force_gzip:
+        return 'gzip'
+    offered = ['zstd', 'gzip'] if _zstandard() else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def _as_utc(value):
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=pytz.UTC)
+
+
+def export_validators(columns, where, date_column):
+    """ Read the watermark and the validators of an export.
+
+    Parameters:
+        columns (list): The exported model columns, the primary key first.
+        where: The export filter, or None.
+        date_column: The DateTime column of the rows.
+
+    Returns:
+        tuple: (last id, ETag, Last-Modified); the id is None when no row
+        matches and the date is None when nothing is known about it.
+    """
+    # one aggregate per statement, so each can be read off its index
+    last_id, last_date = (
+        db.session.scalar(select(func.max(column)).where(
+            *([where] if where is not None else [])))
+        for column in (columns[0], date_column))
+    version, changed_at = get_table_state(columns[0].table.name)
+    etag = hashlib.sha1(json.dumps(
+        [request.path, sorted(request.args.items(multi=True)), version,
+         last_id, last_date], default=str).encode()).hexdigest()
+    dates = [_as_utc(value) for value in (last_date, changed_at)
+             if value is not None]
+    return last_id, etag, max(dates) if dates else None
+
+
+def _not_modified(etag, last_modified):
+    """Whether the client's copy matches the validators (RFC 9110)."""
+    if request.if_none_match:
+        return etag in request.if_none_match
+    since = request.if_modified_since
+    return (since is not None and last_modified is not None
+            and last_modified.replace(microsecond=0) <= since)
+
+
+def export_response(columns, name, format, where=None, date_column=None,
+                    encoding=None):
+    """ Build a conditional streaming download response for a table export.
+
+    Parameters:
+        columns (list): The model columns to export; the first one must
+        be the primary key.
+        name (str): The base name of the downloaded file.
+        format (str): 'csv', 'ndjson', 'json', 'parquet' or 'arrow'.
+        where: An optional filter clause.
+        date_column: The DateTime column of the rows, for the watermark.
+        encoding (str): 'zstd' or 'gzip' to compress the body (see
+        ``negotiate_encoding``); ignored for the columnar formats, which
+        are compressed internally.
+
+    Returns:
+        Response: An empty 304 when the client's copy is current,
+        otherwise a chunked response whose first bytes are sent before
+        the table has been read.
+    """
+    if format in COLUMNAR_FORMATS:
+        encoding = None
+    # read before the watermark: the changes after it cover every write
+    # the export misses
+    seq = change_seq()
+    last_id, etag, last_modified = export_validators(columns, where,
+                                                     date_column)
+    # the same rows compressed differently are another representation
+    etag = f'{etag}-{encoding}' if encoding else etag
+    if _not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        if last_id is not None:
+            bound = columns[0] <= last_id
+            where = bound if where is None else and_(where, bound)
+        if format in COLUMNAR_FORMATS:
+            from app.import_export.columnar import columnar_response
+            response = columnar_response(columns, name, format, where)
+        else:
+            names = [column.key for column in columns]
+            chunks = _ENCODERS[format](names,
+                                       iter_export_batches(columns, where))
+            if encoding:
+                chunks = _COMPRESSORS[encoding](chunks)
+            response = Response(stream_with_context(chunks),
+                                mimetype=EXPORT_MIMETYPES[format])
+            response.headers['Content-Disposition'] = (
+                f'attachment; filename={name}.{format}')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.headers['X-Change-Seq'] = str(seq)
+    response.set_etag(etag)
+    # a change within the current second could not move Last-Modified
+    if (last_modified is not None and datetime.now(pytz.UTC)
+            - last_modified >= timedelta(seconds=1)):
+        response.last_modified = last_modified
+    if last_id is not None or request.args.get('since_id'):
+        response.headers['X-Export-Last-Id'] = str(
+            last_id if last_id is not None else request.args['since_id'])
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    return response
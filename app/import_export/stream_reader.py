@@ -0,0 +1,191 @@
+"""Bounded-memory readers that stream uploaded files in fixed-size batches"""
+import json
+
+
+READ_SIZE = 64 * 1024
+MAX_ITEM_SIZE = 4 * 1024 * 1024
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789+-.eE'
+
+
+class ImportProgress:
+    """ Running totals for a streamed import.
+
+    Attributes:
+        rows_read (Integer): Rows parsed from the file so far.
+        rows_committed (Integer): Rows written and committed so far.
+        callback (callable): Optional ``callback(progress)`` invoked after
+        every batch.
+    """
+
+    def __init__(self, callback=None):
+        self.rows_read = 0
+        self.rows_committed = 0
+        self.callback = callback
+
+    def batch_read(self, count):
+        """Record ``count`` rows parsed from the file."""
+        self.rows_read += count
+
+    def batch_committed(self, count):
+        """Record ``count`` rows committed and notify the callback."""
+        self.rows_committed += count
+        if self.callback:
+            self.callback(self)
+
+    def as_dict(self):
+        """Return the totals as a JSON-compatible dictionary."""
+        return {"rows_read": self.rows_read,
+                "rows_committed": self.rows_committed}
+
+
+def iter_csv_batches(file_path, batch_size, dtype=None):
+    """ Stream a CSV file as DataFrames of at most ``batch_size`` rows.
+
+    Parameters:
+        file_path (str): The path to the CSV file.
+        batch_size (int): The number of rows per batch.
+        dtype (dict): Optional column dtypes passed to ``read_csv``.
+
+    Returns:
+        generator: DataFrames holding consecutive rows of the file.
+    """
+    import pandas as pd
+    with pd.read_csv(file_path, dtype=dtype, chunksize=batch_size) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def _decode_error(msg, consumed, buffer, pos):
+    """ Build a JSONDecodeError positioned relative to the whole file.
+
+    Parameters:
+        msg (str): The error message.
+        consumed (tuple): (chars, lines, column) already dropped from the
+        buffer.
+        buffer (str): The text currently buffered.
+        pos (int): The error offset within ``buffer``.
+
+    Returns:
+        JSONDecodeError: The error with file-wide pos, lineno and colno.
+    """
+    chars, lines, column = consumed
+    error = json.JSONDecodeError(msg, buffer, pos)
+    newlines = buffer.count('\n', 0, pos)
+    error.pos = chars + pos
+    error.lineno = lines + newlines
+    if newlines:
+        error.colno = pos - buffer.rindex('\n', 0, pos)
+    else:
+        error.colno = column + pos
+    return error
+
+
+def iter_json_batches(file_path, batch_size, read_size=READ_SIZE,
+                      max_item_size=MAX_ITEM_SIZE):
+    """ Stream the items of a top-level JSON array in fixed-size batches.
+
+    The file is read ``read_size`` characters at a time and each array
+    element is decoded as soon as it is complete, so memory is bounded by
+    the batch size and the largest single element, not the file size.
+
+    Parameters:
+        file_path (str): The path to the JSON file.
+        batch_size (int): The number of items per batch.
+        read_size (int): The number of characters read per file access.
+        max_item_size (int): The longest text a single element may span
+        before a decode error is reported instead of reading further.
+
+    Returns:
+        generator: Lists holding consecutive items of the array.
+
+    Raises:
+        JSONDecodeError: If the file is not a well-formed JSON array or
+        has anything but whitespace after it, with its position in the
+        whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path) as file:
+        buffer = ''
+        pos = 0
+        eof = False
+        # (chars, lines, column) of the text already dropped from buffer
+        consumed = (0, 1, 1)
+
+        def fill():
+            nonlocal buffer, pos, eof, consumed
+            chars, lines, column = consumed
+            dropped = buffer[:pos]
+            newlines = dropped.count('\n')
+            if newlines:
+                column = len(dropped) - dropped.rindex('\n')
+            else:
+                column += len(dropped)
+            consumed = (chars + len(dropped), lines + newlines, column)
+            data = file.read(read_size)
+            buffer = buffer[pos:] + data
+            pos = 0
+            eof = not data
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        def next_char():
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise _decode_error("Expecting ']'", consumed, buffer, pos)
+            return buffer[pos]
+
+        def decode_item():
+            nonlocal pos
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if eof or len(buffer) - pos > max_item_size:
+                        raise _decode_error(e.msg, consumed, buffer, e.pos)
+                    fill()
+                    continue
+                if (not eof and isinstance(item, (int, float))
+                        and not buffer[end:].lstrip(_NUMBER_CHARS)):
+                    # A number may continue past the end of the buffer.
+                    fill()
+                    continue
+                pos = end
+                return item
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != '[':
+            raise _decode_error("Expecting '['", consumed, buffer, pos)
+        pos += 1
+        batch = []
+        if next_char() != ']':
+            while True:
+                batch.append(decode_item())
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+                char = next_char()
+                if char == ']':
+                    break
+                if char != ',':
+                    raise _decode_error("Expecting ',' delimiter", consumed,
+                                        buffer, pos)
+                pos += 1
+                if next_char() == ']':
+                    raise _decode_error("Expecting value", consumed,
+                                        buffer, pos)
+        pos += 1
+        # like json.load, only whitespace may follow the array; checked
+        # before the last batch is handed out
+        skip_whitespace()
+        if pos < len(buffer):
+            raise _decode_error("Extra data", consumed, buffer, pos)
+        if batch:
+            yield batch
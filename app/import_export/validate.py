@@ -0,0 +1,152 @@
+"""Vectorized validation of uploaded rows against the database schema"""
+import threading
+from sqlalchemy import inspect
+from sqlalchemy.types import Integer, String
+from app.extensions import db
+
+
+# Cap on the per-row errors returned for one batch; the total is still
+# counted so the report stays small for badly broken files.
+MAX_REPORTED_ERRORS = 1000
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+PHONE_PATTERN = r'^\+?[0-9][0-9 ().-]*$'
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def get_table_schema(table, inspector=None):
+    """ Return the upload-relevant columns of a table, cached per process.
+
+    Parameters:
+        table (str): The name of the database table.
+        inspector: Optional database inspector; one is created from
+        ``db.engine`` on a cache miss otherwise.
+
+    Returns:
+        dict: column name -> (SQLAlchemy type, nullable) for every column
+        except the primary key and the server-filled ``date``.
+    """
+    bind = inspector.bind if inspector is not None else db.engine
+    key = (str(bind.url), table)
+    schema = _schemas.get(key)
+    if schema is None:
+        inspector = inspector if inspector is not None else inspect(bind)
+        schema = {col['name']: (col['type'], col['nullable'])
+                  for col in inspector.get_columns(table)
+                  if col['name'] not in ('id', 'date')}
+        with _schemas_lock:
+            _schemas[key] = schema
+    return schema
+
+
+def required_columns(schema):
+    """ Return the columns every uploaded row must provide.
+
+    Parameters:
+        schema (dict): The result of ``get_table_schema``.
+
+    Returns:
+        list: The non-nullable column names.
+    """
+    return [name for name, (_, nullable) in schema.items() if not nullable]
+
+
+def _integer_mask(values, strict):
+    """ Flag the values that are not integers.
+
+    Parameters:
+        values (Series): The column to check.
+        strict (bool): Require real integers (JSON) instead of anything
+        that parses as a whole number (CSV text).
+
+    Returns:
+        ndarray: True where the value is not an integer.
+    """
+    import numpy as np
+    import pandas as pd
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return np.zeros(len(values), dtype=bool)
+    if pd.api.types.is_float_dtype(values.dtype):
+        # pandas widens integer columns that contain nulls to float
+        return (values % 1 != 0).to_numpy()
+    if strict:
+        kinds = values.map(type)
+        return ~kinds.isin([int, np.int64]).to_numpy()
+    numbers = pd.to_numeric(values, errors='coerce')
+    return (numbers.isna() | (numbers % 1 != 0)).to_numpy()
+
+
+def validate_frame(frame, table, inspector=None, strict=False, first_row=1):
+    """ Validate a batch of uploaded rows with column-wise operations.
+
+    Every column is checked at once for nulls in non-nullable columns,
+    integer types, string lengths and email/phone formats, and every
+    failing cell is reported instead of stopping at the first one.
+
+    Parameters:
+        frame (DataFrame): The rows to validate.
+        table (str): The name of the database table the rows target.
+        inspector: Optional database inspector.
+        strict (bool): Require native JSON types instead of parsing text.
+        first_row (int): The file row number of the first row in
+        ``frame``.
+
+    Returns:
+        dict: An error report, or None if the batch is valid.
+    """
+    import numpy as np
+    schema = get_table_schema(table, inspector)
+    missing_columns = [col for col in required_columns(schema)
+                       if col not in frame.columns]
+    if missing_columns:
+        return {"missing columns": missing_columns}
+
+    rows = np.arange(first_row, first_row + len(frame))
+    errors = []
+    error_count = 0
+    for name, (col_type, nullable) in schema.items():
+        if name not in frame.columns:
+            continue
+        values = frame[name]
+        nulls = values.isna().to_numpy()
+        checks = []
+        if not nullable:
+            checks.append((nulls, 'missing value'))
+        present = values[~nulls]
+        if isinstance(col_type, Integer):
+            bad = np.zeros(len(values), dtype=bool)
+            bad[~nulls] = _integer_mask(present, strict)
+            checks.append((bad, 'expected an integer'))
+        elif isinstance(col_type, String):
+            bad = np.zeros(len(values), dtype=bool)
+            if strict:
+                bad[~nulls] = ~present.map(type).isin([str]).to_numpy()
+                checks.append((bad, 'expected a string'))
+            text = present.astype(str)
+            if col_type.length:
+                too_long = np.zeros(len(values), dtype=bool)
+                too_long[~nulls] = (text.str.len() > col_type.length
+                                    ).to_numpy()
+                checks.append((too_long,
+                               f'longer than {col_type.length} characters'))
+            pattern = None
+            if name.endswith('email'):
+                pattern, label = EMAIL_PATTERN, 'invalid email address'
+            elif name.endswith('phone'):
+                pattern, label = PHONE_PATTERN, 'invalid phone number'
+            if pattern:
+                malformed = np.zeros(len(values), dtype=bool)
+                malformed[~nulls] = ~text.str.match(pattern).to_numpy()
+                checks.append((malformed, label))
+        for mask, message in checks:
+            failing = rows[mask]
+            error_count += len(failing)
+            room = MAX_REPORTED_ERRORS - len(errors)
+            errors.extend({"row": int(row), "column": name,
+                           "error": message} for row in failing[:room])
+    if not error_count:
+        return None
+    errors.sort(key=lambda error: error['row'])
+    return {"error": "validation failed", "error_count": error_count,
+            "errors": errors}
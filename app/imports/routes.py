@@ -0,0 +1,38 @@
+from flask import jsonify, request
+from flask_security import roles_accepted
+from app.imports import bp
+from app.extensions import db
+from app.models.import_job import ImportJob
+
+
+@bp.route('/', methods=['GET'])
+@roles_accepted('admin', 'editor')
+def index():
+    """ List the most recent import jobs.
+
+    Methods:
+        GET: Retrieve the latest jobs, newest first. The optional
+        ``limit`` argument caps the number of jobs (default 50).
+
+    Returns:
+        JSON response: A list of job status dictionaries.
+    """
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    jobs = ImportJob.query.order_by(ImportJob.id.desc()).limit(limit).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+
+@bp.route('/<int:id>', methods=['GET'])
+@roles_accepted('admin', 'editor')
+def job_status(id):
+    """ Display the status of a single import job.
+
+    Methods:
+        GET: Retrieve the state, rows processed, throughput and errors
+        of a specific job.
+
+    Returns:
+        JSON response: The job status dictionary.
+    """
+    job = db.get_or_404(ImportJob, id)
+    return jsonify(job.to_dict())
@@ -0,0 +1,395 @@
+"""Per-request timings, slow-query logging and Prometheus metrics
+
+``init_instrumentation`` hooks the SQLAlchemy cursor events of every
+engine and the Flask request and template signals. For each request it
+records the wall time, the time spent in the database, the number of
+queries, the rows they returned or wrote and the template render time.
+The totals are added to a ``Server-Timing`` response header and to the
+process metrics served at ``/metrics`` in the Prometheus text format.
+
+Queries slower than SLOW_QUERY_MS are logged with their EXPLAIN plan once
+the response is ready, and a statement repeated N_PLUS_ONE_THRESHOLD
+times in one request is logged as a probable N+1 query. An admin sending
+``X-Profile: 1`` gets the request run under cProfile, with the stats
+dumped to PROFILE_DIR and the file named in ``X-Profile-File``.
+"""
+import cProfile
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import (Response, current_app, g, has_request_context, request,
+                   request_finished, request_started, template_rendered,
+                   before_render_template)
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+
+# Upper bounds, in seconds, of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+
+
+class RequestStats:
+    """ Measurements of one request.
+
+    Attributes:
+        started (float): perf_counter() when the request started.
+        db_seconds (float): Time spent executing statements.
+        queries (int): Statements executed.
+        rows (int): ORM rows loaded plus rows written.
+        template_seconds (float): Time spent rendering templates.
+        statements (Counter): Executions per SQL text, for N+1 detection.
+        slow (list): (engine, statement, parameters, seconds) of the slow
+        queries.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+        self.slow = []
+        self.profiler = None
+
+
+def _number(value):
+    """Format a sample value without losing precision."""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metrics:
+    """ Thread-safe counters and histograms rendered in the Prometheus
+    text exposition format.
+
+    Methods:
+        inc(name, labels, value): Add to a counter.
+        observe(name, labels, value): Record a histogram sample.
+        render(gauges): Return the exposition text.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._counters[(name, tuple(labels))] += value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            key = (name, tuple(labels))
+            buckets = self._histograms.setdefault(
+                key, [[0] * len(DURATION_BUCKETS), 0, 0.0])
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[0][index] += 1
+            buckets[1] += 1
+            buckets[2] += value
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = ('{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                                    .replace('"', '\\"'))
+                   for key, value in pairs)
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self, gauges=()):
+        """ Return the metrics in the Prometheus text format.
+
+        Parameters:
+            gauges (iterable): (name, labels, value) of point-in-time
+            values to append.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name not in seen and name in self._help:
+                kind, text = self._help[name]
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+            seen.add(name)
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f'{name}{self._labels(labels)} {_number(value)}')
+        for (name, labels), (buckets, count, total) in histograms:
+            header(name)
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'{name}_bucket'
+                             f'{self._labels(labels, [("le", bound)])} '
+                             f'{bucket}')
+            lines.append(f'{name}_bucket'
+                         f'{self._labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{self._labels(labels)} '
+                         f'{_number(total)}')
+            lines.append(f'{name}_count{self._labels(labels)} {count}')
+        for name, labels, value in gauges:
+            header(name)
+            if value is not None:
+                lines.append(f'{name}{self._labels(labels)} '
+                             f'{_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('crm_http_requests_total', 'counter',
+                 'Requests served, by endpoint, method and status.')
+metrics.describe('crm_http_request_duration_seconds', 'histogram',
+                 'Wall time of the requests, by endpoint.')
+metrics.describe('crm_db_queries_total', 'counter',
+                 'Statements executed by requests, by endpoint.')
+metrics.describe('crm_db_query_seconds_total', 'counter',
+                 'Time requests spent executing statements, by endpoint.')
+metrics.describe('crm_db_rows_total', 'counter',
+                 'ORM rows loaded plus rows written, by endpoint.')
+metrics.describe('crm_template_render_seconds_total', 'counter',
+                 'Time spent rendering templates, by endpoint.')
+metrics.describe('crm_db_slow_queries_total', 'counter',
+                 'Statements slower than SLOW_QUERY_MS, by endpoint.')
+metrics.describe('crm_db_repeated_queries_total', 'counter',
+                 'Probable N+1 statements detected, by endpoint.')
+metrics.describe('crm_db_pool_checked_out', 'gauge',
+                 'Connections checked out of the pool, by engine.')
+metrics.describe('crm_db_pool_overflow', 'gauge',
+                 'Overflow connections in use, by engine.')
+metrics.describe('crm_db_pool_wait_seconds_total', 'counter',
+                 'Time spent waiting for a pooled connection, by engine.')
+metrics.describe('crm_lookup_cache_hits_total', 'counter',
+                 'Lookup cache hits.')
+metrics.describe('crm_lookup_cache_misses_total', 'counter',
+                 'Lookup cache misses.')
+metrics.describe('crm_lookup_cache_evictions_total', 'counter',
+                 'Lookup cache entries evicted by the size bound.')
+
+
+def _stats():
+    """Return the stats of the current request, or None outside one."""
+    if not has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _stats() is not None:
+        conn.info.setdefault('query_started', []).append(
+            time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = _stats()
+    started = conn.info.get('query_started')
+    if stats is None or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats.db_seconds += elapsed
+    stats.queries += 1
+    stats.statements[statement] += 1
+    if not statement.lstrip().lower().startswith(('select', 'with')):
+        stats.rows += max(cursor.rowcount, 0)
+    slow_ms = current_app.config['SLOW_QUERY_MS']
+    if slow_ms is not None and elapsed * 1000 >= slow_ms and not executemany:
+        stats.slow.append((conn.engine, statement, parameters, elapsed))
+
+
+def _count_loaded_row(target, context):
+    stats = _stats()
+    if stats is not None:
+        stats.rows += 1
+
+
+def _explain(engine, statement, parameters):
+    """ Return the plan of a raw SELECT as text, or None for other
+    statements.
+
+    Parameters:
+        engine: The engine the statement ran on.
+        statement (str): The SQL text sent to the driver.
+        parameters: The driver parameters of the statement.
+
+    Returns:
+        str: One plan step per line.
+    """
+    if not statement.lstrip().lower().startswith('select'):
+        return None
+    prefix = ('EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite'
+              else 'EXPLAIN ')
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + statement,
+                                          parameters).all()
+    if engine.dialect.name == 'sqlite':
+        return '\n'.join(str(row[-1]) for row in rows)
+    return '\n'.join(str(dict(row._mapping)) for row in rows)
+
+
+def _request_started(app, **extra):
+    g.request_stats = stats = RequestStats()
+    if (request.headers.get('X-Profile') == '1' and _is_admin()):
+        stats.profiler = cProfile.Profile()
+        stats.profiler.enable()
+
+
+def _is_admin():
+    from flask_login import current_user
+    try:
+        return current_user.is_authenticated and current_user.has_role(
+            'admin')
+    except Exception:
+        return False
+
+
+def _before_render(app, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        g.template_started = time.perf_counter()
+
+
+def _template_rendered(app, template, context, **extra):
+    stats = _stats()
+    started = g.pop('template_started', None)
+    if stats is not None and started is not None:
+        stats.template_seconds += time.perf_counter() - started
+
+
+def _request_finished(app, response, **extra):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        response.headers['X-Profile-File'] = _dump_profile(app,
+                                                           stats.profiler)
+    elapsed = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+    labels = [('endpoint', endpoint)]
+    metrics.inc('crm_http_requests_total',
+                labels + [('method', request.method),
+                          ('status', response.status_code)])
+    metrics.observe('crm_http_request_duration_seconds', labels, elapsed)
+    metrics.inc('crm_db_queries_total', labels, stats.queries)
+    metrics.inc('crm_db_query_seconds_total', labels, stats.db_seconds)
+    metrics.inc('crm_db_rows_total', labels, stats.rows)
+    metrics.inc('crm_template_render_seconds_total', labels,
+                stats.template_seconds)
+    response.headers['Server-Timing'] = ', '.join([
+        f'app;dur={elapsed * 1000:.1f}',
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} '
+        f'queries, {stats.rows} rows"',
+        f'tpl;dur={stats.template_seconds * 1000:.1f}'])
+
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    for statement, count in stats.statements.items():
+        if threshold and count >= threshold:
+            metrics.inc('crm_db_repeated_queries_total', labels)
+            app.logger.warning('Probable N+1 in %s: %d executions of %s',
+                               endpoint, count, statement)
+    for engine, statement, parameters, seconds in stats.slow:
+        metrics.inc('crm_db_slow_queries_total', labels)
+        try:
+            plan = _explain(engine, statement, parameters)
+        except Exception as error:
+            plan = f'EXPLAIN failed: {error}'
+        app.logger.warning('Slow query in %s (%.1f ms): %s\n%s', endpoint,
+                           seconds * 1000, statement, plan)
+
+
+def _dump_profile(app, profiler):
+    """ Write the stats of a profiled request to PROFILE_DIR.
+
+    Returns:
+        str: The path of the .prof file, readable with pstats or
+        snakeviz.
+    """
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    name = '{}-{}.prof'.format(time.strftime('%Y%m%d-%H%M%S'),
+                               (request.endpoint or 'unmatched')
+                               .replace('.', '_'))
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path)
+    return path
+
+
+def _gauges():
+    """Collect the pool and lookup cache values for /metrics."""
+    from app.extensions import db
+    from app.lookups import lookup_stats
+    from app.pool_metrics import pool_stats
+    gauges = []
+    for engine, stats in pool_stats(db.engines).items():
+        labels = [('engine', engine)]
+        gauges.append(('crm_db_pool_checked_out', labels,
+                       stats['checked_out']))
+        gauges.append(('crm_db_pool_overflow', labels, stats['overflow']))
+        gauges.append(('crm_db_pool_wait_seconds_total', labels,
+                       stats['wait_seconds']))
+    lookups = lookup_stats()
+    gauges.append(('crm_lookup_cache_hits_total', [], lookups['hits']))
+    gauges.append(('crm_lookup_cache_misses_total', [], lookups['misses']))
+    gauges.append(('crm_lookup_cache_evictions_total', [],
+                   lookups['evictions']))
+    return gauges
+
+
+def metrics_view():
+    """ Serve the process metrics in the Prometheus text format.
+
+    Methods:
+        GET: Requires ``Authorization: Bearer <METRICS_TOKEN>`` when
+        METRICS_TOKEN is set. Refused when it is unset and
+        METRICS_REQUIRE_TOKEN is on (the production profile).
+
+    Returns:
+        Response: The exposition text, 401 or 403.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token and current_app.config.get('METRICS_REQUIRE_TOKEN'):
+        return Response('METRICS_TOKEN is not set\n', status=403,
+                        mimetype='text/plain')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('unauthorized\n', status=401,
+                        mimetype='text/plain')
+    return Response(metrics.render(_gauges()),
+                    mimetype='text/plain; version=0.0.4')
+
+
+def init_instrumentation(app, engines):
+    """ Start instrumenting the requests and engines of ``app``.
+
+    Parameters:
+        app: The Flask application.
+        engines (dict): bind key -> engine, as returned by ``db.engines``.
+    """
+    if not app.config['INSTRUMENTATION']:
+        return
+    for engine in engines.values():
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    if not event.contains(Mapper, 'load', _count_loaded_row):
+        event.listen(Mapper, 'load', _count_loaded_row)
+    request_started.connect(_request_started, app)
+    request_finished.connect(_request_finished, app)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_template_rendered, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,418 @@
+"""Process-wide cache for the name -> row lookups of the sale paths
+
+Sales, imports and forms name products, customers and users, while the
+tables reference them by id. Model modules declare their lookups with
+``register_lookup`` (e.g. product name -> id and price) and callers
+resolve batches with ``lookup_rows`` / ``lookup_ids``, which query only
+the misses, in chunks.
+
+Answers live in a bounded LRU store whose entries expire after
+LOOKUP_CACHE_TTL seconds. By default the store is private to the process;
+setting LOOKUP_CACHE_PATH shares one SQLite-backed store between all the
+worker processes of a host. The cache is kept consistent by the session
+events: ids read inside a transaction are only published when it commits,
+and only if no invalidation happened since they were read; rows renamed,
+repriced or deleted by a flush are invalidated when their transaction
+commits. The TTL bounds how long other writers (another host, a manual
+SQL update) can leave a stale entry.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from app.extensions import db
+
+
+LOOKUP_CHUNK_SIZE = 500
+
+# name -> (key column, cached columns); the id always comes first
+LOOKUPS = {}
+
+
+def register_lookup(name, column, *fields):
+    """ Declare a cached lookup.
+
+    Parameters:
+        name (str): The lookup name, e.g. 'product'.
+        column: The mapped column looked up, e.g. ``Product.product_name``.
+        *fields: Further columns cached with the id, e.g.
+        ``Product.price``.
+    """
+    LOOKUPS[name] = (column, (column.table.c.id, *fields))
+
+
+class MemoryLookupStore:
+    """ Bounded LRU store with a time to live, private to the process.
+
+    Methods:
+        get_many(keys): Return the live entries among ``keys``.
+        set_many(items): Add or refresh entries.
+        delete_many(keys): Invalidate entries.
+        clear(): Drop every entry.
+        stats(): Return the hit, miss and eviction counters.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._counters['misses'] += 1
+                elif entry[1] <= now:
+                    del self._entries[key]
+                    self._counters['misses'] += 1
+                    self._counters['expirations'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    found[key] = entry[0]
+        return found
+
+    def set_many(self, items):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+    def stats(self):
+        hits = self._counters['hits']
+        misses = self._counters['misses']
+        return {'backend': self.backend,
+                'size': self.size(),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 4)
+                if hits + misses else None,
+                'evictions': self._counters['evictions'],
+                'expirations': self._counters['expirations'],
+                'invalidations': self._counters['invalidations']}
+
+
+class SQLiteLookupStore(MemoryLookupStore):
+    """ LRU store with a time to live in a SQLite file, shared by every
+    process that opens the same path.
+
+    Entries are stored as JSON with their wall-clock expiry and last use;
+    the least recently used ones are deleted once the table holds more
+    than ``max_size`` rows. Counters are kept per process.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, max_size=10000, ttl=300):
+        super().__init__(max_size, ttl)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS lookup_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, used_at REAL NOT NULL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_lookup_cache_used_at '
+                'ON lookup_cache (used_at)')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _encode(key):
+        return json.dumps(key, separators=(',', ':'), default=str)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        encoded = {self._encode(key): key for key in keys}
+        now = time.time()
+        rows = []
+        connection = self._connect()
+        names = list(encoded)
+        for start in range(0, len(names), LOOKUP_CHUNK_SIZE):
+            chunk = names[start:start + LOOKUP_CHUNK_SIZE]
+            rows += connection.execute(
+                'SELECT key, value, expires_at FROM lookup_cache '
+                f'WHERE key IN ({",".join("?" * len(chunk))})',
+                chunk).fetchall()
+        found = {}
+        expired = []
+        for name, value, expires_at in rows:
+            if expires_at <= now:
+                expired.append(name)
+            else:
+                found[encoded[name]] = tuple(json.loads(value))
+        with connection:
+            if expired:
+                connection.executemany(
+                    'DELETE FROM lookup_cache WHERE key = ?',
+                    [(name,) for name in expired])
+            if found:
+                connection.executemany(
+                    'UPDATE lookup_cache SET used_at = ? WHERE key = ?',
+                    [(now, self._encode(key)) for key in found])
+        with self._lock:
+            self._counters['hits'] += len(found)
+            self._counters['misses'] += len(keys) - len(found)
+            self._counters['expirations'] += len(expired)
+        return found
+
+    def set_many(self, items):
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO lookup_cache '
+                '(key, value, expires_at, used_at) VALUES (?, ?, ?, ?)',
+                [(self._encode(key), json.dumps(list(value), default=str),
+                  now + self.ttl, now) for key, value in items.items()])
+            excess = (connection.execute(
+                'SELECT COUNT(*) FROM lookup_cache').fetchone()[0]
+                - self.max_size)
+            if excess > 0:
+                connection.execute(
+                    'DELETE FROM lookup_cache WHERE key IN (SELECT key '
+                    'FROM lookup_cache ORDER BY used_at LIMIT ?)',
+                    (excess,))
+                with self._lock:
+                    self._counters['evictions'] += excess
+
+    def delete_many(self, keys):
+        connection = self._connect()
+        with connection:
+            deleted = sum(connection.execute(
+                'DELETE FROM lookup_cache WHERE key = ?',
+                (self._encode(key),)).rowcount for key in keys)
+        with self._lock:
+            self._counters['invalidations'] += deleted
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM lookup_cache')
+
+    def size(self):
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM lookup_cache').fetchone()[0]
+
+
+_store = MemoryLookupStore()
+# bumped by every invalidation, so reads that raced one are not published
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def init_lookups(app):
+    """ Create the lookup store described by the application config.
+
+    Parameters:
+        app: The Flask application.
+    """
+    global _store
+    max_size = app.config['LOOKUP_CACHE_SIZE']
+    ttl = app.config['LOOKUP_CACHE_TTL']
+    path = app.config.get('LOOKUP_CACHE_PATH')
+    if path:
+        _store = SQLiteLookupStore(path, max_size, ttl)
+    else:
+        _store = MemoryLookupStore(max_size, ttl)
+
+
+def lookup_stats():
+    """ Return the counters of the lookup store.
+
+    Returns:
+        dict: The backend, size, hits, misses, hit rate, evictions,
+        expirations and invalidations.
+    """
+    return _store.stats()
+
+
+def clear_lookups():
+    """Drop every cached entry."""
+    _store.clear()
+
+
+def _pending(session):
+    return session.info.setdefault('pending_lookups', {})
+
+
+def _bump_generation():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def lookup_rows(name, keys):
+    """ Resolve values of a registered lookup column to their rows.
+
+    When several rows share a value (user names), the oldest row wins.
+
+    Parameters:
+        name (str): The registered lookup, e.g. 'product'.
+        keys (iterable): The values to resolve.
+
+    Returns:
+        dict: value -> (id, *cached fields), without the values that
+        match no row.
+    """
+    column, fields = LOOKUPS[name]
+    keys = [key for key in dict.fromkeys(keys) if key is not None]
+    pending = _pending(db.session)
+    found = {key: pending[(name, key)] for key in keys
+             if (name, key) in pending}
+    cached = _store.get_many([(name, key) for key in keys
+                              if key not in found])
+    found.update((key, value) for (_, key), value in cached.items())
+    missing = [key for key in keys if key not in found]
+    if missing:
+        db.session.info.setdefault('lookup_generation', _generation)
+    id_column = column.table.c.id
+    for start in range(0, len(missing), LOOKUP_CHUNK_SIZE):
+        chunk = missing[start:start + LOOKUP_CHUNK_SIZE]
+        oldest = (select(func.min(id_column))
+                  .where(column.in_(chunk)).group_by(column))
+        rows = db.session.execute(
+            select(column, *fields).where(id_column.in_(oldest)))
+        for key, *values in rows:
+            found[key] = pending[(name, key)] = tuple(values)
+    return found
+
+
+def lookup_ids(name, keys):
+    """ Resolve values of a registered lookup column to row ids.
+
+    Parameters:
+        name (str): The registered lookup, e.g. 'customer'.
+        keys (iterable): The values to resolve.
+
+    Returns:
+        dict: value -> id, without the values that match no row.
+    """
+    return {key: row[0] for key, row in lookup_rows(name, keys).items()}
+
+
+def lookup_id(name, key):
+    """ Resolve one value of a registered lookup column to its row id.
+
+    Parameters:
+        name (str): The registered lookup.
+        key: The value to resolve.
+
+    Returns:
+        int: The row id, or None if no row matches.
+    """
+    return lookup_ids(name, [key]).get(key)
+
+
+def invalidate_lookups(name, keys):
+    """ Invalidate cached entries when the current transaction commits.
+
+    Writers that change looked up rows with core statements, which the
+    session events do not see, call this for the values they touched.
+
+    Parameters:
+        name (str): The registered lookup.
+        keys (iterable): The looked up values changed.
+    """
+    keys = {(name, key) for key in keys}
+    _bump_generation()
+    pending = _pending(db.session)
+    for key in keys:
+        pending.pop(key, None)
+    db.session.info.setdefault('lookup_invalidations', set()).update(keys)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_invalidations(session, flush_context, instances):
+    """Record the cache keys of the rows renamed, changed or deleted."""
+    changed = [(instance, False) for instance in session.dirty]
+    changed += [(instance, True) for instance in session.deleted]
+    keys = set()
+    for instance, deleted in changed:
+        table = getattr(instance, '__table__', None)
+        if table is None:
+            continue
+        state = inspect(instance)
+        for name, (column, fields) in LOOKUPS.items():
+            if column.table is not table:
+                continue
+            if not (deleted or any(state.attrs[field.key].history
+                                   .has_changes()
+                                   for field in (column, *fields))):
+                continue
+            history = state.attrs[column.key].history
+            values = [*(history.deleted or ()), *(history.unchanged or ()),
+                      *(history.added or ())]
+            if not values:
+                values = [getattr(instance, column.key)]
+            keys.update((name, value) for value in values)
+    if keys:
+        _bump_generation()
+        pending = _pending(session)
+        for key in keys:
+            pending.pop(key, None)
+        session.info.setdefault('lookup_invalidations', set()).update(keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_lookups(session):
+    """Apply the invalidations and publish the reads of the transaction.
+
+    The reads are dropped when any invalidation was collected or applied
+    since the first of them: the row may have changed after it was read.
+    """
+    invalidations = session.info.pop('lookup_invalidations', None)
+    if invalidations:
+        _bump_generation()
+        _store.delete_many(invalidations)
+    generation = session.info.pop('lookup_generation', None)
+    pending = session.info.pop('pending_lookups', None)
+    if pending:
+        with _generation_lock:
+            if generation in (None, _generation):
+                _store.set_many(pending)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_lookups(session, previous_transaction):
+    """Forget the reads and invalidations of a rolled back transaction."""
+    session.info.pop('pending_lookups', None)
+    session.info.pop('lookup_invalidations', None)
+    session.info.pop('lookup_generation', None)
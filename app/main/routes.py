@@ -1,9 +1,10 @@
 from app.main import bp
-from flask import render_template
-from app.models.sale import Sale
-from app.models.product import Product
-from app.models.customer import Customer
-from app.models.user import User
+from flask import render_template, jsonify
+from app.counters import get_counts
+from app.lookups import lookup_stats
+from app.pool_metrics import pool_stats
+from app.extensions import db
+from app.routing import read_only
 from flask_login import login_required
 from flask_security import roles_accepted
 
@@ -11,25 +12,66 @@ from flask_security import roles_accepted
 @bp.route('/', methods=['GET'])
 @login_required
 @roles_accepted('admin', 'editor', 'supervisor')
+@read_only
 def index():
     """ Display the main dashboard with various counts.
 
     Methods:
         GET: Retrieve and display counts for users, customers,
-        products, and sales.
+        products, and sales from the counter table.
 
     Returns:
         Template: Render the main/index.html template with the counts
         data.
     """
-    user_count = User.query.count()
-    customer_count = Customer.query.count()
-    product_count = Product.query.count()
-    sale_count = Sale.query.count()
-    data = {
-        'sale_count': sale_count,
-        'customer_count': customer_count,
-        'product_count': product_count,
-        'user_count': user_count
-    }
-    return render_template('main/index.html', data=data)
+    return render_template('main/index.html', data=get_counts())
+
+
+@bp.route('/counts', methods=['GET'])
+@login_required
+@roles_accepted('admin', 'editor', 'supervisor')
+@read_only
+def counts():
+    """ Return the dashboard counts.
+
+    Methods:
+        GET: Retrieve the counts for users, customers, products, and
+        sales from the counter table.
+
+    Returns:
+        JSON response: The counts keyed like the dashboard data.
+    """
+    return jsonify(get_counts())
+
+
+@bp.route('/lookup_stats', methods=['GET'])
+@login_required
+@roles_accepted('admin')
+def lookup_cache_stats():
+    """ Return the counters of the name -> id lookup cache.
+
+    Methods:
+        GET: Retrieve the size, hit rate, evictions, expirations and
+        invalidations of the lookup cache of this process.
+
+    Returns:
+        JSON response: The lookup cache statistics.
+    """
+    return jsonify(lookup_stats())
+
+
+@bp.route('/pool_stats', methods=['GET'])
+@login_required
+@roles_accepted('admin')
+def connection_pool_stats():
+    """ Return the connection pool metrics of this process.
+
+    Methods:
+        GET: Retrieve, for the primary and replica engines, the
+        connections checked out and in, the overflow in use, and the time
+        spent waiting for a connection.
+
+    Returns:
+        JSON response: The pool metrics keyed by engine name.
+    """
+    return jsonify(pool_stats(db.engines))
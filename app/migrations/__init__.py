@@ -0,0 +1,102 @@
+"""Versioned schema migrations
+
+Each module in ``app.migrations.versions`` defines ``revision`` (an
+increasing integer), ``description`` and ``upgrade(connection)``. Applied
+revisions are recorded in the ``schema_migrations`` table and every
+migration runs in its own transaction, so an interrupted upgrade can be
+resumed by running it again.
+
+A migration may also define ``backfill(engine, echo)`` for data changes
+too large for one transaction. It runs after ``upgrade`` has committed and
+before the revision is recorded, commits in batches of its own, and must
+resume where it stopped when the upgrade is run again.
+"""
+import importlib
+import pkgutil
+from datetime import datetime
+import pytz
+from sqlalchemy import (Column, DateTime, Integer, MetaData, String, Table,
+                        select)
+from app.migrations import versions
+
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False))
+
+
+def load_migrations():
+    """ Import every migration module, ordered by revision.
+
+    Returns:
+        list: The migration modules.
+    """
+    modules = [importlib.import_module(f'{versions.__name__}.{info.name}')
+               for info in pkgutil.iter_modules(versions.__path__)]
+    modules.sort(key=lambda module: module.revision)
+    revisions = [module.revision for module in modules]
+    if len(set(revisions)) != len(revisions):
+        raise RuntimeError(f'duplicate migration revisions: {revisions}')
+    return modules
+
+
+def applied_revisions(engine):
+    """ Return the revisions already applied to a database.
+
+    Parameters:
+        engine: The SQLAlchemy engine of the database.
+
+    Returns:
+        set: The applied revision numbers.
+    """
+    with engine.begin() as connection:
+        _metadata.create_all(connection)
+        return set(connection.scalars(select(schema_migrations.c.version)))
+
+
+def upgrade(engine, target=None, echo=print):
+    """ Apply every pending migration up to ``target``.
+
+    Parameters:
+        engine: The SQLAlchemy engine of the database.
+        target (int): The last revision to apply; all when None.
+        echo (callable): Receives one progress line per migration.
+
+    Returns:
+        list: The revisions applied by this call.
+    """
+    done = applied_revisions(engine)
+    applied = []
+    for module in load_migrations():
+        if module.revision in done:
+            continue
+        if target is not None and module.revision > target:
+            break
+        echo(f'Applying {module.revision:04d} {module.description}')
+        with engine.begin() as connection:
+            module.upgrade(connection)
+        if hasattr(module, 'backfill'):
+            module.backfill(engine, echo)
+        with engine.begin() as connection:
+            connection.execute(schema_migrations.insert().values(
+                version=module.revision, description=module.description,
+                applied_at=datetime.now(pytz.UTC)))
+        applied.append(module.revision)
+    return applied
+
+
+def status(engine):
+    """ List every migration with whether it has been applied.
+
+    Parameters:
+        engine: The SQLAlchemy engine of the database.
+
+    Returns:
+        list: (revision, description, applied) tuples.
+    """
+    done = applied_revisions(engine)
+    return [(module.revision, module.description, module.revision in done)
+            for module in load_migrations()]
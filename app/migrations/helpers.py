@@ -0,0 +1,90 @@
+"""Helpers shared by migration modules"""
+from sqlalchemy import inspect, text
+
+
+def has_table(connection, table):
+    """Return whether ``table`` exists."""
+    return inspect(connection).has_table(table)
+
+
+def index_names(connection, table):
+    """Return the names of the indexes (and unique constraints) of a table."""
+    inspector = inspect(connection)
+    names = {index['name'] for index in inspector.get_indexes(table)}
+    names.update(constraint['name'] for constraint
+                 in inspector.get_unique_constraints(table))
+    return names
+
+
+def create_index(connection, table, name, columns, unique=False):
+    """ Create an index unless one with the same name already exists.
+
+    Parameters:
+        connection: A SQLAlchemy connection inside a transaction.
+        table (str): The table to index.
+        name (str): The index name.
+        columns (list): The indexed column names, in order.
+        unique (bool): Whether to create a UNIQUE index.
+    """
+    if name in index_names(connection, table):
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    connection.execute(text(
+        f'CREATE {kind} {quote(name)} ON {quote(table)} '
+        f'({", ".join(quote(column) for column in columns)})'))
+
+
+def has_column(connection, table, column):
+    """Return whether ``table`` has a column named ``column``."""
+    return any(info['name'] == column
+               for info in inspect(connection).get_columns(table))
+
+
+def add_foreign_key_column(connection, table, column, target):
+    """ Add a nullable integer column referencing ``target``'s id.
+
+    Existing rows get NULL, so the statement does not rewrite the table
+    and the column can be backfilled afterwards in batches. Referenced
+    rows that are deleted later leave NULL behind.
+
+    Parameters:
+        connection: A SQLAlchemy connection inside a transaction.
+        table (str): The table to alter.
+        column (str): The new column name.
+        target (str): The referenced table.
+    """
+    if has_column(connection, table, column):
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    references = (f'REFERENCES {quote(target)} (id) '
+                  'ON DELETE SET NULL')
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(
+            f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} '
+            f'INTEGER {references}'))
+    else:
+        connection.execute(text(
+            f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} '
+            'INTEGER NULL'))
+        connection.execute(text(
+            f'ALTER TABLE {quote(table)} ADD CONSTRAINT '
+            f'{quote(f"fk_{table}_{column}")} FOREIGN KEY '
+            f'({quote(column)}) {references}'))
+
+
+def add_column(connection, table, column, type_sql):
+    """ Add a nullable column unless it already exists.
+
+    Parameters:
+        connection: A SQLAlchemy connection inside a transaction.
+        table (str): The table to alter.
+        column (str): The new column name.
+        type_sql (str): The SQL type of the column, e.g. 'INTEGER'.
+    """
+    if has_column(connection, table, column):
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    connection.execute(text(
+        f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} '
+        f'{type_sql} NULL'))
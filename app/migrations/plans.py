@@ -0,0 +1,118 @@
+"""EXPLAIN checks for the hot queries
+
+Every query in ``hot_queries`` must be answered from an index. The check
+fails when a plan scans a whole table or sorts it without an index.
+"""
+from datetime import date, datetime
+from sqlalchemy import select
+from app.models.change import Change
+from app.models.customer import Customer
+from app.models.product import Product
+from app.models.sale import Sale
+from app.models.user import User, Role
+from app.models.rollup import (CustomerLifetime, SalesDaily,
+                               SalesDailyProduct)
+from app.pagination import _after
+
+
+def hot_queries():
+    """ Build the statements behind the busiest lookups and list views.
+
+    Returns:
+        dict: A description -> SQLAlchemy select statement.
+    """
+    cursor_date = datetime(2024, 1, 1)
+    return {
+        'product by name': select(Product).where(
+            Product.product_name == 'product'),
+        'customer by email': select(Customer).where(
+            Customer.customer_email == 'customer@example.com'),
+        'sales by customer email': select(Sale).where(
+            Sale.customer_email == 'customer@example.com'),
+        'sales by customer id': select(Sale).where(Sale.customer_id == 1),
+        'sales of a product': select(Sale.id, Product.price).join(
+            Product, Sale.product_id == Product.id).where(Product.id == 1),
+        'role by name': select(Role).where(Role.name == 'admin'),
+        'sales first page': select(Sale).order_by(
+            Sale.date.desc(), Sale.id.desc()).limit(51),
+        'sales next page': select(Sale).where(
+            _after([(Sale.date, True), (Sale.id, True)], [cursor_date, 1])
+        ).order_by(Sale.date.desc(), Sale.id.desc()).limit(51),
+        'customers first page': select(Customer).order_by(
+            Customer.date.desc(), Customer.id.desc()).limit(51),
+        'products first page': select(Product).order_by(
+            Product.product_name, Product.id).limit(51),
+        'users first page': select(User).order_by(
+            User.user_name, User.id).limit(51),
+        'daily revenue of a range': select(SalesDaily).where(
+            SalesDaily.day.between(date(2024, 1, 1), date(2024, 1, 31))),
+        'daily revenue of a product': select(SalesDailyProduct).where(
+            SalesDailyProduct.product_id == 1,
+            SalesDailyProduct.day >= date(2024, 1, 1)),
+        'top customers': select(CustomerLifetime).order_by(
+            CustomerLifetime.revenue.desc()).limit(10),
+        'changes after a seq': select(Change).where(
+            Change.seq > 1).order_by(Change.seq).limit(100),
+        'changes of a table after a seq': select(Change).where(
+            Change.seq > 1, Change.table_name == 'sales'
+        ).order_by(Change.seq).limit(100),
+    }
+
+
+def _explain(connection, statement):
+    """ Return the plan of ``statement`` as a list of text lines.
+
+    Parameters:
+        connection: A SQLAlchemy connection.
+        statement: The select statement to explain.
+
+    Returns:
+        list: One line per plan step.
+    """
+    compiled = statement.compile(dialect=connection.dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[key] for key in compiled.positiontup)
+    else:
+        params = compiled.params
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(
+            f'EXPLAIN QUERY PLAN {compiled}', params).all()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql(f'EXPLAIN {compiled}', params)
+    return [dict(row._mapping) for row in rows]
+
+
+def _is_full_scan(dialect, step):
+    """ Report whether one plan step reads or sorts a whole table.
+
+    Parameters:
+        dialect (str): The database dialect name.
+        step: A plan line from ``_explain``.
+
+    Returns:
+        bool: True for full table scans and index-less sorts.
+    """
+    if dialect == 'sqlite':
+        full_scan = step.startswith('SCAN ') and ' USING ' not in step
+        return full_scan or 'TEMP B-TREE FOR ORDER BY' in step
+    extra = step.get('Extra') or ''
+    return step.get('type') == 'ALL' or 'Using filesort' in extra
+
+
+def check_query_plans(connection):
+    """ EXPLAIN every hot query and collect the ones doing full scans.
+
+    Parameters:
+        connection: A SQLAlchemy connection.
+
+    Returns:
+        dict: description -> plan for every failing query; empty when all
+        hot queries use indexes.
+    """
+    dialect = connection.dialect.name
+    failures = {}
+    for name, statement in hot_queries().items():
+        plan = _explain(connection, statement)
+        if any(_is_full_scan(dialect, step) for step in plan):
+            failures[name] = plan
+    return failures
@@ -0,0 +1 @@
+"""Migration modules, applied in ``revision`` order"""
@@ -0,0 +1,22 @@
+"""Create the application tables on an empty database.
+
+Existing tables are left untouched, so this also adopts databases that
+were created before migrations existed.
+"""
+from app.extensions import db
+import app.models.customer  # noqa: F401 -- register the models
+import app.models.import_job  # noqa: F401
+import app.models.product  # noqa: F401
+import app.models.sale  # noqa: F401
+import app.models.user  # noqa: F401
+
+
+revision = 1
+description = 'baseline schema'
+TABLES = ['user', 'role', 'user_roles', 'sales', 'products', 'customers',
+          'import_jobs']
+
+
+def upgrade(connection):
+    db.metadata.create_all(
+        connection, tables=[db.metadata.tables[name] for name in TABLES])
@@ -0,0 +1,49 @@
+"""Index the columns used by the hot lookups and list orderings.
+
+Customer rows sharing an email are merged first (payment frequencies are
+summed into the oldest row) so the unique index can be built. Duplicate
+product names are reported instead, since merging stock needs a human.
+"""
+from sqlalchemy import text
+from app.migrations.helpers import create_index
+
+
+revision = 2
+description = 'indexes on hot lookup and sort columns'
+INDEXES = [
+    ('products', 'ux_products_product_name', ['product_name'], True),
+    ('customers', 'ux_customers_customer_email', ['customer_email'], True),
+    ('customers', 'ix_customers_date_id', ['date', 'id'], False),
+    ('sales', 'ix_sales_date_id', ['date', 'id'], False),
+    ('sales', 'ix_sales_customer_email', ['customer_email'], False),
+    ('user', 'ix_user_user_name_id', ['user_name', 'id'], False),
+]
+
+
+def _merge_duplicate_customers(connection):
+    duplicates = connection.execute(text(
+        'SELECT customer_email, MIN(id), SUM(frequentcy_pay) FROM customers '
+        'GROUP BY customer_email HAVING COUNT(*) > 1')).all()
+    for email, keep, total in duplicates:
+        connection.execute(text(
+            'UPDATE customers SET frequentcy_pay = :total WHERE id = :keep'),
+            {'total': total, 'keep': keep})
+        connection.execute(text(
+            'DELETE FROM customers WHERE customer_email = :email '
+            'AND id <> :keep'), {'email': email, 'keep': keep})
+
+
+def _check_duplicate_products(connection):
+    names = connection.scalars(text(
+        'SELECT product_name FROM products GROUP BY product_name '
+        'HAVING COUNT(*) > 1 LIMIT 20')).all()
+    if names:
+        raise RuntimeError('products share a name, rename or merge them '
+                           f'before upgrading: {names}')
+
+
+def upgrade(connection):
+    _merge_duplicate_customers(connection)
+    _check_duplicate_products(connection)
+    for table, name, columns, unique in INDEXES:
+        create_index(connection, table, name, columns, unique)
@@ -0,0 +1,10 @@
+"""Create the full-text search indexes and fill them from the tables."""
+from app.search import create_search_indexes
+
+
+revision = 3
+description = 'full-text search indexes'
+
+
+def upgrade(connection):
+    create_search_indexes(connection)
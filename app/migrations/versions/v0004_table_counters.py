@@ -0,0 +1,23 @@
+"""Create the dashboard row counters and seed them with COUNT(*)."""
+from datetime import datetime
+import pytz
+from sqlalchemy import func, select
+from app.models.counter import TableCounter
+from app.counters import COUNTED
+
+
+revision = 4
+description = 'dashboard row counters'
+
+
+def upgrade(connection):
+    table = TableCounter.__table__
+    table.create(connection, checkfirst=True)
+    connection.execute(table.delete())
+    now = datetime.now(pytz.UTC)
+    connection.execute(table.insert(), [
+        {'name': model.__tablename__,
+         'count': connection.scalar(
+             select(func.count()).select_from(model.__table__)),
+         'reconciled_at': now}
+        for model in COUNTED.values()])
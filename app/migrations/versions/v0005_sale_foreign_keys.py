@@ -0,0 +1,62 @@
+"""Reference products, customers and users from sales by id.
+
+The columns are added empty and indexed in the schema transaction; the
+backfill then resolves the names of existing sales in id ranges of
+BATCH_SIZE rows, one short transaction per range, so writers are never
+blocked for long on a live database. Only rows still NULL are touched,
+which makes an interrupted backfill resume where it stopped. Sales whose
+product, customer or user no longer exists keep NULL.
+"""
+from sqlalchemy import func, or_, select, update
+from app.migrations.helpers import add_foreign_key_column, create_index
+from app.models.customer import Customer
+from app.models.product import Product
+from app.models.sale import Sale
+from app.models.user import User
+
+
+revision = 5
+description = 'foreign keys from sales to products, customers and users'
+BATCH_SIZE = 5000
+# Sale column -> (referenced table, id column, matched columns)
+REFERENCES = {
+    'product_id': ('products', Product.__table__.c.id,
+                   (Sale.__table__.c.product_name,
+                    Product.__table__.c.product_name)),
+    'customer_id': ('customers', Customer.__table__.c.id,
+                    (Sale.__table__.c.customer_email,
+                     Customer.__table__.c.customer_email)),
+    'user_id': ('user', User.__table__.c.id,
+                (Sale.__table__.c.user_name, User.__table__.c.user_name)),
+}
+
+
+def upgrade(connection):
+    for column, (target, _, _) in REFERENCES.items():
+        add_foreign_key_column(connection, 'sales', column, target)
+        create_index(connection, 'sales', f'ix_sales_{column}', [column])
+
+
+def backfill(engine, echo):
+    sales = Sale.__table__
+    values = {column: select(func.min(id_column))
+              .where(target_column == sale_column).scalar_subquery()
+              for column, (_, id_column, (sale_column, target_column))
+              in REFERENCES.items()}
+    pending = or_(*(sales.c[column].is_(None) for column in REFERENCES))
+    with engine.connect() as connection:
+        low, high = connection.execute(
+            select(func.min(sales.c.id), func.max(sales.c.id))
+            .where(pending)).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        with engine.begin() as connection:
+            for column, value in values.items():
+                connection.execute(
+                    update(sales)
+                    .where(sales.c.id.between(start, start + BATCH_SIZE - 1),
+                           sales.c[column].is_(None))
+                    .values({column: value}))
+        echo(f'  sales {start}-{min(start + BATCH_SIZE - 1, high)} '
+             'backfilled')
@@ -0,0 +1,52 @@
+"""Copy the unit price onto sales and build the reporting rollups.
+
+The price column is added empty; the backfill copies each product's
+current price onto the existing sales in id ranges of BATCH_SIZE rows
+(only rows still NULL, so an interrupted backfill resumes), then builds
+the rollup tables from the whole sales table in one transaction.
+"""
+from sqlalchemy import func, select, update
+from app.migrations.helpers import add_column
+from app.models.product import Product
+from app.models.rollup import (CustomerLifetime, SalesDaily,
+                               SalesDailyProduct, SalesDailyUser)
+from app.models.sale import Sale
+from app.rollups import rebuild_rollups
+
+
+revision = 6
+description = 'sale unit prices and reporting rollups'
+BATCH_SIZE = 5000
+TABLES = [SalesDaily, SalesDailyProduct, SalesDailyUser, CustomerLifetime]
+
+
+def upgrade(connection):
+    add_column(connection, 'sales', 'unit_price', 'INTEGER')
+    for model in TABLES:
+        model.__table__.create(connection, checkfirst=True)
+
+
+def backfill(engine, echo):
+    sales = Sale.__table__
+    products = Product.__table__
+    price = (select(products.c.price)
+             .where(products.c.id == sales.c.product_id).scalar_subquery())
+    with engine.connect() as connection:
+        low, high = connection.execute(
+            select(func.min(sales.c.id), func.max(sales.c.id))
+            .where(sales.c.unit_price.is_(None),
+                   sales.c.product_id.is_not(None))).one()
+    if low is not None:
+        for start in range(low, high + 1, BATCH_SIZE):
+            with engine.begin() as connection:
+                connection.execute(
+                    update(sales)
+                    .where(sales.c.id.between(start,
+                                              start + BATCH_SIZE - 1),
+                           sales.c.unit_price.is_(None))
+                    .values(unit_price=price))
+            echo(f'  sales {start}-{min(start + BATCH_SIZE - 1, high)} '
+                 'priced')
+    with engine.begin() as connection:
+        rebuild_rollups(connection)
+    echo('  rollups built')
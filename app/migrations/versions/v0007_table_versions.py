@@ -0,0 +1,14 @@
+"""Add a version to the table counters for the list page caches."""
+from app.migrations.helpers import add_column
+from app.models.counter import TableCounter
+
+
+revision = 7
+description = 'table versions'
+
+
+def upgrade(connection):
+    add_column(connection, 'table_counters', 'version', 'INTEGER')
+    table = TableCounter.__table__
+    connection.execute(table.update().where(table.c.version.is_(None))
+                       .values(version=0))
@@ -0,0 +1,12 @@
+"""Record when each counted table was last written, for the exports."""
+from sqlalchemy import DateTime
+from app.migrations.helpers import add_column
+
+
+revision = 8
+description = 'table change times'
+
+
+def upgrade(connection):
+    add_column(connection, 'table_counters', 'changed_at',
+               connection.dialect.type_compiler.process(DateTime()))
@@ -0,0 +1,14 @@
+"""Create the change log of the /changes feed.
+
+The log starts empty: consumers take their first copy from an export and
+follow the changes after its X-Change-Seq.
+"""
+from app.models.change import Change
+
+
+revision = 9
+description = 'change log'
+
+
+def upgrade(connection):
+    Change.__table__.create(connection, checkfirst=True)
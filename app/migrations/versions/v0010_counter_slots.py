@@ -0,0 +1,13 @@
+"""Spread the table counter writes over slot rows.
+
+The slots start empty: the existing counters stay as their base rows.
+"""
+from app.models.counter import CounterSlot
+
+
+revision = 10
+description = 'counter slots'
+
+
+def upgrade(connection):
+    CounterSlot.__table__.create(connection, checkfirst=True)
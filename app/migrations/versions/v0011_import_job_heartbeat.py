@@ -0,0 +1,17 @@
+"""Record when each import job was last written, to detect dead jobs.
+
+Databases created before the job table existed get it here.
+"""
+from sqlalchemy import DateTime
+from app.migrations.helpers import add_column
+from app.models.import_job import ImportJob
+
+
+revision = 11
+description = 'import job heartbeat'
+
+
+def upgrade(connection):
+    ImportJob.__table__.create(connection, checkfirst=True)
+    add_column(connection, 'import_jobs', 'updated_at',
+               connection.dialect.type_compiler.process(DateTime()))
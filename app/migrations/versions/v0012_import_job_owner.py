@@ -0,0 +1,12 @@
+"""Record the process that owns each import job."""
+from sqlalchemy import String
+from app.migrations.helpers import add_column
+
+
+revision = 12
+description = 'import job owner'
+
+
+def upgrade(connection):
+    add_column(connection, 'import_jobs', 'owner',
+               connection.dialect.type_compiler.process(String(100)))
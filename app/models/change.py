@@ -0,0 +1,80 @@
+"""change log modules to create table"""
+from datetime import datetime
+import pytz
+from app.extensions import db
+
+
+class Change(db.Model):
+    """Change model representing the append-only 'change_log' table in the
+    database.
+
+    Attributes:
+        seq (Integer): Primary key, the position of the change in the
+        feed; it only grows.
+        op (String): 'insert', 'update' or 'delete'.
+        table_name (String): The table of the changed row.
+        row_id (Integer): The primary key of the changed row.
+        columns (String): The comma separated columns an update changed;
+        empty for inserts and deletes.
+        changed_at (DateTime): When the change was written.
+
+    Methods:
+        __repr__(): Returns a string representation of the change object.
+        to_dict(): Returns the change as a JSON-compatible dictionary.
+    """
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_table_name_seq', 'table_name', 'seq'),
+    )
+    seq = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(6), nullable=False)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    columns = db.Column(db.String(1000))
+    changed_at = db.Column(db.DateTime, nullable=False,
+                           default=lambda: datetime.now(pytz.UTC))
+
+    def __repr__(self):
+        """Returns a string representation of the change object.
+
+        Returns:
+            str: A string that includes the sequence number and the row.
+        """
+        return f'<Change {self.seq} {self.op} {self.table_name} {self.row_id}>'
+
+    def to_dict(self):
+        """Returns the change as a JSON-compatible dictionary.
+
+        Returns:
+            dict: The change, with the updated columns as a list (None
+            for inserts and deletes) and the time in ISO format.
+        """
+        return {"seq": self.seq,
+                "op": self.op,
+                "table": self.table_name,
+                "id": self.row_id,
+                "columns": self.columns.split(',') if self.columns else None,
+                "changed_at": (self.changed_at.isoformat()
+                               if self.changed_at else None)}
+
+
+def log_changes(connection, op, table_name, ids, columns=None):
+    """ Log the rows written with core statements, within the caller's
+    transaction.
+
+    Flushes are logged by the ``after_flush`` hook of ``app.change_log``;
+    core inserts and updates bypass it and call this instead.
+
+    Parameters:
+        connection: The connection (or session) of the writing transaction.
+        op (str): 'insert', 'update' or 'delete'.
+        table_name (str): The table of the rows.
+        ids (iterable): The primary keys of the rows.
+        columns (list): The columns an update changed.
+    """
+    now = datetime.now(pytz.UTC)
+    rows = [{'op': op, 'table_name': table_name, 'row_id': row_id,
+             'columns': ','.join(columns) if columns else None,
+             'changed_at': now} for row_id in ids]
+    if rows:
+        connection.execute(Change.__table__.insert(), rows)
@@ -0,0 +1,111 @@
+"""table counter modules to create table"""
+import importlib
+import random
+from datetime import datetime
+import pytz
+from app.extensions import db
+
+
+# Slot rows per counted table (see CounterSlot)
+COUNTER_SLOTS = 16
+
+
+class TableCounter(db.Model):
+    """TableCounter model representing the 'table_counters' table in the
+    database.
+
+    Attributes:
+        name (String): Primary key, the name of the counted table.
+        count (Integer): The base row count; the slots of the table hold
+        the writes since, and only the reconciliation updates it.
+        version (Integer): The base version, added to the slots' ones.
+        changed_at (DateTime): When the table was last written before the
+        slots existed.
+        reconciled_at (DateTime): When the count was last corrected with
+        COUNT(*).
+
+    Methods:
+        __repr__(): Returns a string representation of the counter object.
+    """
+    __tablename__ = 'table_counters'
+    name = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime)
+    reconciled_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        """Returns a string representation of the counter object.
+
+        Returns:
+            str: A string that includes the table name and count.
+        """
+        return f'<TableCounter {self.name} {self.count}>'
+
+
+class CounterSlot(db.Model):
+    """CounterSlot model representing the 'table_counter_slots' table in
+    the database: the writes since the base counter, spread over
+    COUNTER_SLOTS rows per table so concurrent writers rarely wait on the
+    same row lock.
+
+    Attributes:
+        name (String): Part of the primary key, the counted table.
+        slot (Integer): Part of the primary key, from 0 to
+        COUNTER_SLOTS - 1.
+        count (Integer): The rows added through this slot, negative when
+        more were deleted.
+        version (Integer): The writes that went through this slot.
+        changed_at (DateTime): When a write last went through this slot.
+    """
+    __tablename__ = 'table_counter_slots'
+    name = db.Column(db.String(50), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime)
+
+
+def add_to_counters(connection, deltas):
+    """ Add row deltas to the counters within the caller's transaction.
+
+    Each table's delta goes to one of its slots, picked at random, whose
+    version is incremented even with a delta of 0. The slot rows are
+    created by their first write.
+
+    Parameters:
+        connection: The connection (or session) of the writing transaction.
+        deltas (dict): table name -> number of rows added (negative for
+        deleted rows).
+    """
+    table = CounterSlot.__table__
+    dialect = db.engine.dialect.name
+    # only the dialect in use is imported, not all three at startup
+    statement = importlib.import_module(
+        f'sqlalchemy.dialects.{dialect}').insert(table)
+    new = statement.inserted if dialect == 'mysql' else statement.excluded
+    values = {'count': table.c.count + new.count,
+              'version': table.c.version + 1,
+              'changed_at': new.changed_at}
+    if dialect == 'mysql':
+        statement = statement.on_duplicate_key_update(values)
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=['name', 'slot'], set_=values)
+    now = datetime.now(pytz.UTC)
+    # always in name order, so two writers lock their slots in one order
+    connection.execute(statement, [
+        {'name': name, 'slot': random.randrange(COUNTER_SLOTS),
+         'count': delta, 'version': 1, 'changed_at': now}
+        for name, delta in sorted(deltas.items())])
+
+
+def bump_versions(connection, tables):
+    """ Increment the version of tables whose rows were updated in place
+    with core statements, within the caller's transaction.
+
+    Parameters:
+        connection: The connection (or session) of the writing transaction.
+        tables (iterable): The names of the updated tables.
+    """
+    add_to_counters(connection, dict.fromkeys(tables, 0))
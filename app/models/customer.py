@@ -1,5 +1,10 @@
 """Customer modules to create table"""
 from app.extensions import db
+from sqlalchemy import update
+from app.search import search as full_text_search
+from app.lookups import lookup_id, register_lookup
+from app.models.change import log_changes
+from app.models.counter import bump_versions
 from datetime import datetime
 import pytz
 
@@ -20,12 +25,17 @@ class Customer(db.Model):
     __repr__(): Returns a string representation of the customer object.
     """
     __tablename__ = 'customers'
+    __table_args__ = (
+        db.Index('ux_customers_customer_email', 'customer_email',
+                 unique=True),
+        db.Index('ix_customers_date_id', 'date', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(200), nullable=False)
     customer_email = db.Column(db.String(200), nullable=False)
     customer_phone = db.Column(db.String(15))
     frequentcy_pay = db.Column(db.Integer, nullable=False)
-    date = db.Column(db.DateTime, default=datetime.now(pytz.UTC))
+    date = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))
 
     def __repr__(self):
         """ Returns a string representation of the customer object.
@@ -37,48 +47,66 @@ class Customer(db.Model):
         return ('<Customer name %r Email %r>'
                 % self.customer_name % self.customer_email)
 
+    def to_dict(self):
+        """Returns the customer as a JSON-compatible dictionary.
+
+        Returns:
+            dict: The customer columns, with the date in ISO format.
+        """
+        return {"id": self.id,
+                "customer_name": self.customer_name,
+                "customer_email": self.customer_email,
+                "customer_phone": self.customer_phone,
+                "frequentcy_pay": self.frequentcy_pay,
+                "date": self.date.isoformat() if self.date else None}
+
+
+register_lookup('customer', Customer.customer_email)
+
 
 def add_customer(sale):
     """ Adds a new customer or updates
     an existing customer's payment frequency.
 
+    The customer is resolved by email through the lookup cache and the
+    frequency is incremented with a single UPDATE on its id, so concurrent
+    sales for the same customer are all counted. The customer id is set on
+    the sale. Nothing is committed: the change belongs to the caller's
+    sale transaction.
+
     Parameters:
         sale: The sale object containing customer details.
-    Returns:
-        str: A message if failure
     """
-    existing_customer = Customer.query.filter_by(
-        customer_email=sale.customer_email).first()
-    if existing_customer:
-        existing_customer.frequentcy_pay += 1
-    else:
-        new_customer = Customer(customer_name=sale.customer_name,
-                                customer_email=sale.customer_email,
-                                customer_phone=sale.customer_phone,
-                                frequentcy_pay=1)
-        db.session.add(new_customer)
-    try:
-        db.session.commit()
-    except:
-        return 'There was an issue adding new customer'
-    return 'Customer added/updated successfully'
+    customer_id = lookup_id('customer', sale.customer_email)
+    if customer_id is not None:
+        result = db.session.execute(
+            update(Customer)
+            .where(Customer.id == customer_id)
+            .values(frequentcy_pay=Customer.frequentcy_pay + 1)
+            .execution_options(synchronize_session=False))
+        if result.rowcount:
+            bump_versions(db.session, ['customers'])
+            log_changes(db.session, 'update', 'customers', [customer_id],
+                        ['frequentcy_pay'])
+            sale.customer_id = customer_id
+            return
+    customer = Customer(customer_name=sale.customer_name,
+                        customer_email=sale.customer_email,
+                        customer_phone=sale.customer_phone,
+                        frequentcy_pay=1)
+    db.session.add(customer)
+    db.session.flush()
+    sale.customer_id = customer.id
 
 
 def get_customer(search):
-    """ Searches for customers in the database using a search pattern.
+    """ Searches for customers through the full-text index.
 
     Parameters:
         search: The search string to look for in customer records.
 
     Returns:
-        list: A list of customer objects matching the search criteria.
+        list: The customer objects matching every search word as
+        a prefix, best match first, at most SEARCH_LIMIT of them.
     """
-    search_pattern = f"%{search}"
-    results = Customer.query.filter(
-        (Customer.id.like(search_pattern))
-        | (Customer.customer_name.like(search_pattern))
-        | (Customer.customer_email.like(search_pattern))
-        | (Customer.customer_phone.like(search_pattern))
-        | (Customer.date.like(search_pattern))
-    ).all()
-    return results
+    return full_text_search(Customer, search)
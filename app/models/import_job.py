@@ -0,0 +1,87 @@
+"""import job modules to create table"""
+from app.extensions import db
+from datetime import datetime
+import json
+import pytz
+
+
+class ImportJob(db.Model):
+    """ImportJob model representing the 'import_jobs' table in the database.
+
+    Attributes:
+        id (Integer): Primary key, unique identifier for each job.
+        kind (String): What the file holds, 'sales' or 'products'.
+        file_name (String): The name of the uploaded file.
+        file_path (String): Where the uploaded file was saved.
+        state (String): queued, running, succeeded or failed.
+        rows_read (Integer): Rows parsed from the file so far.
+        rows_committed (Integer): Rows written to the database so far.
+        message (String): The final result message of the import.
+        errors (Text): JSON list of the errors reported by the import.
+        date (DateTime): The date when the job was queued.
+        started_at (DateTime): When a worker picked the job up.
+        finished_at (DateTime): When the job succeeded or failed.
+        updated_at (DateTime): When the job row was last written; the
+        owner refreshes it while the job is queued or running.
+        owner (String): The host and process id of the process that
+        queued and runs the job.
+
+    Methods:
+        __repr__(): Returns a string representation of the job object.
+        to_dict(): Returns the job status as a JSON-compatible dictionary.
+    """
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    file_name = db.Column(db.String(200), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='queued')
+    rows_read = db.Column(db.Integer, nullable=False, default=0)
+    rows_committed = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(500))
+    errors = db.Column(db.Text)
+    date = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime,
+                           default=lambda: datetime.now(pytz.UTC))
+    owner = db.Column(db.String(100))
+
+    def __repr__(self):
+        """Returns a string representation of the job object.
+
+        Returns:
+            str: A string that includes the job's ID and state.
+        """
+        return f'<ImportJob id {self.id} state {self.state}>'
+
+    @property
+    def throughput(self):
+        """Committed rows per second since the job started."""
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or datetime.now(pytz.UTC)
+        elapsed = (end.replace(tzinfo=None)
+                   - self.started_at.replace(tzinfo=None)).total_seconds()
+        return round(self.rows_committed / elapsed, 1) if elapsed else 0.0
+
+    def to_dict(self):
+        """Returns the job status as a JSON-compatible dictionary.
+
+        Returns:
+            dict: The job state, counters, throughput and errors.
+        """
+        def iso(value):
+            return value.isoformat() if value else None
+        return {"id": self.id,
+                "kind": self.kind,
+                "file_name": self.file_name,
+                "state": self.state,
+                "rows_read": self.rows_read,
+                "rows_committed": self.rows_committed,
+                "rows_per_second": self.throughput,
+                "message": self.message,
+                "errors": json.loads(self.errors) if self.errors else [],
+                "date": iso(self.date),
+                "started_at": iso(self.started_at),
+                "finished_at": iso(self.finished_at)}
@@ -1,5 +1,10 @@
 """Product modules to create table"""
 from app.extensions import db
+from sqlalchemy import select, update
+from app.search import search as full_text_search
+from app.lookups import register_lookup
+from app.models.change import log_changes
+from app.models.counter import bump_versions
 from datetime import datetime
 import pytz
 
@@ -18,11 +23,14 @@ class Product(db.Model):
         Returns a string representation of the product object.
     """
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ux_products_product_name', 'product_name', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(200), nullable=False)
     price = db.Column(db.Integer, nullable=False)
     product_quantity = db.Column(db.Integer, nullable=False)
-    date = db.Column(db.DateTime, default=datetime.now(pytz.UTC))
+    date = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))
 
     def __repr__(self):
         """Returns a string representation of the product object.
@@ -33,20 +41,84 @@ class Product(db.Model):
         return ('<Product name %r Price %r>'
                 % self.product_name % self.price)
 
+    def to_dict(self):
+        """Returns the product as a JSON-compatible dictionary.
+
+        Returns:
+            dict: The product columns, with the date in ISO format.
+        """
+        return {"id": self.id,
+                "product_name": self.product_name,
+                "price": self.price,
+                "product_quantity": self.product_quantity,
+                "date": self.date.isoformat() if self.date else None}
+
+
+register_lookup('product', Product.product_name, Product.price)
+
+
+def reserve_stock(product_id, quantity):
+    """ Atomically take ``quantity`` units of a product out of stock.
+
+    A single conditional UPDATE decrements the stock only if enough is
+    left, so concurrent reservations can never oversell. Nothing is
+    committed: the reservation belongs to the caller's transaction and is
+    undone by its rollback.
+
+    Parameters:
+        product_id (int): The id of the product, None if it was not
+        found.
+        quantity (int): The number of units to reserve.
+
+    Returns:
+        str: An error message ('Product not found' or 'Not enough
+        quantity'), or None if the stock was reserved.
+    """
+    if product_id is None:
+        return 'Product not found'
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id,
+               Product.product_quantity >= quantity)
+        .values(product_quantity=Product.product_quantity - quantity)
+        .execution_options(synchronize_session=False))
+    if result.rowcount == 1:
+        bump_versions(db.session, ['products'])
+        log_changes(db.session, 'update', 'products', [product_id],
+                    ['product_quantity'])
+        return None
+    exists = db.session.scalar(
+        select(Product.id).where(Product.id == product_id))
+    return 'Not enough quantity' if exists else 'Product not found'
+
+
+def release_stock(product_id, quantity):
+    """ Atomically put ``quantity`` units of a product back in stock.
+
+    Parameters:
+        product_id (int): The id of the product; nothing is done for None.
+        quantity (int): The number of units to return.
+    """
+    if product_id is None:
+        return
+    db.session.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(product_quantity=Product.product_quantity + quantity)
+        .execution_options(synchronize_session=False))
+    bump_versions(db.session, ['products'])
+    log_changes(db.session, 'update', 'products', [product_id],
+                ['product_quantity'])
+
 
 def get_product(search):
-    """Searches for products in the database using a search pattern.
+    """Searches for products through the full-text index.
 
     Parameters:
         search: The search string to look for in product records.
 
     Returns:
-        list: A list of product objects matching the search criteria.
+        list: The product objects matching every search word as
+        a prefix, best match first, at most SEARCH_LIMIT of them.
     """
-    search_pattern = f"%{search}"
-    results = Product.query.filter(
-        (Product.id.like(search_pattern))
-        | (Product.product_name.like(search_pattern))
-        | (Product.price.like(search_pattern))
-    ).all()
-    return results
+    return full_text_search(Product, search)
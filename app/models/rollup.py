@@ -0,0 +1,246 @@
+"""sales rollup modules to create tables"""
+from datetime import date
+from sqlalchemy import func, select
+from app.extensions import db
+from app.models.customer import Customer
+from app.models.product import Product
+from app.models.user import User
+
+
+class SalesDaily(db.Model):
+    """SalesDaily model representing the 'sales_daily' table in the
+    database.
+
+    Attributes:
+        day (Date): Primary key, the UTC day of the sales.
+        sale_count (Integer): The number of sales.
+        quantity (Integer): The number of units sold.
+        revenue (Integer): The units sold times their unit price.
+    """
+    __tablename__ = 'sales_daily'
+    day = db.Column(db.Date, primary_key=True)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class SalesDailyProduct(db.Model):
+    """SalesDailyProduct model representing the 'sales_daily_product'
+    table in the database.
+
+    Attributes:
+        day (Date): Part of the primary key, the UTC day of the sales.
+        product_id (Integer): Part of the primary key, the product sold;
+        0 for sales without one (see ``app.rollups`` for deletes).
+        sale_count (Integer): The number of sales.
+        quantity (Integer): The number of units sold.
+        revenue (Integer): The units sold times their unit price.
+    """
+    __tablename__ = 'sales_daily_product'
+    __table_args__ = (
+        db.Index('ix_sales_daily_product_product_id_day',
+                 'product_id', 'day'),
+    )
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True,
+                           autoincrement=False)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class SalesDailyUser(db.Model):
+    """SalesDailyUser model representing the 'sales_daily_user' table in
+    the database.
+
+    Attributes:
+        day (Date): Part of the primary key, the UTC day of the sales.
+        user_id (Integer): Part of the primary key, the user who
+        processed the sales; 0 for sales without one.
+        sale_count (Integer): The number of sales.
+        quantity (Integer): The number of units sold.
+        revenue (Integer): The units sold times their unit price.
+    """
+    __tablename__ = 'sales_daily_user'
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class CustomerLifetime(db.Model):
+    """CustomerLifetime model representing the 'customer_lifetime' table
+    in the database.
+
+    Attributes:
+        customer_id (Integer): Primary key, the customer; 0 for sales
+        without one.
+        sale_count (Integer): The number of sales.
+        quantity (Integer): The number of units bought.
+        revenue (Integer): The lifetime value of the customer.
+        first_sale (DateTime): The date of the first sale.
+        last_sale (DateTime): The date of the latest sale.
+    """
+    __tablename__ = 'customer_lifetime'
+    __table_args__ = (
+        db.Index('ix_customer_lifetime_revenue', 'revenue'),
+    )
+    customer_id = db.Column(db.Integer, primary_key=True,
+                            autoincrement=False)
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.BigInteger, nullable=False, default=0)
+    first_sale = db.Column(db.DateTime)
+    last_sale = db.Column(db.DateTime)
+
+
+def _day_filter(column, start=None, end=None):
+    """ Build the filters restricting a rollup to a day range.
+
+    Parameters:
+        column: The Date column to filter on.
+        start (str): ISO date of the first included day.
+        end (str): ISO date of the last included day.
+
+    Returns:
+        list: The filter clauses.
+
+    Raises:
+        ValueError: If a bound is not an ISO date.
+    """
+    clauses = []
+    if start:
+        clauses.append(column >= date.fromisoformat(start))
+    if end:
+        clauses.append(column <= date.fromisoformat(end))
+    return clauses
+
+
+def _measures(model):
+    return [func.sum(model.sale_count).label('sale_count'),
+            func.sum(model.quantity).label('quantity'),
+            func.sum(model.revenue).label('revenue')]
+
+
+def _totals(row):
+    return {'sale_count': int(row.sale_count or 0),
+            'quantity': int(row.quantity or 0),
+            'revenue': int(row.revenue or 0)}
+
+
+def revenue_by_day(start=None, end=None):
+    """ Sum the sales of every day in a range.
+
+    Parameters:
+        start (str): ISO date of the first included day.
+        end (str): ISO date of the last included day.
+
+    Returns:
+        list: One dictionary per day with its totals, ordered by day.
+    """
+    rows = db.session.execute(
+        select(SalesDaily.day, *_measures(SalesDaily))
+        .where(*_day_filter(SalesDaily.day, start, end))
+        .group_by(SalesDaily.day).order_by(SalesDaily.day))
+    return [{'day': row.day.isoformat(), **_totals(row)} for row in rows]
+
+
+def revenue_by(dimension, start=None, end=None, order='revenue',
+               limit=10):
+    """ Rank the products or users of a day range by their sales.
+
+    Parameters:
+        dimension (str): 'product' or 'user'.
+        start (str): ISO date of the first included day.
+        end (str): ISO date of the last included day.
+        order (str): The measure to rank by: 'revenue', 'quantity' or
+        'sale_count'.
+        limit (int): The number of rows to return.
+
+    Returns:
+        list: One dictionary per product or user, best first. The
+        ``deleted`` flag marks the sales without one (id 0) and the ids
+        of products or users deleted since the last rebuild, whose name
+        is None.
+    """
+    model, key, target, name = {
+        'product': (SalesDailyProduct, SalesDailyProduct.product_id,
+                    Product, Product.product_name),
+        'user': (SalesDailyUser, SalesDailyUser.user_id, User,
+                 User.user_name),
+    }[dimension]
+    ranked = (select(key.label('id'), *_measures(model))
+              .where(*_day_filter(model.day, start, end))
+              .group_by(key)
+              .order_by(func.sum(getattr(model, order)).desc())
+              .limit(limit).subquery())
+    rows = db.session.execute(
+        select(ranked, name.label('name'))
+        .outerjoin(target, target.id == ranked.c.id)
+        .order_by(ranked.c[order].desc()))
+    return [{f'{dimension}_id': row.id, f'{dimension}_name': row.name,
+             'deleted': row.name is None, **_totals(row)} for row in rows]
+
+
+def top_customers(order='revenue', limit=10):
+    """ Rank the customers by their lifetime sales.
+
+    Parameters:
+        order (str): The measure to rank by: 'revenue', 'quantity' or
+        'sale_count'.
+        limit (int): The number of customers to return.
+
+    Returns:
+        list: One dictionary per customer, best first, leaving out the
+        sales of deleted customers.
+    """
+    rows = db.session.execute(
+        select(CustomerLifetime, Customer.customer_name,
+               Customer.customer_email)
+        .join(Customer, Customer.id == CustomerLifetime.customer_id)
+        .order_by(getattr(CustomerLifetime, order).desc())
+        .limit(limit))
+    return [{'customer_id': lifetime.customer_id,
+             'customer_name': name,
+             'customer_email': email,
+             'sale_count': lifetime.sale_count,
+             'quantity': lifetime.quantity,
+             'revenue': lifetime.revenue,
+             'first_sale': (lifetime.first_sale.isoformat()
+                            if lifetime.first_sale else None),
+             'last_sale': (lifetime.last_sale.isoformat()
+                           if lifetime.last_sale else None)}
+            for lifetime, name, email in rows]
+
+
+def stock_turnover(start, end, limit=10):
+    """ Compare the units sold in a day range with the stock left.
+
+    Parameters:
+        start (str): ISO date of the first included day.
+        end (str): ISO date of the last included day.
+        limit (int): The number of products to return, fastest moving
+        first.
+
+    Returns:
+        list: One dictionary per product with the units sold, the stock
+        left, the turnover (units sold per unit in stock) and the days
+        the stock lasts at the range's selling rate.
+    """
+    days = (date.fromisoformat(end) - date.fromisoformat(start)).days + 1
+    if days < 1:
+        raise ValueError('end is before start')
+    rows = revenue_by('product', start, end, order='quantity', limit=limit)
+    stock = dict(db.session.execute(
+        select(Product.id, Product.product_quantity)
+        .where(Product.id.in_([row['product_id'] for row in rows]))).all())
+    for row in rows:
+        left = stock.get(row['product_id'])
+        row['stock'] = left
+        row['turnover'] = (round(row['quantity'] / left, 4)
+                           if left else None)
+        row['days_of_stock'] = (round(left * days / row['quantity'], 1)
+                                if left is not None and row['quantity']
+                                else None)
+    return rows
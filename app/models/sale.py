@@ -1,5 +1,6 @@
 """sale modules to create table"""
 from app.extensions import db
+from app.search import search as full_text_search
 from datetime import datetime
 import pytz
 
@@ -15,12 +16,23 @@ class Sale(db.Model):
         customer_email (String): The email address of the customer.
         customer_phone (String): The phone number of the customer.
         user_name (String): The name of the user who processed the sale.
+        product_id (Integer): Foreign key to the product sold.
+        customer_id (Integer): Foreign key to the customer.
+        user_id (Integer): Foreign key to the user who processed the sale.
+        unit_price (Integer): The product price when the sale was written.
         date (DateTime): The date when the sale record was created.
 
     Methods: __repr__():
     Returns a string representation of the sale object.
     """
     __tablename__ = 'sales'
+    __table_args__ = (
+        db.Index('ix_sales_date_id', 'date', 'id'),
+        db.Index('ix_sales_customer_email', 'customer_email'),
+        db.Index('ix_sales_product_id', 'product_id'),
+        db.Index('ix_sales_customer_id', 'customer_id'),
+        db.Index('ix_sales_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(200), nullable=False)
     product_quantity = db.Column(db.Integer, nullable=False)
@@ -28,7 +40,14 @@ class Sale(db.Model):
     customer_email = db.Column(db.String(200), nullable=False)
     customer_phone = db.Column(db.String(15))
     user_name = db.Column(db.String(200), nullable=False)
-    date = db.Column(db.DateTime, default=datetime.now(pytz.UTC))
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id',
+                                                     ondelete='SET NULL'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id',
+                                                      ondelete='SET NULL'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id',
+                                                  ondelete='SET NULL'))
+    unit_price = db.Column(db.Integer)
+    date = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))
 
     def __repr__(self):
         """Returns a string representation of the sale object.
@@ -39,23 +58,34 @@ class Sale(db.Model):
         return ('<sale id %r product name %r>'
                 % self.id % self.product_name)
 
+    def to_dict(self):
+        """Returns the sale as a JSON-compatible dictionary.
+
+        Returns:
+            dict: The sale columns, with the date in ISO format.
+        """
+        return {"id": self.id,
+                "product_name": self.product_name,
+                "product_quantity": self.product_quantity,
+                "customer_name": self.customer_name,
+                "customer_email": self.customer_email,
+                "customer_phone": self.customer_phone,
+                "user_name": self.user_name,
+                "product_id": self.product_id,
+                "customer_id": self.customer_id,
+                "user_id": self.user_id,
+                "unit_price": self.unit_price,
+                "date": self.date.isoformat() if self.date else None}
+
 
 def get_sales(search):
-    """Searches for sales in the database using a search pattern.
+    """Searches for sales through the full-text index.
 
     Parameters:
         search: The search string to look for in sale records.
 
     Returns:
-        list: A list of sale objects matching the search criteria.
+        list: The sale objects matching every search word as
+        a prefix, best match first, at most SEARCH_LIMIT of them.
     """
-    search_pattern = f"%{search}"
-    results = Sale.query.filter(
-        (Sale.id.like(search_pattern))
-        | (Sale.product_name.like(search_pattern))
-        | (Sale.customer_name.like(search_pattern))
-        | (Sale.customer_email.like(search_pattern))
-        | (Sale.user_name.like(search_pattern))
-        | (Sale.date.like(search_pattern))
-    ).all()
-    return results
+    return full_text_search(Sale, search)
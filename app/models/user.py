@@ -5,10 +5,12 @@ import pytz
 from flask_security import UserMixin, RoleMixin
 import uuid
 import secrets
-from sqlalchemy.orm import aliased
+from app.search import search as full_text_search
+from app.lookups import register_lookup
 
 
 fs_uniquifier_value = str(uuid.uuid4())
+DEFAULT_ROLES = ['admin', 'editor', 'supervisor']
 
 
 def generate_unique_value():
@@ -36,6 +38,9 @@ class User(db.Model, UserMixin):
         __repr__(): Returns a string representation of the user object.
     """
     __tablename__ = 'user'
+    __table_args__ = (
+        db.Index('ix_user_user_name_id', 'user_name', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_name = db.Column(db.String(200), nullable=False)
     user_email = db.Column(db.String(200), nullable=False)
@@ -44,7 +49,7 @@ class User(db.Model, UserMixin):
     active = db.Column(db.Boolean(), default=True)
     roles = db.relationship('Role', secondary='user_roles',
                             backref='roled')
-    date = db.Column(db.DateTime, default=datetime.now(pytz.UTC))
+    date = db.Column(db.DateTime, default=lambda: datetime.now(pytz.UTC))
     fs_uniquifier = db.Column(db.String(90), nullable=False,
                               unique=True,
                               default=generate_unique_value)
@@ -57,6 +62,21 @@ class User(db.Model, UserMixin):
         """
         return f'<User "{self.user_name}">'
 
+    def to_dict(self):
+        """Returns the user as a JSON-compatible dictionary.
+
+        The password hash and fs_uniquifier are left out.
+
+        Returns:
+            dict: The public user columns and role names.
+        """
+        return {"id": self.id,
+                "user_name": self.user_name,
+                "user_email": self.user_email,
+                "user_phone": self.user_phone,
+                "roles": [role.name for role in self.roles],
+                "date": self.date.isoformat() if self.date else None}
+
 
 class Role(db.Model, RoleMixin):
     """Role model representing the 'role' table in the database.
@@ -98,37 +118,40 @@ class UserRoles(db.Model):
                                                   ondelete='CASCADE'))
 
 
+register_lookup('user', User.user_name)
+
+
 def create_roles():
-    """Create default roles and add them to the database."""
-    admin = Role(name='admin')
-    editor = Role(name='editor')
-    supervisor = Role(name='supervisor')
-    try:
-        db.session.add(admin)
-        db.session.add(editor)
-        db.session.add(supervisor)
-        db.session.commit()
-    except:
-        return "fail to add roles to database"
+    """ Add the default roles that are missing from the database.
+
+    Safe to run any number of times; existing roles are left untouched.
+
+    Returns:
+        list: The names of the roles that were added.
+    """
+    existing = set(db.session.scalars(
+        db.select(Role.name).where(Role.name.in_(DEFAULT_ROLES))))
+    added = [name for name in DEFAULT_ROLES if name not in existing]
+    db.session.add_all([Role(name=name) for name in added])
+    db.session.commit()
+    return added
 
 
 def get_user(search):
-    """Searches for users in the database using a search pattern.
+    """Searches for users through the full-text index.
+
+    A search equal to a role name also returns the users holding that
+    role, found through the user_roles join rather than a cross join.
 
     Parameters:
         search (str): The search string to look for in user records.
 
     Returns:
-        list: A list of user objects matching the search criteria.
+        list: The user objects matching every search word as a prefix,
+        best match first, at most SEARCH_LIMIT of them.
     """
-    search_pattern = f"%{search}"
-    RoleAlias = aliased(Role)
-    results = User.query.filter(
-        (User.id.like(search_pattern))
-        | (User.user_name.like(search_pattern))
-        | (User.user_email.like(search_pattern))
-        | (User.user_phone.like(search_pattern))
-        | (RoleAlias.name.like(search_pattern))
-        | (User.date.like(search_pattern))
-    ).all()
-    return results
+    role_user_ids = db.session.scalars(
+        db.select(UserRoles.user_id)
+        .join(Role, Role.id == UserRoles.role_id)
+        .where(Role.name == search.strip().lower())).all()
+    return full_text_search(User, search, extra_ids=role_user_ids)
@@ -0,0 +1,150 @@
+"""Keyset (cursor) pagination for the list views"""
+import base64
+import json
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """ One page of a keyset-paginated query.
+
+    Attributes:
+        items (list): The rows on this page.
+        per_page (Integer): The requested page size.
+        cursor (String): The cursor this page was loaded from, or None for
+        the first page.
+        next_cursor (String): The cursor of the following page, or None on
+        the last page.
+    """
+
+    def __init__(self, items, per_page, cursor, next_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        """Whether another page follows this one."""
+        return self.next_cursor is not None
+
+    def to_dict(self):
+        """Returns the page as a JSON-compatible dictionary.
+
+        Returns:
+            dict: The serialized items and the cursors around them.
+        """
+        return {"items": [item.to_dict() for item in self.items],
+                "per_page": self.per_page,
+                "cursor": self.cursor,
+                "next_cursor": self.next_cursor}
+
+
+def encode_cursor(values):
+    """ Serialize the sort key of the last row of a page into a cursor.
+
+    Parameters:
+        values (list): The sort column values of the row.
+
+    Returns:
+        str: A URL-safe cursor string.
+    """
+    payload = [value.isoformat() if isinstance(value, datetime) else value
+               for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """ Parse a cursor back into typed sort key values.
+
+    Parameters:
+        cursor (str): A cursor produced by ``encode_cursor``.
+        columns (list): The sort columns the cursor was built from.
+
+    Returns:
+        list: The sort key values, or None if the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [datetime.fromisoformat(value)
+                if column.type.python_type is datetime and value is not None
+                else value
+                for value, column in zip(values, columns)]
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def _after(order, values):
+    """ Build the WHERE clause selecting rows that sort after ``values``.
+
+    For keys (a, b) this is ``a > x OR (a = x AND b > y)`` with ``<`` for
+    descending columns, which every backend can answer from a composite
+    index on the sort columns.
+
+    Parameters:
+        order (list): (column, descending) pairs.
+        values (list): The sort key of the last row already shown.
+
+    Returns:
+        ClauseElement: The keyset predicate.
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        beyond = column < values[i] if descending else column > values[i]
+        equal = [order[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def get_page_args():
+    """ Read the cursor and page size of a list request.
+
+    Returns:
+        tuple: (cursor or None, per_page clamped to MAX_PER_PAGE).
+    """
+    per_page = request.args.get('per_page',
+                                current_app.config['PER_PAGE'], type=int)
+    per_page = max(1, min(per_page, current_app.config['MAX_PER_PAGE']))
+    return request.args.get('cursor') or None, per_page
+
+
+def paginate_keyset(query, order, cursor=None, per_page=None):
+    """ Load one page of ``query`` ordered by ``order`` after ``cursor``.
+
+    The cost of a page does not depend on its position: the query seeks
+    directly past the last row of the previous page instead of counting
+    rows with OFFSET.
+
+    Parameters:
+        query: The SQLAlchemy query to paginate.
+        order (list): (column, descending) pairs; the last column must be
+        unique, e.g. the primary key.
+        cursor (str): The cursor of the page to load, None for the first.
+        per_page (int): The page size; taken from the request when None.
+
+    Returns:
+        KeysetPage: The requested page.
+    """
+    if per_page is None:
+        cursor, per_page = get_page_args()
+    columns = [column for column, _ in order]
+    values = decode_cursor(cursor, columns) if cursor else None
+    if values is not None:
+        query = query.filter(_after(order, values))
+    else:
+        cursor = None
+    query = query.order_by(*[column.desc() if descending else column.asc()
+                             for column, descending in order])
+    rows = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key)
+                                     for column in columns])
+    return KeysetPage(rows, per_page, cursor, next_cursor)
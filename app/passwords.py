@@ -0,0 +1,124 @@
+"""Password hashing with a configurable bcrypt cost
+
+Hashes are created with BCRYPT_LOG_ROUNDS rounds. A successful login
+whose stored hash used another cost is rehashed with the current one, so
+raising (or lowering) the cost takes effect user by user without a reset.
+
+bcrypt is deliberately slow and holds a core for the whole check, so
+during a login storm verifications are sent to a pool of
+PASSWORD_WORKERS processes. At most PASSWORD_QUEUE_SIZE of them wait or
+run at once; further logins are turned away at once instead of tying up
+request threads that dashboards need. With PASSWORD_WORKERS = 0 the check
+runs in the request thread.
+"""
+import hmac
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+import bcrypt as _bcrypt
+from flask import current_app
+from app.extensions import bcrypt
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many password checks are already queued."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+
+def _check(password, hashed):
+    """Compare a password with a bcrypt hash; runs in a pool process."""
+    try:
+        return hmac.compare_digest(_bcrypt.hashpw(password, hashed), hashed)
+    except ValueError:
+        # malformed hash, or a password longer than bcrypt's 72 bytes
+        return False
+
+
+def _get_pool(config):
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs import threads could copy
+            # held locks into the workers
+            _pool = ProcessPoolExecutor(
+                max_workers=config['PASSWORD_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'))
+            _slots = threading.BoundedSemaphore(config['PASSWORD_QUEUE_SIZE'])
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the verification processes, e.g. at the end of a benchmark."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def hash_password(password):
+    """ Hash a password with the configured cost.
+
+    Parameters:
+        password (str): The plain password.
+
+    Returns:
+        str: The bcrypt hash.
+    """
+    return bcrypt.generate_password_hash(
+        password, current_app.config['BCRYPT_LOG_ROUNDS']).decode('utf-8')
+
+
+def hash_cost(hashed):
+    """Return the cost (log2 rounds) of a bcrypt hash, None if unreadable."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed):
+    """Return whether a hash was made with another cost than configured."""
+    return hash_cost(hashed) != current_app.config['BCRYPT_LOG_ROUNDS']
+
+
+def verify_password(password, hashed):
+    """ Check a password against its stored hash.
+
+    Parameters:
+        password (str): The candidate password.
+        hashed (str): The stored bcrypt hash.
+
+    Returns:
+        bool: True if the password matches.
+
+    Raises:
+        PasswordServiceBusy: If PASSWORD_QUEUE_SIZE checks are already
+        pending, or the check did not finish within
+        PASSWORD_VERIFY_TIMEOUT seconds.
+    """
+    if hash_cost(hashed) is None:
+        return False
+    password, hashed = password.encode('utf-8'), hashed.encode('utf-8')
+    config = current_app.config
+    if not config['PASSWORD_WORKERS']:
+        return _check(password, hashed)
+    pool = _get_pool(config)
+    if not _slots.acquire(blocking=False):
+        raise PasswordServiceBusy()
+    try:
+        future = pool.submit(_check, password, hashed)
+    except BaseException:
+        _slots.release()
+        raise
+    # the slot is held until the check ends, even if the request gave up
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=config['PASSWORD_VERIFY_TIMEOUT'])
+    except FutureTimeout:
+        raise PasswordServiceBusy()
@@ -0,0 +1,108 @@
+"""Connection pool metrics for every engine of the application
+
+``init_pool_metrics`` attaches pool event listeners to the primary and
+replica engines and times each checkout, so ``pool_stats`` can report,
+per engine, the connections checked out and in, the overflow in use, the
+connections opened and invalidated (e.g. by a failed pre-ping after a
+"MySQL server has gone away") and the time requests waited for a
+connection.
+"""
+import threading
+import time
+from collections import Counter
+from sqlalchemy import event
+
+
+_metrics = {}
+_lock = threading.Lock()
+
+
+def _time_checkouts(name, pool):
+    """Wrap ``pool.connect`` to measure the wait for a connection."""
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            waited = time.perf_counter() - started
+            with _lock:
+                counters = _metrics[name]
+                counters['wait_seconds'] += waited
+                counters['max_wait_seconds'] = max(
+                    counters['max_wait_seconds'], waited)
+    pool.connect = timed_connect
+
+
+def _watch_engine(name, engine):
+    """Register the pool listeners of one engine."""
+    _metrics[name] = Counter(wait_seconds=0.0, max_wait_seconds=0.0)
+    _time_checkouts(name, engine.pool)
+
+    def count(key):
+        def listener(*args):
+            with _lock:
+                _metrics[name][key] += 1
+        return listener
+
+    event.listen(engine, 'connect', count('connections_opened'))
+    event.listen(engine, 'checkout', count('checkouts'))
+    event.listen(engine, 'invalidate', count('invalidations'))
+
+    @event.listens_for(engine, 'engine_disposed')
+    def _rewrap(engine):
+        _time_checkouts(name, engine.pool)
+
+
+def init_pool_metrics(engines):
+    """ Start collecting pool metrics for the engines of an application.
+
+    Parameters:
+        engines (dict): bind key (None for the primary) -> engine, as
+        returned by ``db.engines``.
+    """
+    for key, engine in engines.items():
+        _watch_engine(key or 'primary', engine)
+
+
+def pool_stats(engines):
+    """ Return the pool metrics of every engine.
+
+    Parameters:
+        engines (dict): bind key -> engine, as returned by ``db.engines``.
+
+    Returns:
+        dict: engine name -> size, checked_out, checked_in, overflow,
+        connections_opened, checkouts, invalidations, wait_seconds,
+        mean_wait_ms and max_wait_ms.
+    """
+    stats = {}
+    for key, engine in engines.items():
+        name = key or 'primary'
+        pool = engine.pool
+        with _lock:
+            counters = dict(_metrics.get(name, {}))
+        checkouts = counters.get('checkouts', 0)
+        wait = counters.get('wait_seconds', 0.0)
+        stats[name] = {
+            'pool': type(pool).__name__,
+            'size': _call(pool, 'size'),
+            'checked_out': _call(pool, 'checkedout'),
+            'checked_in': _call(pool, 'checkedin'),
+            'overflow': _call(pool, 'overflow'),
+            'connections_opened': counters.get('connections_opened', 0),
+            'checkouts': checkouts,
+            'invalidations': counters.get('invalidations', 0),
+            'wait_seconds': round(wait, 6),
+            'mean_wait_ms': round(wait / checkouts * 1000, 3)
+            if checkouts else None,
+            'max_wait_ms': round(
+                counters.get('max_wait_seconds', 0.0) * 1000, 3)}
+    return stats
+
+
+def _call(pool, method):
+    """Return ``pool.method()``, or None for pools without it."""
+    method = getattr(pool, method, None)
+    return method() if method is not None else None
@@ -1,42 +1,54 @@
 from flask import render_template
-from flask import render_template, url_for, request, redirect, Response
+from flask import render_template, url_for, request, redirect
 from flask_security import roles_accepted
 from app.products import bp
 from app.extensions import db
 from flask import jsonify
-import io
-import csv
-import json
 import os
+import uuid
 from werkzeug.utils import secure_filename
-from sqlalchemy import inspect
 
 
 from app.models.product import Product, get_product
-from app.import_export.export_product import export_product_json
-from app.import_export.import_sale import allowed_file
-from app.import_export.import_product import (parse_products_csv_file,
-                                              parse_products_json_file)
+from app.pagination import paginate_keyset
+from app.fragments import json_table_page, render_table_page
+from app.import_export.export_product import PRODUCT_EXPORT_COLUMNS
+from app.import_export.stream_export import (EXPORT_FORMATS,
+                                             export_filter,
+                                             export_response,
+                                             negotiate_encoding)
+from app.import_export.jobs import allowed_file, submit_import
+from app.lookups import lookup_id
+from app.routing import read_only
 
 
 @bp.route('/', methods=['GET'])
 @roles_accepted('admin', 'editor', 'supervisor')
+@read_only
 def index():
-    """ Display the list of products.
+    """ Display one page of the list of products.
 
     Methods:
-        GET: Retrieve and display all product records, ordered by
-        product name.
+        GET: Retrieve and display a page of product records, ordered by
+        product name. ``cursor`` and ``per_page`` select the page and
+        ``format=json`` returns it as JSON.
 
-    Returns: Template: Render the products/index.html template with
-    product data.
+    Returns: Template or JSON response: Render the products/index.html
+    template with product data, or the page as JSON.
     """
-    products = Product.query.order_by(Product.product_name).all()
-    return render_template('products/index.html', products=products)
+    def load_page():
+        return paginate_keyset(Product.query, [(Product.product_name, False),
+                                               (Product.id, False)])
+
+    if request.args.get('format') == 'json':
+        return json_table_page(['products'], load_page)
+    return render_table_page('products/index.html', 'products/_table.html',
+                             ['products'], load_page, 'products')
 
 
 @bp.route('/search_product/', methods=['GET', 'POST'])
 @roles_accepted('admin', 'editor', 'supervisor')
+@read_only
 def search_product():
     """ Search for products based on a search string.
 
@@ -70,9 +82,7 @@ def add_product():
         product_name = request.form['product']
         price = request.form['price']
         product_quantity = request.form['quantity']
-        existing_product = Product.query.filter_by(product_name=product_name
-                                                   ).first()
-        if existing_product:
+        if lookup_id('product', product_name) is not None:
             return "This product is already in the store, try update it!"
         new_product = Product(product_name=product_name, price=price,
                               product_quantity=product_quantity)
@@ -152,37 +162,33 @@ def update_product(id):
 
 @bp.route('/download_products')
 @roles_accepted('admin', 'editor')
+@read_only
 def download_products():
-    """ Download product data in the specified format (CSV or JSON).
+    """ Download product data as CSV, NDJSON, JSON, Parquet or Arrow.
 
     Methods:
-        GET: Retrieve product data and export it in the specified format.
+        GET: Stream product data in the specified format, limited to the
+        ``start``/``end`` date range and to the rows above ``since_id``
+        or dated after ``since`` when given. The body is compressed with
+        zstd or gzip as Accept-Encoding allows (always gzip with
+        ``gzip=1``), and an unchanged export answers 304 to
+        If-None-Match or If-Modified-Since.
 
     Returns:
-        Response: A response containing the product data file for
-        download.
+        Response: A streamed response containing the product data file
+        for download.
     """
     format = request.args.get('format')
-    products_dict = export_product_json()
-
-    if format == 'csv':
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(products_dict[0].keys())
-        for row in products_dict:
-            writer.writerow(row.values())
-        output.seek(0)
-        response = Response(output, mimetype='test/csv')
-        response.headers['Content-Disposition'] = 'attachment; \
-            filename=products.csv'
-    elif format == 'json':
-        json_data = json.dumps(products_dict, indent=4)
-        response = Response(json_data, mimetype='application/json')
-        response.headers['Content-Disposition'] = 'attachment; \
-            filename=products.json'
-    else:
+    if format not in EXPORT_FORMATS:
         return "Invalid format", 400
-    return response
+    try:
+        where = export_filter(Product.id, Product.date, request.args)
+    except ValueError:
+        return "Invalid export range", 400
+    return export_response(PRODUCT_EXPORT_COLUMNS, 'products', format, where,
+                           date_column=Product.date,
+                           encoding=negotiate_encoding(
+                               request.args.get('gzip') == '1'))
 
 
 @bp.route('/upload_product', methods=['POST', 'GET'])
@@ -209,20 +215,13 @@ def upload_products():
 
         if uploaded_file and allowed_file(uploaded_file.filename):
             filename = secure_filename(uploaded_file.filename)
-            extention = filename.rsplit('.', 1)[1].lower()
-            file_path = os.path.join('uploads/', filename)
+            file_path = os.path.join('uploads/',
+                                     f'{uuid.uuid4().hex}_{filename}')
             uploaded_file.save(file_path)
-            filename.rsplit('.', 1)[1].lower()
-            if extention == 'json':
-                msg = parse_products_json_file(file_path)
-                return msg
-            elif extention == 'csv':
-                inspector = inspect(db.engine)
-                msg = parse_products_csv_file(inspector, file_path)
-                return msg
-            else:
-                pass
-            return redirect(url_for('products.index'))
+            job = submit_import('products', file_path, filename)
+            return jsonify({"job_id": job.id,
+                            "status_url": url_for('imports.job_status',
+                                                  id=job.id)}), 202
         else:
             return jsonify({"error": "File not allowed"}), 400
     return render_template('upload_product')
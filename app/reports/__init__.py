@@ -0,0 +1,7 @@
+from flask import Blueprint
+
+
+bp = Blueprint('reports', __name__)
+
+
+from app.reports import routes
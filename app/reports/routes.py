@@ -0,0 +1,212 @@
+from flask import jsonify, request
+from flask_security import roles_accepted
+from app.reports import bp
+from app.models.rollup import (revenue_by, revenue_by_day, stock_turnover,
+                               top_customers)
+from app.routing import read_only
+
+
+# The analytics views import pandas when first called, not at startup
+ORDERS = ('revenue', 'quantity', 'sale_count')
+GROUPS = ('day', 'product', 'user')
+PERIODS = ('M', 'W')
+
+
+def _limit():
+    # at least 1: a negative LIMIT means all rows on SQLite, an error on
+    # MySQL, and counts from the end in pandas
+    return max(1, min(request.args.get('limit', 10, type=int), 1000))
+
+
+@bp.route('/revenue', methods=['GET'])
+@roles_accepted('admin', 'supervisor')
+@read_only
+def revenue():
+    """ Report the sales of a date range from the rollups.
+
+    Methods:
+        GET: ``group=day`` (the default) returns the totals of every day
+        between ``start`` and ``end`` (ISO dates, both included);
+        ``group=product`` or ``group=user`` returns the ``limit`` best
+        products or users ranked by ``order`` (revenue, quantity or
+        sale_count).
+
+    Returns:
+        JSON response: The report rows.
+    """
+    group = request.args.get('group', 'day')
+    order = request.args.get('order', 'revenue')
+    if group not in GROUPS or order not in ORDERS:
+        return jsonify({"error": "Invalid group or order"}), 400
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        if group == 'day':
+            return jsonify(revenue_by_day(start, end))
+        return jsonify(revenue_by(group, start, end, order, _limit()))
+    except ValueError:
+        return jsonify({"error": "Invalid date range"}), 400
+
+
+@bp.route('/customers', methods=['GET'])
+@roles_accepted('admin', 'supervisor')
+@read_only
+def customers():
+    """ Report the customers with the highest lifetime value.
+
+    Methods:
+        GET: Return the ``limit`` best customers ranked by ``order``
+        (revenue, quantity or sale_count).
+
+    Returns:
+        JSON response: The report rows.
+    """
+    order = request.args.get('order', 'revenue')
+    if order not in ORDERS:
+        return jsonify({"error": "Invalid order"}), 400
+    return jsonify(top_customers(order, _limit()))
+
+
+@bp.route('/stock_turnover', methods=['GET'])
+@roles_accepted('admin', 'supervisor')
+@read_only
+def turnover():
+    """ Report the fastest selling products against their stock.
+
+    Methods:
+        GET: Return, for the ``limit`` products selling the most units
+        between ``start`` and ``end`` (required ISO dates), the units
+        sold, the stock left, the turnover and the days of stock left.
+
+    Returns:
+        JSON response: The report rows.
+    """
+    try:
+        return jsonify(stock_turnover(request.args.get('start', ''),
+                                      request.args.get('end', ''),
+                                      _limit()))
+    except ValueError:
+        return jsonify({"error": "Invalid date range"}), 400
+
+
+@bp.route('/cohorts', methods=['GET'])
+@roles_accepted('admin', 'supervisor')
+@read_only
+def customer_cohorts():
+    """ Report the customer retention of each acquisition cohort.
+
+    Methods:
+        GET: Group the customers by the month (``period=M``, the default)
+        or week (``period=W``) of their first purchase and count, for each
+        following period, how many of them bought again.
+
+    Returns:
+        JSON response: cohort -> list of active customers per period
+        since the first purchase.
+    """
+    from app.analytics import cohorts, load_sales
+    period = request.args.get('period', 'M')
+    if period not in PERIODS:
+        return jsonify({"error": "Invalid period"}), 400
+    table = cohorts(load_sales(), period)
+    return jsonify({str(cohort): [int(count) for count in row]
+                    for cohort, row in table.iterrows()})
+
+
+@bp.route('/rfm', methods=['GET'])
+@roles_accepted('admin', 'supervisor')
+@read_only
+def rfm_segments():
+    """ Report the RFM (recency, frequency, monetary) customer segments.
+
+    Methods:
+        GET: Return, per segment, the number of customers, their mean
+        recency in days, mean number of sales and total revenue, and the
+        ``limit`` most valuable customers of the requested ``segment``.
+
+    Returns:
+        JSON response: The segment summary and customers.
+    """
+    from app.analytics import load_sales, rfm
+    table = rfm(load_sales())
+    summary = table.groupby('segment').agg(
+        customers=('frequency', 'size'), recency=('recency', 'mean'),
+        frequency=('frequency', 'mean'), monetary=('monetary', 'sum'))
+    segment = request.args.get('segment')
+    customers = []
+    if segment:
+        top = (table[table['segment'] == segment]
+               .nlargest(_limit(), 'monetary'))
+        customers = [{'customer_id': int(customer_id),
+                      'recency': int(row.recency),
+                      'frequency': int(row.frequency),
+                      'monetary': int(row.monetary),
+                      'score': f'{row.r}{row.f}{row.m}'}
+                     for customer_id, row in zip(top.index,
+                                                 top.itertuples())]
+    return jsonify({
+        'segments': {name: {'customers': int(row.customers),
+                            'recency': round(float(row.recency), 1),
+                            'frequency': round(float(row.frequency), 2),
+                            'monetary': int(row.monetary)}
+                     for name, row in summary.iterrows()},
+        'customers': customers})
+
+
+@bp.route('/moving_average', methods=['GET'])
+@roles_accepted('admin', 'supervisor')
+@read_only
+def units_moving_average():
+    """ Report the units sold per day and their moving average.
+
+    Methods:
+        GET: Average the daily units over ``window`` days (default 7),
+        for every product or only ``product_id``, between ``start`` and
+        ``end`` (ISO dates).
+
+    Returns:
+        JSON response: One row per day.
+    """
+    from app.analytics import load_sales, moving_average
+    window = request.args.get('window', 7, type=int)
+    if not 1 <= window <= 366:
+        return jsonify({"error": "Invalid window"}), 400
+    table = moving_average(load_sales(), window,
+                           request.args.get('product_id', type=int))
+    try:
+        table = table.loc[request.args.get('start'):request.args.get('end')]
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid date range"}), 400
+    return jsonify([{'day': day.date().isoformat(),
+                     'quantity': int(row.quantity),
+                     'moving_average': round(float(row.moving_average), 3)}
+                    for day, row in table.iterrows()])
+
+
+@bp.route('/stock_forecast', methods=['GET'])
+@roles_accepted('admin', 'supervisor')
+@read_only
+def stock_out_forecast():
+    """ Report the products expected to run out of stock first.
+
+    Methods:
+        GET: Measure each product's selling rate over the last ``window``
+        days of sales (default 28) and return the ``limit`` products whose
+        stock runs out the soonest.
+
+    Returns:
+        JSON response: One row per product.
+    """
+    from pandas import isnull
+    from app.analytics import load_sales, stock_forecast
+    window = request.args.get('window', 28, type=int)
+    if not 1 <= window <= 366:
+        return jsonify({"error": "Invalid window"}), 400
+    table = stock_forecast(load_sales(), window).head(_limit())
+    return jsonify([{'product_id': int(product_id),
+                     'stock': int(row.stock),
+                     'daily_rate': round(float(row.daily_rate), 3),
+                     'days_left': round(float(row.days_left), 1),
+                     'stockout_date': (row.stockout_date.date().isoformat()
+                                       if not isnull(row.stockout_date)
+                                       else None)}
+                    for product_id, row in table.iterrows()])
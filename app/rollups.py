@@ -0,0 +1,230 @@
+"""Sales rollups for the reports, maintained incrementally
+
+The reports read revenue by day, product, user and customer from
+pre-aggregated tables instead of scanning the sales table. Every ORM flush
+adds the sales it inserts to the rollups and subtracts the ones it deletes
+(an update is both) inside the same transaction, and the bulk import
+writers call ``apply_sales`` for the rows they write with core statements.
+``rebuild_rollups`` recomputes every rollup from the sales table with one
+GROUP BY each.
+
+Revenue is valued at ``sales.unit_price``, the product price copied onto
+the sale when it is written, so a later price change does not rewrite past
+revenue and deleting a sale subtracts exactly what it added. Sales
+without a product, user or customer (a NULL foreign key) are rolled up
+under id 0. Deleting a product, user or customer does not move its rows:
+they stay under the old id, which the reports flag as deleted, until a
+rebuild folds them into id 0 (where the database enforces ON DELETE SET
+NULL; SQLite does not, and keeps the old id). A customer's first and last
+sale dates only ever widen incrementally; they are exact again after a
+rebuild.
+"""
+import importlib
+from collections import defaultdict
+from datetime import datetime
+import pytz
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.product import Product
+from app.models.rollup import (CustomerLifetime, SalesDaily,
+                               SalesDailyProduct, SalesDailyUser)
+from app.models.sale import Sale
+
+
+# Sale attributes the rollups are computed from
+ROLLED_UP = ('product_id', 'customer_id', 'user_id', 'product_quantity',
+             'unit_price', 'date')
+MEASURES = ('sale_count', 'quantity', 'revenue')
+# Daily rollup table -> the sale column keying its rows besides the day
+DAILY = {SalesDaily.__table__: None,
+         SalesDailyProduct.__table__: 'product_id',
+         SalesDailyUser.__table__: 'user_id'}
+
+
+def _aggregate(signed_sales):
+    """ Sum signed sales into per-row deltas of every rollup.
+
+    Parameters:
+        signed_sales (iterable): (sign, sale values) pairs, sign being 1
+        for an added sale and -1 for a removed one.
+
+    Returns:
+        dict: rollup table -> list of rows holding the keys and the
+        measure deltas.
+    """
+    daily = {table: defaultdict(lambda: [0, 0, 0]) for table in DAILY}
+    customers = defaultdict(lambda: [0, 0, 0, None, None])
+    for sign, sale in signed_sales:
+        quantity = int(sale['product_quantity'] or 0)
+        deltas = (sign, sign * quantity,
+                  sign * quantity * int(sale['unit_price'] or 0))
+        date = sale['date'] or datetime.now(pytz.UTC)
+        for table, column in DAILY.items():
+            key = (date.date(),) if column is None else (
+                date.date(), sale[column] or 0)
+            totals = daily[table][key]
+            for index, delta in enumerate(deltas):
+                totals[index] += delta
+        totals = customers[sale['customer_id'] or 0]
+        for index, delta in enumerate(deltas):
+            totals[index] += delta
+        if sign > 0:
+            date = date.replace(tzinfo=None)
+            totals[3] = min(totals[3] or date, date)
+            totals[4] = max(totals[4] or date, date)
+
+    rows = {}
+    for table, column in DAILY.items():
+        keys = ['day'] if column is None else ['day', column]
+        rows[table] = [dict(zip(keys + list(MEASURES), key + tuple(totals)))
+                       for key, totals in daily[table].items() if any(totals)]
+    rows[CustomerLifetime.__table__] = [
+        dict(zip(('customer_id',) + MEASURES + ('first_sale', 'last_sale'),
+                 (key, *totals)))
+        for key, totals in customers.items() if any(totals[:3])]
+    return rows
+
+
+def _upsert(connection, table, rows):
+    """ Add measure deltas to rollup rows, inserting the missing rows.
+
+    Parameters:
+        connection: The connection (or session) of the writing transaction.
+        table (Table): The rollup table.
+        rows (list): Rows holding the primary key and the measure deltas.
+    """
+    dialect = db.engine.dialect.name
+    # only the dialect in use is imported, not all three at startup
+    statement = importlib.import_module(
+        f'sqlalchemy.dialects.{dialect}').insert(table)
+    new = statement.inserted if dialect == 'mysql' else statement.excluded
+    values = {column: table.c[column] + new[column] for column in MEASURES}
+    if 'first_sale' in table.c:
+        least, greatest = ((func.min, func.max) if dialect == 'sqlite'
+                           else (func.least, func.greatest))
+        for column, pick in (('first_sale', least), ('last_sale', greatest)):
+            values[column] = pick(
+                func.coalesce(table.c[column], new[column]),
+                func.coalesce(new[column], table.c[column]))
+    if dialect == 'mysql':
+        statement = statement.on_duplicate_key_update(values)
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key],
+            set_=values)
+    connection.execute(statement, rows)
+
+
+def _apply(connection, signed_sales):
+    for table, rows in _aggregate(signed_sales).items():
+        if rows:
+            _upsert(connection, table, rows)
+
+
+def apply_sales(connection, sales, sign=1):
+    """ Add (or with sign -1 remove) sales to the rollups within the
+    caller's transaction.
+
+    Parameters:
+        connection: The connection (or session) of the writing transaction.
+        sales (iterable): Dictionaries holding the ROLLED_UP sale columns.
+        sign (int): 1 for written sales, -1 for deleted ones.
+    """
+    _apply(connection, ((sign, sale) for sale in sales))
+
+
+def _sale_values(sale, old=False):
+    """ Read the rolled up columns of a flushed sale.
+
+    Parameters:
+        sale (Sale): The sale instance.
+        old (bool): Return the values before the flush instead.
+
+    Returns:
+        dict: ROLLED_UP column -> value.
+    """
+    state = inspect(sale)
+    values = {}
+    for key in ROLLED_UP:
+        history = state.attrs[key].history
+        if old and (history.deleted or history.unchanged):
+            values[key] = (history.deleted or history.unchanged)[0]
+        else:
+            values[key] = state.dict.get(key)
+    return values
+
+
+@event.listens_for(Session, 'before_flush')
+def _price_sales(session, flush_context, instances):
+    """Copy the product price onto new sales and sales changing product."""
+    priced = []
+    for instance in session.new:
+        if isinstance(instance, Sale) and instance.unit_price is None:
+            priced.append(instance)
+    for instance in session.dirty:
+        if isinstance(instance, Sale):
+            state = inspect(instance)
+            if (state.attrs.product_id.history.has_changes()
+                    and not state.attrs.unit_price.history.has_changes()):
+                priced.append(instance)
+    for instance in session.deleted:
+        if isinstance(instance, Sale):
+            # load what the after_flush hook subtracts while the row exists
+            for key in ROLLED_UP:
+                getattr(instance, key)
+    ids = {sale.product_id for sale in priced} - {None}
+    if ids:
+        prices = dict(session.execute(
+            select(Product.id, Product.price).where(Product.id.in_(ids))).all())
+        for sale in priced:
+            sale.unit_price = prices.get(sale.product_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _roll_up_flushed_sales(session, flush_context):
+    """Apply the sale inserts, updates and deletes of a flush."""
+    signed = []
+    for instance in session.new:
+        if isinstance(instance, Sale):
+            signed.append((1, _sale_values(instance)))
+    for instance in session.deleted:
+        if isinstance(instance, Sale):
+            signed.append((-1, _sale_values(instance, old=True)))
+    for instance in session.dirty:
+        if isinstance(instance, Sale):
+            state = inspect(instance)
+            if any(state.attrs[key].history.has_changes()
+                   for key in ROLLED_UP):
+                signed.append((-1, _sale_values(instance, old=True)))
+                signed.append((1, _sale_values(instance)))
+    if signed:
+        _apply(session.connection(), signed)
+
+
+def rebuild_rollups(connection):
+    """ Recompute every rollup from the sales table.
+
+    Parameters:
+        connection: A SQLAlchemy connection inside a transaction.
+    """
+    sales = Sale.__table__
+    day = func.date(sales.c.date)
+    measures = [func.count(), func.sum(sales.c.product_quantity),
+                func.sum(sales.c.product_quantity
+                         * func.coalesce(sales.c.unit_price, 0))]
+    for table, column in DAILY.items():
+        keys = [day] if column is None else [
+            day, func.coalesce(sales.c[column], 0)]
+        names = ['day'] if column is None else ['day', column]
+        connection.execute(table.delete())
+        connection.execute(table.insert().from_select(
+            names + list(MEASURES),
+            select(*keys, *measures).group_by(*keys)))
+    table = CustomerLifetime.__table__
+    customer = func.coalesce(sales.c.customer_id, 0)
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(
+        ['customer_id', *MEASURES, 'first_sale', 'last_sale'],
+        select(customer, *measures, func.min(sales.c.date),
+               func.max(sales.c.date)).group_by(customer)))
@@ -0,0 +1,124 @@
+"""Read replica routing for the read-only views
+
+When a ``replica`` bind is configured (REPLICA_DATABASE_URI), views
+decorated with ``read_only`` run their SELECT statements on the replica
+engine. Writes, flushes and everything outside those views keep using the
+primary, and without a replica bind every statement goes to the primary.
+
+Reads stay consistent with the user's own writes: a request that commits
+a write pins the browser session to the primary for REPLICA_LAG_SECONDS,
+so the page shown after a form post never misses the row just written
+while the replica catches up.
+"""
+import sqlite3
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, session
+from sqlalchemy import event, literal, select
+from flask_sqlalchemy.session import Session
+
+
+REPLICA_BIND = 'replica'
+# Browser session key holding the time until which reads use the primary
+PRIMARY_UNTIL_KEY = '_primary_until'
+# Stands in for the SELECTs of a caller asking where they will run
+_READ_PROBE = select(literal(1))
+
+
+def read_only(view):
+    """ Mark a view as read-only so its queries may run on the replica.
+
+    Parameters:
+        view (callable): The view function.
+
+    Returns:
+        callable: The wrapped view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = session.get(PRIMARY_UNTIL_KEY, 0) <= time.time()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _is_read(clause):
+    """Return whether ``clause`` is a SELECT (ORM, core or text)."""
+    if clause is None:
+        return False
+    if getattr(clause, 'is_select', False):
+        return True
+    text = getattr(clause, 'text', None)
+    return (isinstance(text, str)
+            and text.lstrip().lower().startswith(('select', 'with')))
+
+
+class RoutingSession(Session):
+    """ Session sending the reads of read-only views to the replica.
+
+    Methods:
+        get_bind(): Return the replica engine for a SELECT issued by a
+        read-only view outside a flush, the primary otherwise, and note
+        when the primary receives a flush or a statement other than a
+        SELECT.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # without a clause (session.connection(), dialect lookups) the
+        # primary is returned, but nothing was written yet
+        if bind is None and (self._flushing or (clause is not None
+                                                and not _is_read(clause))):
+            self.info['wrote'] = True
+        elif (bind is None and has_request_context() and g.get('read_only')
+              and _is_read(clause)):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+def read_bind(db_session):
+    """ Return the engine the SELECT statements of a session run on now.
+
+    Parameters:
+        db_session: The SQLAlchemy session.
+
+    Returns:
+        Engine: The replica in a read-only view, the primary otherwise.
+    """
+    return db_session.get_bind(clause=_READ_PROBE)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_to_primary(db_session):
+    """Read from the primary for a while after the user's own write."""
+    if db_session.info.pop('wrote', False) and has_request_context():
+        session[PRIMARY_UNTIL_KEY] = (
+            time.time() + current_app.config['REPLICA_LAG_SECONDS'])
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _forget_write(db_session, previous_transaction):
+    db_session.info.pop('wrote', None)
+
+
+def sync_sqlite_replica(engines):
+    """ Copy a SQLite primary onto a SQLite replica file.
+
+    Local development and tests use two SQLite files as primary and
+    replica; this stands in for replication between them.
+
+    Parameters:
+        engines (dict): bind key -> engine, as returned by ``db.engines``.
+    """
+    primary, replica = engines[None], engines[REPLICA_BIND]
+    if {primary.dialect.name, replica.dialect.name} != {'sqlite'}:
+        raise ValueError('only SQLite databases can be copied')
+    replica.dispose()
+    source = sqlite3.connect(primary.url.database)
+    target = sqlite3.connect(replica.url.database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
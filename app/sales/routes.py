@@ -1,41 +1,54 @@
 from flask import (render_template, request, redirect, url_for,
-                   Response, get_flashed_messages)
+                   get_flashed_messages)
 from flask_security import roles_accepted
 from app.sales import bp
 from app.extensions import db
-import csv
-import io
-import json
 import os
+import uuid
 from werkzeug.utils import secure_filename
-from sqlalchemy import inspect
 from flask import jsonify
 from app.models.sale import Sale, get_sales
-from app.import_export.export_sale import export_sale_json
-from app.import_export.import_sale import (allowed_file, parse_sales_json_file,
-                                           parse_sales_csv_file)
-from app.models.product import Product
+from app.pagination import paginate_keyset
+from app.fragments import json_table_page, render_table_page
+from app.import_export.export_sale import SALE_EXPORT_COLUMNS
+from app.import_export.stream_export import (EXPORT_FORMATS,
+                                             export_filter,
+                                             export_response,
+                                             negotiate_encoding)
+from app.import_export.jobs import allowed_file, submit_import
+from app.models.product import reserve_stock, release_stock
 from app.models.customer import add_customer
+from app.lookups import lookup_id
+from app.routing import read_only
 
 
 @bp.route('/', methods=['GET'])
 @roles_accepted('admin', 'editor', 'supervisor')
+@read_only
 def index():
-    """ Display the list of sales.
+    """ Display one page of the list of sales.
 
     Methods:
-        GET: Retrieve and display all sale records, ordered by date in
-        descending order.
+        GET: Retrieve and display a page of sale records, ordered by date
+        in descending order. ``cursor`` and ``per_page`` select the page
+        and ``format=json`` returns it as JSON.
 
-    Returns: Template: Render the sales/index.html template with sale
-    data.
+    Returns: Template or JSON response: Render the sales/index.html
+    template with sale data, or the page as JSON.
     """
-    sales = Sale.query.order_by(Sale.date.desc()).all()
-    return render_template('sales/index.html', sales=sales)
+    def load_page():
+        return paginate_keyset(Sale.query, [(Sale.date, True),
+                                            (Sale.id, True)])
+
+    if request.args.get('format') == 'json':
+        return json_table_page(['sales'], load_page)
+    return render_table_page('sales/index.html', 'sales/_table.html',
+                             ['sales'], load_page, 'sales')
 
 
 @bp.route('/search_sale/', methods=['GET', 'POST'])
 @roles_accepted('admin', 'editor', 'supervisor')
+@read_only
 def search_sale():
     """ Search for sales based on a search string.
 
@@ -65,40 +78,33 @@ def add_sale():
         redirect to the sales index.
     """
     if request.method == 'POST':
-        error = ""
         product = request.form['product']
         quantity = request.form['quantity']
         customer = request.form['customer']
         customer_email = request.form['customer_email']
         customer_phone = request.form['customer_phone']
         user = request.form['user']
-        prod = Product.query.filter_by(product_name=product).first()
-        if prod:
-            if prod.product_quantity < int(quantity):
-                error = 'Not enough quantity'
-            else:
-                prod.product_quantity -= int(quantity)
-                try:
-                    db.session.commit()
-                except:
-                    return 'There was an issue updating product quantity'
-        else:
-            error = 'Product not found'
+        product_id = lookup_id('product', product)
+        error = reserve_stock(product_id, int(quantity))
         if error:
-            return render_template('add_sale.html', product=product,
+            db.session.rollback()
+            return render_template('sales/add_sale.html', product=product,
                                    quantity=quantity, customer=customer,
                                    customer_email=customer_email,
                                    customer_phone=customer_phone,
                                    user=user, error=error)
         new_sale = Sale(product_name=product, product_quantity=quantity,
                         customer_name=customer, customer_email=customer_email,
-                        customer_phone=customer_phone, user_name=user)
+                        customer_phone=customer_phone, user_name=user,
+                        product_id=product_id,
+                        user_id=lookup_id('user', user))
         try:
+            add_customer(new_sale)
             db.session.add(new_sale)
             db.session.commit()
-            add_customer(new_sale)
             return redirect(url_for('sales.index'))
         except:
+            db.session.rollback()
             return 'There was an issue adding your sale information'
     else:
         return render_template('sales/add_sale.html')
@@ -159,22 +165,21 @@ def update_sale(id):
         quantity = request.form['quantity']
         sale.customer_name = request.form['customer']
         sale.user_name = request.form['user']
-        prod = Product.query.filter_by(product_name=product).first()
-        if prod:
-            if prod.product_quantity < int(quantity):
-                error = 'Not enough quantity'
-            else:
-                prod.product_quantity += sale.product_quantity
-                prod.product_quantity -= int(quantity)
-                sale.product_name = product
-                sale.product_quantity = quantity
-                try:
-                    db.session.commit()
-                    return redirect(url_for('sales.index'))
-                except:
-                    return 'db update error'
-        else:
-            error = 'Product not found'
+        sale.user_id = lookup_id('user', sale.user_name)
+        release_stock(sale.product_id, sale.product_quantity)
+        product_id = lookup_id('product', product)
+        error = reserve_stock(product_id, int(quantity))
+        if not error:
+            sale.product_name = product
+            sale.product_id = product_id
+            sale.product_quantity = quantity
+            try:
+                db.session.commit()
+                return redirect(url_for('sales.index'))
+            except:
+                db.session.rollback()
+                return 'db update error'
+        db.session.rollback()
         return render_template('sales/update_sale.html', sale=sale,
                                error=error)
     else:
@@ -183,36 +188,32 @@ def update_sale(id):
 
 @bp.route('/download_sales')
 @roles_accepted('admin')
+@read_only
 def download_sales():
-    """ Download sale data in the specified format (CSV or JSON).
+    """ Download sale data as CSV, NDJSON, JSON, Parquet or Arrow.
 
     Methods:
-        GET: Retrieve sale data and export it in the specified format.
-
-    Returns: Response: A response containing the sale data file for
-    download.
+        GET: Stream sale data in the specified format, limited to the
+        ``start``/``end`` date range and to the rows above ``since_id``
+        or dated after ``since`` when given. The body is compressed with
+        zstd or gzip as Accept-Encoding allows (always gzip with
+        ``gzip=1``), and an unchanged export answers 304 to
+        If-None-Match or If-Modified-Since.
+
+    Returns: Response: A streamed response containing the sale data file
+    for download.
     """
     format = request.args.get('format')
-    sales_dict = export_sale_json()
-
-    if format == 'csv':
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(sales_dict[0].keys())
-        for row in sales_dict:
-            writer.writerow(row.values())
-        output.seek(0)
-        response = Response(output, mimetype='test/csv')
-        response.headers['Content-Disposition'] = 'attachment; \
-            filename=sales.csv'
-    elif format == 'json':
-        json_data = json.dumps(sales_dict, indent=4)
-        response = Response(json_data, mimetype='application/json')
-        response.headers['Content-Disposition'] = 'attachment; \
-            filename=sales.json'
-    else:
+    if format not in EXPORT_FORMATS:
         return "Invalid format", 400
-    return response
+    try:
+        where = export_filter(Sale.id, Sale.date, request.args)
+    except ValueError:
+        return "Invalid export range", 400
+    return export_response(SALE_EXPORT_COLUMNS, 'sales', format, where,
+                           date_column=Sale.date,
+                           encoding=negotiate_encoding(
+                               request.args.get('gzip') == '1'))
 
 
 @bp.route('/upload_sales', methods=['POST', 'GET'])
@@ -236,19 +237,13 @@ def upload_sales():
 
         if uploaded_file and allowed_file(uploaded_file.filename):
             filename = secure_filename(uploaded_file.filename)
-            extention = filename.rsplit('.', 1)[1].lower()
-            file_path = os.path.join('uploads/', filename)
+            file_path = os.path.join('uploads/',
+                                     f'{uuid.uuid4().hex}_{filename}')
             uploaded_file.save(file_path)
-            filename.rsplit('.', 1)[1].lower()
-            if extention == 'json':
-                msg = parse_sales_json_file(file_path)
-                return msg
-            elif extention == 'csv':
-                inspector = inspect(db.engine)
-                return parse_sales_csv_file(inspector, file_path)
-            else:
-                pass
-            return redirect(url_for('sales.index'))
+            job = submit_import('sales', file_path, filename)
+            return jsonify({"job_id": job.id,
+                            "status_url": url_for('imports.job_status',
+                                                  id=job.id)}), 202
         else:
             return jsonify({"error": "File not allowed"}), 400
     return render_template('upload_sales')
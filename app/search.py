@@ -0,0 +1,214 @@
+"""Full-text search over sales, products, customers and users
+
+SQLite uses external-content FTS5 tables kept in sync by triggers and
+MySQL uses FULLTEXT indexes, so inserts, updates and deletes (including
+bulk imports) reach the index without application code. Other backends
+fall back to index-friendly prefix LIKE matching.
+"""
+import re
+import threading
+from flask import current_app
+from sqlalchemy import text, or_
+from app.extensions import db
+from app.routing import read_bind
+
+
+# Indexed text columns per table.
+SEARCH_COLUMNS = {
+    'sales': ['product_name', 'customer_name', 'customer_email',
+              'user_name'],
+    'products': ['product_name'],
+    'customers': ['customer_name', 'customer_email', 'customer_phone'],
+    'user': ['user_name', 'user_email', 'user_phone'],
+}
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+_index_ready = {}
+_index_lock = threading.Lock()
+
+
+def _fts_table(table):
+    """Return the name of the FTS5 table shadowing ``table``."""
+    return f'{table}_fts'
+
+
+def _sqlite_statements(table):
+    """ Build the DDL of the FTS5 table and the triggers that sync it.
+
+    Parameters:
+        table (str): The content table.
+
+    Returns:
+        list: SQL statements, safe to run more than once.
+    """
+    fts = _fts_table(table)
+    cols = ', '.join(SEARCH_COLUMNS[table])
+    new = ', '.join(f'new.{col}' for col in SEARCH_COLUMNS[table])
+    old = ', '.join(f'old.{col}' for col in SEARCH_COLUMNS[table])
+    insert_new = (f'INSERT INTO {fts}(rowid, {cols}) '
+                  f'VALUES (new.id, {new});')
+    delete_old = (f"INSERT INTO {fts}({fts}, rowid, {cols}) "
+                  f"VALUES ('delete', old.id, {old});")
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+        f'{cols}, content="{table}", content_rowid="id")',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}" '
+        f'BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}" '
+        f'BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON "{table}" '
+        f'BEGIN {delete_old} {insert_new} END',
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_indexes(connection):
+    """ Create (or rebuild) the full-text index of every searchable table.
+
+    Parameters:
+        connection: A SQLAlchemy connection inside a transaction.
+    """
+    dialect = connection.dialect.name
+    for table, columns in SEARCH_COLUMNS.items():
+        if dialect == 'sqlite':
+            for statement in _sqlite_statements(table):
+                connection.execute(text(statement))
+        elif dialect == 'mysql':
+            name = f'ft_{table}'
+            exists = connection.execute(text(
+                'SELECT COUNT(*) FROM information_schema.statistics '
+                'WHERE table_schema = DATABASE() AND table_name = :table '
+                'AND index_name = :name'),
+                {'table': table, 'name': name}).scalar()
+            if not exists:
+                connection.execute(text(
+                    f'ALTER TABLE `{table}` ADD FULLTEXT INDEX {name} '
+                    f'({", ".join(columns)})'))
+    with _index_lock:
+        _index_ready.clear()
+
+
+def _has_index(session, table):
+    """ Report whether the full-text index of ``table`` exists.
+
+    Parameters:
+        session: The SQLAlchemy session to query with.
+        table (str): The content table.
+
+    Returns:
+        bool: True if the backend-specific index is available.
+    """
+    # the replica in read-only views: it may lack the primary's index
+    bind = read_bind(session)
+    key = (str(bind.url), table)
+    ready = _index_ready.get(key)
+    if ready is None:
+        dialect = bind.dialect.name
+        if dialect == 'sqlite':
+            ready = bool(session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                "AND name = :name"), {'name': _fts_table(table)}).first())
+        elif dialect == 'mysql':
+            ready = bool(session.execute(text(
+                'SELECT 1 FROM information_schema.statistics '
+                'WHERE table_schema = DATABASE() AND table_name = :table '
+                'AND index_name = :name'),
+                {'table': table, 'name': f'ft_{table}'}).first())
+        else:
+            ready = False
+        if ready:
+            # Only positive answers are cached so that indexes created
+            # later by `flask search-index` are picked up without restart.
+            with _index_lock:
+                _index_ready[key] = ready
+    return ready
+
+
+def tokenize(search):
+    """ Split a search string into word tokens.
+
+    Parameters:
+        search (str): The raw search string.
+
+    Returns:
+        list: The word tokens, lower-cased.
+    """
+    return [token.lower() for token in _TOKEN.findall(search or '')]
+
+
+def _ranked_ids(session, table, tokens, limit):
+    """ Return the ids of the best matches for ``tokens``, best first.
+
+    Every token must match as a prefix of a word in one of the indexed
+    columns.
+
+    Parameters:
+        session: The SQLAlchemy session to query with.
+        table (str): The content table.
+        tokens (list): Word tokens from ``tokenize``.
+        limit (int): The maximum number of ids.
+
+    Returns:
+        list: The matching ids, or None if no full-text index exists.
+    """
+    if not _has_index(session, table):
+        return None
+    dialect = read_bind(session).dialect.name
+    if dialect == 'sqlite':
+        fts = _fts_table(table)
+        query = ' AND '.join(f'"{token}"*' for token in tokens)
+        rows = session.execute(text(
+            f'SELECT rowid FROM {fts} WHERE {fts} MATCH :query '
+            f'ORDER BY rank LIMIT :limit'),
+            {'query': query, 'limit': limit})
+    else:
+        columns = ', '.join(SEARCH_COLUMNS[table])
+        query = ' '.join(f'+{token}*' for token in tokens)
+        match = f'MATCH({columns}) AGAINST (:query IN BOOLEAN MODE)'
+        rows = session.execute(text(
+            f'SELECT id FROM `{table}` WHERE {match} '
+            f'ORDER BY {match} DESC LIMIT :limit'),
+            {'query': query, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+def search(model, search, limit=None, extra_ids=()):
+    """ Search a model's indexed columns and return ranked instances.
+
+    A purely numeric search also matches the primary key exactly. Without
+    a full-text index the columns are matched with prefix LIKE patterns,
+    which can still use ordinary B-tree indexes.
+
+    Parameters:
+        model: The SQLAlchemy model class to search.
+        search (str): The raw search string.
+        limit (int): The maximum number of results; SEARCH_LIMIT when None.
+        extra_ids (iterable): Ids to rank first, e.g. from related tables.
+
+    Returns:
+        list: The matching model instances, best match first.
+    """
+    limit = limit or current_app.config['SEARCH_LIMIT']
+    table = model.__tablename__
+    tokens = tokenize(search)
+    if not tokens:
+        return model.query.order_by(model.id.desc()).limit(limit).all()
+
+    ids = list(extra_ids)
+    if search.strip().isdigit():
+        ids.insert(0, int(search.strip()))
+    ranked = _ranked_ids(db.session, table, tokens, limit)
+    if ranked is None:
+        pattern = search.strip() + '%'
+        columns = [getattr(model, col) for col in SEARCH_COLUMNS[table]]
+        matches = model.query.filter(or_(
+            *[column.like(pattern) for column in columns])
+        ).limit(limit).all()
+        ranked = [match.id for match in matches]
+    ids.extend(ranked)
+    ordered = list(dict.fromkeys(ids))[:limit]
+    if not ordered:
+        return []
+    found = {row.id: row
+             for row in model.query.filter(model.id.in_(ordered)).all()}
+    return [found[id] for id in ordered if id in found]
@@ -0,0 +1,159 @@
+"""Per-process cache of the signed-in users and their roles
+
+Flask-Security loads the user named by the session (its fs_uniquifier) on
+every request before ``roles_accepted`` reads ``user.roles``. The loader
+fetches the user and roles in one query and keeps a detached copy in a
+bounded LRU store for USER_CACHE_TTL seconds; later requests merge that
+copy into their session without touching the database.
+
+Entries are invalidated when a transaction that updated or deleted a user,
+changed their roles, or changed a role commits; changes to roles or to
+the user_roles rows drop every entry. A load racing with such a commit is
+not cached. The TTL bounds how long writes made by other processes can
+leave a stale entry; USER_CACHE_TTL = 0 turns the cache off.
+"""
+import threading
+from flask_security import SQLAlchemySessionUserDatastore
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from app.extensions import db
+from app.lookups import MemoryLookupStore
+from app.models.user import Role, User, UserRoles
+
+
+_store = MemoryLookupStore()
+# bumped by every invalidation, so a load that raced one is not cached
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def init_user_cache(app):
+    """ Create the user store described by the application config.
+
+    Parameters:
+        app: The Flask application.
+    """
+    global _store
+    _store = MemoryLookupStore(app.config['USER_CACHE_SIZE'],
+                               app.config['USER_CACHE_TTL'])
+
+
+def user_cache_stats():
+    """ Return the counters of the user store.
+
+    Returns:
+        dict: The size, hits, misses, hit rate, evictions, expirations and
+        invalidations.
+    """
+    return _store.stats()
+
+
+def _detached_copy(instance):
+    """Copy the loaded columns of a row into a new detached instance."""
+    mapper = inspect(type(instance))
+    copy = mapper.class_manager.new_instance()
+    for attribute in mapper.column_attrs:
+        set_committed_value(copy, attribute.key,
+                            getattr(instance, attribute.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+def _snapshot(user):
+    copy = _detached_copy(user)
+    set_committed_value(copy, 'roles',
+                        [_detached_copy(role) for role in user.roles])
+    return copy
+
+
+def load_user(fs_uniquifier):
+    """ Load a user and their roles by fs_uniquifier.
+
+    Parameters:
+        fs_uniquifier (str): The identifier stored in the session.
+
+    Returns:
+        User: The user, attached to the current session, or None.
+    """
+    if _store.ttl > 0:
+        cached = _store.get_many([fs_uniquifier]).get(fs_uniquifier)
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+    generation = _generation
+    user = db.session.scalar(
+        select(User).options(joinedload(User.roles))
+        .where(User.fs_uniquifier == fs_uniquifier))
+    if user is not None and _store.ttl > 0:
+        snapshot = _snapshot(user)
+        with _generation_lock:
+            if generation == _generation:
+                _store.set_many({fs_uniquifier: snapshot})
+    return user
+
+
+class CachedUserDatastore(SQLAlchemySessionUserDatastore):
+    """ Flask-Security datastore that loads session users through the
+    user cache.
+
+    Methods:
+        find_user(case_insensitive, **kwargs): Served by ``load_user``
+        when looking up a single fs_uniquifier.
+    """
+
+    def find_user(self, case_insensitive=False, **kwargs):
+        if not case_insensitive and list(kwargs) == ['fs_uniquifier']:
+            return load_user(kwargs['fs_uniquifier'])
+        return super().find_user(case_insensitive, **kwargs)
+
+
+def _invalidate(keys=None):
+    """Drop the given cache keys, or every entry when ``keys`` is None."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        if keys is None:
+            _store.clear()
+        else:
+            _store.delete_many(keys)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_user_changes(session, flush_context, instances):
+    """Record the users whose cached copy a flush makes stale."""
+    keys = set()
+    clear = False
+    for instance in (*session.dirty, *session.deleted):
+        if isinstance(instance, User):
+            values = inspect(instance).attrs.fs_uniquifier.history.sum()
+            keys.update(values or [instance.fs_uniquifier])
+        elif isinstance(instance, Role):
+            # appending a role to a user only touches its backref
+            clear = clear or (instance in session.deleted or inspect(
+                instance).attrs.name.history.has_changes())
+        elif isinstance(instance, UserRoles):
+            clear = True
+    clear = clear or any(isinstance(instance, UserRoles)
+                         for instance in session.new)
+    if clear:
+        session.info['user_cache_clear'] = True
+    if keys:
+        session.info.setdefault('user_cache_invalidations', set()).update(
+            keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_user_changes(session):
+    """Invalidate the users changed by the committed transaction."""
+    keys = session.info.pop('user_cache_invalidations', None)
+    if session.info.pop('user_cache_clear', False):
+        _invalidate()
+    elif keys:
+        _invalidate(keys)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_user_changes(session, previous_transaction):
+    """Forget the invalidations of a rolled back transaction."""
+    session.info.pop('user_cache_invalidations', None)
+    session.info.pop('user_cache_clear', None)
@@ -3,27 +3,45 @@ from flask import render_template, request, redirect, url_for
 from flask_login import login_user, logout_user, login_required
 from flask_security import roles_accepted
 from app.users import bp
-from app.extensions import db, bcrypt
+from flask import jsonify
+from sqlalchemy.orm import selectinload
+from app.extensions import db
 from app.models.user import User, Role, get_user
+from app.pagination import paginate_keyset
+from app.fragments import json_table_page, render_table_page
+from app.routing import read_only
+from app.passwords import hash_password
 
 
 @bp.route('/', methods=['GET'])
 @roles_accepted('admin', 'supervisor')
+@read_only
 def index():
-    """ Display the list of users.
+    """ Display one page of the list of users.
 
     Methods:
-        GET: Retrieve and display all user records, ordered by user name.
+        GET: Retrieve and display a page of user records, ordered by user
+        name. ``cursor`` and ``per_page`` select the page and
+        ``format=json`` returns it as JSON.
 
     Returns:
-        Template: Render the users/index.html template with user data.
+        Template or JSON response: Render the users/index.html template
+        with user data, or the page as JSON.
     """
-    users = User.query.order_by(User.user_name).all()
-    return render_template('users/index.html', users=users)
+    def load_page():
+        query = User.query.options(selectinload(User.roles))
+        return paginate_keyset(query, [(User.user_name, False),
+                                       (User.id, False)])
+
+    if request.args.get('format') == 'json':
+        return json_table_page(['user'], load_page)
+    return render_table_page('users/index.html', 'users/_table.html',
+                             ['user'], load_page, 'users')
 
 
 @bp.route('/search_user/', methods=['GET', 'POST'])
 @roles_accepted('admin', 'supervisor')
+@read_only
 def search_user():
     """ Search for users based on a search string.
 
@@ -60,8 +78,7 @@ def add_user():
         password = request.form['user_password']
         user_role = request.form['privilege']
 
-        hashed_password = bcrypt.generate_password_hash(password
-                                                        ).decode('utf-8')
+        hashed_password = hash_password(password)
         role = Role.query.filter_by(name=user_role).first()
         new_user = User(user_name=user_name, user_email=user_email,
                         user_phone=user_phone, password=hashed_password)
@@ -118,7 +135,8 @@ def update_user(id):
 
     Methods:
         GET: Render the update user template with the current user data.
-        POST: Update the user information in the database.
+        POST: Update the user information in the database; the password
+        is hashed, and kept when the field is left empty.
 
     Returns:
         Template or redirect: Render the update user template or redirect
@@ -129,7 +147,8 @@ def update_user(id):
         user.user_name = request.form['user']
         user.user_email = request.form['user_email']
         user.user_phone = request.form['user_phone']
-        user.password = request.form['user_password']
+        if request.form.get('user_password'):
+            user.password = hash_password(request.form['user_password'])
         user.type = request.form['privilege']
 
         try:
@@ -0,0 +1,107 @@
+"""Benchmark the authentication overhead of signed-in requests.
+
+Seeds a small SQLite database with ``benchmarks/seed.py``, logs in as the
+seeded admin and requests a few role-protected pages, once with the user
+cache off (USER_CACHE_TTL = 0) and once with it on. For every page it
+reports the SQL statements per request, how many of them loaded the
+signed-in user (the ``fs_uniquifier`` lookup, with its roles joined), and
+the p50/p99 latency.
+
+Usage:
+    python benchmarks/auth_queries.py --requests 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+import seed as seeding  # noqa: E402
+from hot_paths import percentile  # noqa: E402
+from config import TestingConfig  # noqa: E402
+from app import create_app  # noqa: E402
+
+PAGES = ['/main/counts', '/customers/?format=json', '/users/?format=json',
+         '/reports/revenue?group=product']
+
+
+def measure(database, ttl, requests):
+    """ Request every page ``requests`` times with USER_CACHE_TTL = ttl.
+
+    Returns:
+        dict: page -> statements and auth statements per request, and
+        latencies.
+    """
+    config = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+        'SQLALCHEMY_BINDS': {},
+        'SLOW_QUERY_MS': None,
+        'N_PLUS_ONE_THRESHOLD': None,
+        'USER_CACHE_TTL': ttl,
+    })
+    app = create_app(config)
+    client = app.test_client()
+    client.post('/', data={'email': seeding.ADMIN_EMAIL,
+                           'password': seeding.PASSWORD})
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    results = {}
+    try:
+        for page in PAGES:
+            client.get(page)  # warm up
+            statements.clear()
+            latencies = []
+            for _ in range(requests):
+                begin = time.perf_counter()
+                response = client.get(page)
+                latencies.append((time.perf_counter() - begin) * 1000)
+                assert response.status_code == 200, (page,
+                                                     response.status_code)
+            auth = sum('user.fs_uniquifier =' in statement
+                       for statement in statements)
+            results[page] = {
+                'statements_per_request': round(len(statements) / requests,
+                                                2),
+                'auth_statements_per_request': round(auth / requests, 2),
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2)}
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--ttl', type=int, default=60,
+                        help='USER_CACHE_TTL of the cached run')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='crm-auth-')
+    database = os.path.join(workdir, 'auth.db')
+    seeding.seed(database, products=100, customers=100, sales=1000,
+                 echo=lambda line: None)
+    os.chdir(workdir)
+    report = {'meta': {'requests': args.requests, 'ttl': args.ttl},
+              'uncached': measure(database, 0, args.requests),
+              'cached': measure(database, args.ttl, args.requests)}
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
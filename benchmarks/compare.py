@@ -0,0 +1,73 @@
+"""Compare two hot path benchmark results and flag regressions.
+
+A scenario regresses when its p50 or p99 latency grows, or its throughput
+drops, by more than the threshold (10% by default) relative to the
+baseline. The exit status is 1 when any scenario regressed, so the script
+can gate a CI job.
+
+Usage:
+    python benchmarks/compare.py baseline.json current.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+# metric -> True when a higher value is worse
+METRICS = {'p50_ms': True, 'p99_ms': True, 'throughput_per_s': False}
+
+
+def compare(baseline, current, threshold):
+    """ Compare the scenarios present in both results.
+
+    Parameters:
+        baseline (dict): The reference report from hot_paths.py.
+        current (dict): The report to check.
+        threshold (float): The tolerated relative change.
+
+    Returns:
+        list: (scenario, metric, baseline, current, change, regressed)
+        tuples, ``change`` being relative to the baseline.
+    """
+    rows = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+        for metric, higher_is_worse in METRICS.items():
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change if higher_is_worse else -change
+            rows.append((name, metric, old, new, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args()
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.current) as handle:
+        current = json.load(handle)
+
+    if baseline['meta'].get('volumes') != current['meta'].get('volumes'):
+        print('warning: the results were measured on different volumes',
+              file=sys.stderr)
+    rows = compare(baseline, current, args.threshold)
+    print(f'{"scenario":<22}{"metric":<18}{"baseline":>12}{"current":>12}'
+          f'{"change":>10}')
+    for name, metric, old, new, change, regressed in rows:
+        print(f'{name:<22}{metric:<18}{old:>12.2f}{new:>12.2f}'
+              f'{change:>+10.1%}' + ('  REGRESSION' if regressed else ''))
+    regressions = sum(row[-1] for row in rows)
+    print(f'{regressions} regression(s) above {args.threshold:.0%}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
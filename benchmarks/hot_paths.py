@@ -0,0 +1,375 @@
+"""Benchmark the CRM hot paths through the Flask test client.
+
+Seeds (or reuses) a SQLite database with ``benchmarks/seed.py``, builds
+the real application on it, logs in as the seeded admin and drives each
+scenario with the test client: adding sales, the sales list as JSON and
+as HTML (rendered, and revalidated with its ETag), search and streamed
+downloads, CSV and JSON uploads run to completion, the dashboard and the
+revenue report. For every scenario it reports throughput, p50/p99
+latency and the peak RSS of the process, and writes the results as JSON so that
+``benchmarks/compare.py`` can flag regressions between commits.
+
+Usage:
+    python benchmarks/hot_paths.py --sales 1000000
+    python benchmarks/hot_paths.py --only sales_index,search_sale
+    python benchmarks/compare.py baseline.json benchmarks/results/new.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine  # noqa: E402
+import seed as seeding  # noqa: E402
+from config import TestingConfig  # noqa: E402
+from app import create_app, migrations  # noqa: E402
+
+
+SEARCH_TERMS = ['product 00001', 'customer 12', 'user3', 'customer1',
+                'product']
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of the process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin'
+                         else 1024), 1)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Context:
+    """ State shared by the scenarios.
+
+    Attributes:
+        client: The logged-in Flask test client.
+        rng (Random): Random source for picking rows.
+        volumes (dict): The seeded row counts.
+        download_days (int): Days of sales exported per download.
+        upload_rows (int): Rows per uploaded file.
+        etag (str): The ETag of the HTML sales list, once requested.
+        export (tuple): The ETag and last id of the full gzipped CSV
+        export, once requested.
+        change_seq (int): The last change read from the change feed.
+    """
+
+    def __init__(self, client, volumes, download_days, upload_rows):
+        self.client = client
+        self.rng = random.Random(7)
+        self.volumes = volumes
+        self.download_days = download_days
+        self.upload_rows = upload_rows
+        self.etag = None
+        self.export = None
+        self.change_seq = 0
+
+    def product(self):
+        return seeding.product_name(
+            self.rng.randrange(1, self.volumes['products'] + 1))
+
+    def customer(self):
+        index = self.rng.randrange(1, self.volumes['customers'] + 1)
+        return f'customer {index}', seeding.customer_email(index)
+
+    def sale_rows(self):
+        rows = []
+        for _ in range(self.upload_rows):
+            name, email = self.customer()
+            rows.append({'product_name': self.product(),
+                         'product_quantity': 1,
+                         'customer_name': name,
+                         'customer_email': email,
+                         'customer_phone': '01000000000',
+                         'user_name': 'user1'})
+        return rows
+
+
+def _expect(response, *statuses):
+    if response.status_code not in statuses:
+        raise RuntimeError(f'unexpected status {response.status_code}: '
+                           f'{response.get_data(as_text=True)[:200]}')
+    return response
+
+
+def add_sale(ctx):
+    name, email = ctx.customer()
+    _expect(ctx.client.post('/sales/add_sale/', data={
+        'product': ctx.product(), 'quantity': '1', 'customer': name,
+        'customer_email': email, 'customer_phone': '01000000000',
+        'user': 'user1'}), 302)
+
+
+def sales_index(ctx):
+    page = _expect(ctx.client.get('/sales/?format=json'), 200).get_json()
+    if page['next_cursor'] and ctx.rng.random() < 0.5:
+        _expect(ctx.client.get('/sales/?format=json&cursor='
+                               + page['next_cursor']), 200)
+
+
+def sales_page(ctx):
+    """The HTML sales list, in one of two page sizes."""
+    _expect(ctx.client.get('/sales/', query_string={
+        'per_page': ctx.rng.choice([20, 50])}), 200)
+
+
+def sales_page_revalidate(ctx):
+    """A browser revalidating the HTML sales list with its ETag."""
+    if ctx.etag is None:
+        ctx.etag = ctx.client.get('/sales/').headers['ETag']
+    _expect(ctx.client.get('/sales/', headers={'If-None-Match': ctx.etag}),
+            304)
+
+
+def search_sale(ctx):
+    _expect(ctx.client.get('/sales/search_sale/', query_string={
+        'search': ctx.rng.choice(SEARCH_TERMS)}), 200)
+
+
+def _download(ctx, format):
+    end = seeding.SEED_DATE
+    start = end.toordinal() - ctx.download_days
+    response = _expect(ctx.client.get('/sales/download_sales', query_string={
+        'format': format,
+        'start': datetime.fromordinal(start).strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d')}), 200)
+    response.get_data()
+
+
+def download_sales_csv(ctx):
+    _download(ctx, 'csv')
+
+
+def download_sales_json(ctx):
+    _download(ctx, 'json')
+
+
+def download_sales_revalidate(ctx):
+    """A nightly puller of the gzipped CSV export: a revalidation of the
+    full export with its ETag, then an incremental pull after its last id.
+    """
+    if ctx.export is None:
+        response = _expect(ctx.client.get(
+            '/sales/download_sales',
+            query_string={'format': 'csv', 'gzip': '1'}), 200)
+        response.get_data()
+        ctx.export = (response.headers['ETag'],
+                      response.headers['X-Export-Last-Id'])
+    etag, last_id = ctx.export
+    _expect(ctx.client.get('/sales/download_sales', query_string={
+        'format': 'csv', 'gzip': '1'}, headers={'If-None-Match': etag}), 304)
+    _expect(ctx.client.get('/sales/download_sales', query_string={
+        'format': 'csv', 'gzip': '1', 'since_id': last_id}), 200).get_data()
+
+
+def changes_feed(ctx):
+    """A replica following the change feed with a sale written between
+    two pages."""
+    add_sale(ctx)
+    page = _expect(ctx.client.get('/changes/', query_string={
+        'after': ctx.change_seq, 'limit': 100}), 200).get_json()
+    ctx.change_seq = page['last_seq']
+
+
+def _upload(ctx, filename, body):
+    response = _expect(ctx.client.post('/sales/upload_sales', data={
+        'file': (io.BytesIO(body), filename)}), 202)
+    status_url = response.get_json()['status_url']
+    while True:
+        job = _expect(ctx.client.get(status_url), 200).get_json()
+        if job['state'] == 'succeeded':
+            return
+        if job['state'] == 'failed':
+            raise RuntimeError(f'import failed: {job["message"]}')
+        time.sleep(0.005)
+
+
+def upload_sales_csv(ctx):
+    rows = ctx.sale_rows()
+    lines = [','.join(rows[0])]
+    lines += [','.join(str(value) for value in row.values()) for row in rows]
+    _upload(ctx, 'sales.csv', '\n'.join(lines).encode())
+
+
+def upload_sales_json(ctx):
+    _upload(ctx, 'sales.json', json.dumps(ctx.sale_rows()).encode())
+
+
+def main_index(ctx):
+    _expect(ctx.client.get('/main/'), 200)
+
+
+def reports_revenue(ctx):
+    end = seeding.SEED_DATE
+    start = datetime.fromordinal(end.toordinal() - ctx.download_days)
+    _expect(ctx.client.get('/reports/revenue', query_string={
+        'group': ctx.rng.choice(['day', 'product', 'user']),
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d')}), 200)
+
+
+# name -> (scenario, default iterations)
+SCENARIOS = {
+    'add_sale': (add_sale, 500),
+    'sales_index': (sales_index, 500),
+    'sales_page': (sales_page, 300),
+    'sales_page_revalidate': (sales_page_revalidate, 500),
+    'search_sale': (search_sale, 200),
+    'download_sales_csv': (download_sales_csv, 5),
+    'download_sales_json': (download_sales_json, 5),
+    'download_sales_revalidate': (download_sales_revalidate, 200),
+    'changes_feed': (changes_feed, 300),
+    'upload_sales_csv': (upload_sales_csv, 10),
+    'upload_sales_json': (upload_sales_json, 10),
+    'main_index': (main_index, 500),
+    'reports_revenue': (reports_revenue, 200),
+}
+
+
+def run_scenario(ctx, scenario, iterations, warmup):
+    """ Run one scenario and summarize its latencies.
+
+    Returns:
+        dict: requests, errors, throughput_per_s, mean/p50/p99 latency in
+        ms and the peak RSS after the run.
+    """
+    for _ in range(warmup):
+        scenario(ctx)
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        try:
+            scenario(ctx)
+        except RuntimeError:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - begin) * 1000)
+    elapsed = time.perf_counter() - started
+    result = {'requests': iterations, 'errors': errors,
+              'seconds': round(elapsed, 3),
+              'throughput_per_s': round(len(latencies) / elapsed, 2)
+              if elapsed else None,
+              'peak_rss_mb': peak_rss_mb()}
+    if latencies:
+        result.update(mean_ms=round(statistics.fmean(latencies), 3),
+                      p50_ms=round(percentile(latencies, 0.50), 3),
+                      p99_ms=round(percentile(latencies, 0.99), 3))
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--database', default=None,
+                        help='seeded SQLite file to reuse or create; '
+                        'defaults to one per volume in the temp directory')
+    parser.add_argument('--only', default=None,
+                        help='comma separated scenarios to run')
+    parser.add_argument('--iterations', type=int, default=None,
+                        help='override every scenario\'s iteration count')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--download-days', type=int, default=30)
+    parser.add_argument('--upload-rows', type=int, default=1000)
+    parser.add_argument('--output', default=None,
+                        help='result file; defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    volumes = {'products': args.products, 'customers': args.customers,
+               'sales': args.sales}
+    database = args.database or os.path.join(
+        tempfile.gettempdir(),
+        'crm-bench-{products}-{customers}-{sales}.db'.format(**volumes))
+    if not os.path.exists(database):
+        print(f'Seeding {database}', file=sys.stderr)
+        seeding.seed(database, **volumes,
+                     echo=lambda line: print(line, file=sys.stderr))
+    # add_sale and the uploads write to the database: run on a copy so
+    # every run starts from the same seeded state
+    workdir = tempfile.mkdtemp(prefix='crm-bench-')
+    copy = os.path.join(workdir, 'bench.db')
+    source = sqlite3.connect(database)
+    target = sqlite3.connect(copy)
+    source.backup(target)
+    source.close()
+    target.close()
+    # a database seeded by an older checkout lacks the newer migrations
+    engine = create_engine(f'sqlite:///{copy}')
+    migrations.upgrade(engine, echo=lambda line: print(line, file=sys.stderr))
+    engine.dispose()
+
+    config = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{copy}',
+        'SQLALCHEMY_BINDS': {},
+        'SLOW_QUERY_MS': None,
+        'N_PLUS_ONE_THRESHOLD': None,
+    })
+    os.makedirs(os.path.join(workdir, 'uploads'))
+    os.chdir(workdir)
+    app = create_app(config)
+    client = app.test_client()
+    _expect(client.post('/', data={'email': seeding.ADMIN_EMAIL,
+                                   'password': seeding.PASSWORD}), 302)
+    ctx = Context(client, volumes, args.download_days, args.upload_rows)
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    results = {}
+    for name in names:
+        scenario, iterations = SCENARIOS[name]
+        print(f'{name} ...', file=sys.stderr)
+        results[name] = run_scenario(ctx, scenario,
+                                     args.iterations or iterations,
+                                     args.warmup)
+        print(f'  {json.dumps(results[name])}', file=sys.stderr)
+
+    report = {'meta': {'commit': _commit(),
+                       'timestamp': datetime.now().isoformat(
+                           timespec='seconds'),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'sqlite': sqlite3.sqlite_version,
+                       'volumes': volumes,
+                       'download_days': args.download_days,
+                       'upload_rows': args.upload_rows},
+              'results': results}
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results',
+        '{}-{}.json'.format(datetime.now().strftime('%Y%m%d-%H%M%S'),
+                            report['meta']['commit'] or 'unknown'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Benchmark logins during a login storm.
+
+Seeds a SQLite database with ``benchmarks/seed.py`` and stores every
+user's password hash at the requested bcrypt cost. The real login view is
+then driven from ``--concurrency`` threads while ``--dashboard-threads``
+threads keep loading the dashboard. This runs once for every
+PASSWORD_WORKERS setting given, so verifying in the request thread (0)
+can be compared with the process pool. Reports the login throughput, the
+login and dashboard latencies and the logins turned away with 503.
+
+Usage:
+    python benchmarks/login_throughput.py --cost 12 --workers 0,4
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bcrypt  # noqa: E402
+import seed as seeding  # noqa: E402
+from hot_paths import percentile  # noqa: E402
+from config import TestingConfig  # noqa: E402
+from app import create_app  # noqa: E402
+from app.passwords import shutdown_pool  # noqa: E402
+
+
+def prepare(path, users, cost):
+    """Seed a small database whose users are hashed at ``cost``."""
+    seeding.seed(path, products=10, customers=10, sales=10, users=users,
+                 echo=lambda line: None)
+    hashed = bcrypt.hashpw(seeding.PASSWORD.encode(),
+                           bcrypt.gensalt(cost)).decode()
+    with sqlite3.connect(path) as connection:
+        connection.execute('UPDATE user SET password = ?', (hashed,))
+
+
+def user_email(index):
+    return (seeding.ADMIN_EMAIL if index == 1
+            else f'user{index}@example.com')
+
+
+def _summary(latencies):
+    if not latencies:
+        return {}
+    return {'p50_ms': round(percentile(latencies, 0.50), 1),
+            'p99_ms': round(percentile(latencies, 0.99), 1),
+            'mean_ms': round(statistics.fmean(latencies), 1)}
+
+
+def storm(database, args, workers):
+    """ Run one login storm with PASSWORD_WORKERS = ``workers``.
+
+    Returns:
+        dict: Login throughput, latencies and rejections, and the
+        dashboard latencies measured during the storm.
+    """
+    config = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+        'SQLALCHEMY_BINDS': {},
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': args.concurrency + 8,
+                                      'max_overflow': 0},
+        'SLOW_QUERY_MS': None,
+        'N_PLUS_ONE_THRESHOLD': None,
+        'BCRYPT_LOG_ROUNDS': args.cost,
+        'PASSWORD_WORKERS': workers,
+        'PASSWORD_QUEUE_SIZE': args.queue_size,
+    })
+    app = create_app(config)
+    dashboard = app.test_client()
+    dashboard.post('/', data={'email': seeding.ADMIN_EMAIL,
+                              'password': seeding.PASSWORD})
+    # warm up the pool processes before the clock starts
+    app.test_client().post('/', data={'email': seeding.ADMIN_EMAIL,
+                                      'password': seeding.PASSWORD})
+
+    login_latencies, statuses = [], []
+    dashboard_latencies = []
+    done = threading.Event()
+
+    def login(index):
+        client = app.test_client()
+        begin = time.perf_counter()
+        response = client.post('/', data={
+            'email': user_email(index % args.users + 1),
+            'password': seeding.PASSWORD})
+        login_latencies.append((time.perf_counter() - begin) * 1000)
+        statuses.append(response.status_code)
+
+    def load_dashboard():
+        while not done.is_set():
+            begin = time.perf_counter()
+            dashboard.get('/main/')
+            dashboard_latencies.append((time.perf_counter() - begin) * 1000)
+
+    readers = [threading.Thread(target=load_dashboard)
+               for _ in range(args.dashboard_threads)]
+    for reader in readers:
+        reader.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    for reader in readers:
+        reader.join()
+    shutdown_pool()
+
+    succeeded = statuses.count(302)
+    return {'workers': workers,
+            'logins': args.logins,
+            'succeeded': succeeded,
+            'rejected': statuses.count(503),
+            'failed': args.logins - succeeded - statuses.count(503),
+            'seconds': round(elapsed, 2),
+            'logins_per_s': round(succeeded / elapsed, 1),
+            'login': _summary(login_latencies),
+            'dashboard': dict(_summary(dashboard_latencies),
+                              requests=len(dashboard_latencies))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--dashboard-threads', type=int, default=2)
+    parser.add_argument('--cost', type=int, default=12,
+                        help='bcrypt cost of the stored hashes')
+    parser.add_argument('--workers', default=f'0,{os.cpu_count()}',
+                        help='comma separated PASSWORD_WORKERS to compare')
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='crm-login-')
+    database = os.path.join(workdir, 'login.db')
+    prepare(database, args.users, args.cost)
+    os.chdir(workdir)
+    results = []
+    for workers in [int(value) for value in args.workers.split(',')]:
+        print(f'PASSWORD_WORKERS={workers} ...', file=sys.stderr)
+        results.append(storm(database, args, workers))
+        print(f'  {json.dumps(results[-1])}', file=sys.stderr)
+    report = {'meta': {'cost': args.cost, 'users': args.users,
+                       'concurrency': args.concurrency,
+                       'cpus': os.cpu_count()},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
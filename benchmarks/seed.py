@@ -0,0 +1,171 @@
+"""Seed a SQLite database with synthetic CRM data for the benchmarks.
+
+The schema comes from the application's migrations: the tables and
+indexes are created first, the rows are bulk inserted with the sqlite3
+module, and the remaining migrations then build the full-text indexes and
+the dashboard counters over the seeded rows. The data is generated from a
+fixed random seed, so equal volumes always give the same database.
+
+Every seeded user logs in with the password ``benchmark``; the first one,
+``admin@example.com``, is an admin.
+
+Usage:
+    python benchmarks/seed.py --products 10000 --customers 1000000 \
+        --sales 10000000 --output /tmp/crm-bench.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from flask_bcrypt import generate_password_hash  # noqa: E402
+from app import migrations  # noqa: E402
+
+
+PASSWORD = 'benchmark'
+ADMIN_EMAIL = 'admin@example.com'
+ROLES = ['admin', 'editor', 'supervisor']
+BATCH_SIZE = 50000
+# Sales are dated over this many days before SEED_DATE
+DAYS = 365
+SEED_DATE = datetime(2024, 12, 31)
+
+
+def _date(rng):
+    moment = SEED_DATE - timedelta(seconds=rng.randrange(DAYS * 86400))
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def product_name(index):
+    return f'product {index:07d}'
+
+
+def customer_email(index):
+    return f'customer{index}@example.com'
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(path, products, customers, sales, users=20, seed_value=42,
+         echo=print):
+    """ Create ``path`` and fill it with the requested volumes.
+
+    Parameters:
+        path (str): The SQLite file to create; it must not exist.
+        products (int): Products to create.
+        customers (int): Customers to create.
+        sales (int): Sales to create.
+        users (int): Users to create, the first being an admin.
+        seed_value (int): The random seed.
+        echo (callable): Receives progress lines.
+    """
+    rng = random.Random(seed_value)
+    engine = create_engine(f'sqlite:///{path}')
+    migrations.upgrade(engine, target=2, echo=echo)
+    engine.dispose()
+
+    started = time.perf_counter()
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=OFF')
+    now = SEED_DATE.strftime('%Y-%m-%d %H:%M:%S.%f')
+    with connection:
+        connection.executemany('INSERT INTO role (id, name) VALUES (?, ?)',
+                               list(enumerate(ROLES, start=1)))
+        password = generate_password_hash(PASSWORD).decode('utf-8')
+        connection.executemany(
+            'INSERT INTO user (id, user_name, user_email, user_phone, '
+            'password, active, date, fs_uniquifier) '
+            'VALUES (?, ?, ?, ?, ?, 1, ?, ?)',
+            [(index, f'user{index}',
+              ADMIN_EMAIL if index == 1 else f'user{index}@example.com',
+              f'0100{index:07d}', password, now, uuid.uuid4().hex)
+             for index in range(1, users + 1)])
+        connection.executemany(
+            'INSERT INTO user_roles (user_id, role_id) VALUES (?, ?)',
+            [(index, 1 if index == 1 else 2 + index % 2)
+             for index in range(1, users + 1)])
+        connection.executemany(
+            'INSERT INTO products (id, product_name, price, '
+            'product_quantity, date) VALUES (?, ?, ?, ?, ?)',
+            [(index, product_name(index), rng.randrange(1, 1000),
+              10 ** 9, now) for index in range(1, products + 1)])
+    echo(f'  {users} users and {products} products')
+
+    for batch in _batches(
+            (index, f'customer {index}', customer_email(index),
+             f'0111{index:07d}', 0, _date(rng))
+            for index in range(1, customers + 1)):
+        with connection:
+            connection.executemany(
+                'INSERT INTO customers (id, customer_name, customer_email, '
+                'customer_phone, frequentcy_pay, date) '
+                'VALUES (?, ?, ?, ?, ?, ?)', batch)
+    echo(f'  {customers} customers')
+
+    def sale_rows():
+        for index in range(1, sales + 1):
+            product = rng.randrange(1, products + 1)
+            customer = rng.randrange(1, customers + 1)
+            user = rng.randrange(1, users + 1)
+            yield (index, product_name(product), rng.randrange(1, 10),
+                   f'customer {customer}', customer_email(customer),
+                   f'0111{customer:07d}', f'user{user}', product, customer,
+                   user, _date(rng))
+
+    for count, batch in enumerate(_batches(sale_rows()), start=1):
+        with connection:
+            connection.executemany(
+                'INSERT INTO sales (id, product_name, product_quantity, '
+                'customer_name, customer_email, customer_phone, user_name, '
+                'product_id, customer_id, user_id, date) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+        if count % 20 == 0:
+            echo(f'  {count * BATCH_SIZE} sales')
+    with connection:
+        connection.execute(
+            'UPDATE customers SET frequentcy_pay = (SELECT COUNT(*) FROM '
+            'sales WHERE sales.customer_id = customers.id)')
+    connection.close()
+    echo(f'  {sales} sales, {time.perf_counter() - started:.1f}s')
+
+    engine = create_engine(f'sqlite:///{path}')
+    migrations.upgrade(engine, echo=echo)
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', required=True,
+                        help='SQLite file to create')
+    args = parser.parse_args()
+    if os.path.exists(args.output):
+        parser.error(f'{args.output} already exists')
+    seed(args.output, args.products, args.customers, args.sales,
+         args.users, args.seed)
+
+
+if __name__ == '__main__':
+    main()
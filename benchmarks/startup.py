@@ -0,0 +1,98 @@
+"""Benchmark the cold start of the application.
+
+Every run starts a fresh Python process that imports the application,
+builds it with ``create_app`` and serves one request. The process reports
+how long each step took, its peak RSS, whether the heavy pandas / NumPy
+stack was imported, and how many SQL statements ``create_app`` executed
+(none are expected: roles are seeded by ``flask seed-roles``).
+
+Usage:
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+
+# Runs in the child process; prints one JSON line.
+PROBE = r'''
+import json, resource, sys, time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'before_cursor_execute',
+             lambda *args, **kwargs: statements.append(args[2]))
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+boot_statements = len(statements)
+status = app.test_client().get('/').status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'total_ms': (served - started) * 1000,
+    'status': status,
+    'boot_sql_statements': boot_statements,
+    'pandas_imported': 'pandas' in sys.modules,
+    'numpy_imported': 'numpy' in sys.modules,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+
+def run_once(workdir, env):
+    """Start one process and return the measurements it printed."""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=workdir, env=env, check=True,
+        capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--env', default='testing',
+                        help='APP_ENV of the started processes')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='crm-startup-')
+    env = dict(os.environ, APP_ENV=args.env,
+               PYTHONPATH=os.pathsep.join(
+                   filter(None, [ROOT, os.environ.get('PYTHONPATH')])),
+               PYTHONDONTWRITEBYTECODE='')
+    run_once(workdir, env)  # fills the bytecode caches
+    runs = [run_once(workdir, env) for _ in range(args.runs)]
+
+    timings = {}
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms'):
+        values = sorted(run[key] for run in runs)
+        timings[key] = {'p50': round(statistics.median(values), 1),
+                        'min': round(values[0], 1),
+                        'max': round(values[-1], 1)}
+    report = {'meta': {'runs': args.runs, 'env': args.env,
+                       'python': sys.version.split()[0]},
+              'timings': timings,
+              'peak_rss_mb': round(max(run['peak_rss_mb'] for run in runs), 1),
+              'boot_sql_statements': max(run['boot_sql_statements']
+                                         for run in runs),
+              'pandas_imported': any(run['pandas_imported'] for run in runs),
+              'numpy_imported': any(run['numpy_imported'] for run in runs),
+              'statuses': sorted({run['status'] for run in runs})}
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
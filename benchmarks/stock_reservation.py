@@ -0,0 +1,178 @@
+"""Concurrency benchmark for stock reservation on sale writes.
+
+Runs N parallel writers that each try to sell one unit at a time of the
+same product until their attempts are used up, once with the conditional
+UPDATE used by the application (``reserve_stock``) and once with the
+classic lock-then-check approach (``SELECT ... FOR UPDATE``; ``BEGIN
+IMMEDIATE`` on SQLite, which has no row locks). It reports throughput and
+verifies that no strategy sold more units than were in stock.
+
+Usage:
+    python benchmarks/stock_reservation.py --writers 64 --stock 5000
+    python benchmarks/stock_reservation.py --database-uri mysql+...://...
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event, func, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.lookups import lookup_id  # noqa: E402
+from app.models.product import Product, reserve_stock  # noqa: E402
+from app.models.sale import Sale  # noqa: E402
+
+
+PRODUCT = 'benchmark product'
+
+
+def make_app(uri, writers):
+    """Build a minimal application bound to ``uri`` with one connection
+    per writer."""
+    app = Flask(__name__)
+    options = {'pool_size': writers, 'max_overflow': 0}
+    if uri.startswith('sqlite'):
+        options['connect_args'] = {'timeout': 60,
+                                   'check_same_thread': False}
+    app.config.update(SQLALCHEMY_DATABASE_URI=uri,
+                      SQLALCHEMY_ENGINE_OPTIONS=options)
+    db.init_app(app)
+    return app
+
+
+def use_immediate_transactions(engine):
+    """Make every SQLite transaction take the write lock when it begins."""
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def sell_conditional():
+    """One sale with the application's conditional UPDATE."""
+    if reserve_stock(lookup_id('product', PRODUCT), 1):
+        db.session.rollback()
+        return False
+    db.session.add(Sale(product_name=PRODUCT, product_quantity=1,
+                        customer_name='bench', customer_email='bench@x.io',
+                        user_name='bench'))
+    db.session.commit()
+    return True
+
+
+def sell_row_lock():
+    """One sale that locks the product row, checks and decrements."""
+    product = db.session.scalars(
+        select(Product).where(Product.product_name == PRODUCT)
+        .with_for_update()).one()
+    if product.product_quantity < 1:
+        db.session.rollback()
+        return False
+    product.product_quantity -= 1
+    db.session.add(Sale(product_name=PRODUCT, product_quantity=1,
+                        customer_name='bench', customer_email='bench@x.io',
+                        user_name='bench'))
+    db.session.commit()
+    return True
+
+
+STRATEGIES = {'conditional_update': sell_conditional,
+              'row_lock': sell_row_lock}
+
+
+def run(strategy, uri, writers, stock, attempts):
+    """Run one strategy and return its measurements."""
+    app = make_app(uri, writers)
+    with app.app_context():
+        if strategy == 'row_lock' and db.engine.dialect.name == 'sqlite':
+            use_immediate_transactions(db.engine)
+        tables = [Product.__table__, Sale.__table__]
+        db.metadata.drop_all(db.engine, tables=tables)
+        db.metadata.create_all(db.engine, tables=tables)
+        db.session.add(Product(product_name=PRODUCT, price=1,
+                               product_quantity=stock))
+        db.session.commit()
+
+    sell = STRATEGIES[strategy]
+    sold = [0] * writers
+    retries = [0] * writers
+    barrier = threading.Barrier(writers + 1)
+
+    def writer(index):
+        with app.app_context():
+            barrier.wait()
+            for _ in range(attempts):
+                while True:
+                    try:
+                        if sell():
+                            sold[index] += 1
+                        break
+                    except OperationalError:
+                        db.session.rollback()
+                        retries[index] += 1
+
+    threads = [threading.Thread(target=writer, args=(i,))
+               for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        left = db.session.scalar(select(Product.product_quantity))
+        recorded = db.session.scalar(
+            select(func.coalesce(func.sum(Sale.product_quantity), 0)))
+        db.engine.dispose()
+    return {'strategy': strategy,
+            'writers': writers,
+            'attempts': writers * attempts,
+            'sold': sum(sold),
+            'stock_left': left,
+            'sales_recorded': recorded,
+            'oversold': max(0, sum(sold) - stock),
+            'consistent': left >= 0 and left + recorded == stock,
+            'retries': sum(retries),
+            'seconds': round(elapsed, 3),
+            'attempts_per_second': round(writers * attempts / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=64)
+    parser.add_argument('--stock', type=int, default=5000)
+    parser.add_argument('--attempts', type=int, default=100,
+                        help='sale attempts per writer')
+    parser.add_argument('--database-uri', default=None,
+                        help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    results = []
+    for strategy in STRATEGIES:
+        uri = args.database_uri
+        if uri is None:
+            path = os.path.join(tempfile.mkdtemp(), f'{strategy}.db')
+            uri = f'sqlite:///{path}'
+        results.append(run(strategy, uri, args.writers, args.stock,
+                           args.attempts))
+    print(json.dumps(results, indent=2))
+    if not all(result['consistent'] and not result['oversold']
+               for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,4 +14,136 @@ class Config:
         os.environ.get('DATABASE_URI')
         or 'sqlite:///' + os.path.join(basedir, 'app.db'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional read replica; the read-only views query it when set
+    REPLICA_DATABASE_URI = os.environ.get('REPLICA_DATABASE_URI')
+    SQLALCHEMY_BINDS = ({'replica': REPLICA_DATABASE_URI}
+                        if REPLICA_DATABASE_URI else {})
+    # Seconds a user's reads stay on the primary after they write,
+    # comfortably above the usual replication lag
+    REPLICA_LAG_SECONDS = 5
+    # Test connections before use so dropped ones are replaced silently
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    DEBUG = False
+    # Default and maximum rows per page on the list views
+    PER_PAGE = 50
+    MAX_PER_PAGE = 500
+    # Rows fetched per database round trip by the streaming exports
+    EXPORT_BATCH_SIZE = 5000
+    # Maximum number of results returned by a search
+    SEARCH_LIMIT = 100
+    # Rows per batch when streaming uploaded CSV/JSON files into the DB
+    IMPORT_BATCH_SIZE = 10000
+    # Threads per process that run queued upload imports
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))
+    # A process refreshes its queued and running jobs every
+    # IMPORT_HEARTBEAT_SECONDS; the jobs of other processes not refreshed
+    # for IMPORT_STALE_SECONDS are failed by the next upload, as their
+    # process died (e.g. in a restart)
+    IMPORT_HEARTBEAT_SECONDS = 30
+    IMPORT_STALE_SECONDS = 300
+    # Name -> id lookup cache: entries kept, seconds before they expire,
+    # and an optional SQLite file shared by all worker processes
+    LOOKUP_CACHE_SIZE = 10000
+    LOOKUP_CACHE_TTL = 300
+    LOOKUP_CACHE_PATH = os.environ.get('LOOKUP_CACHE_PATH')
+    # Signed-in users and their roles cached per process (0 TTL disables)
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 60
+    # Rendered list page tables: entries kept, seconds before they expire,
+    # and an optional SQLite file shared by all worker processes
+    FRAGMENT_CACHE_SIZE = 1000
+    FRAGMENT_CACHE_TTL = 600
+    FRAGMENT_CACHE_PATH = os.environ.get('FRAGMENT_CACHE_PATH')
+    # Per-request timings and /metrics; queries slower than SLOW_QUERY_MS
+    # are logged with their plan, a statement run N_PLUS_ONE_THRESHOLD
+    # times in one request is logged as a probable N+1
+    INSTRUMENTATION = True
+    SLOW_QUERY_MS = 200
+    N_PLUS_ONE_THRESHOLD = 10
+    # Where admin requests sent with "X-Profile: 1" dump their cProfile
+    PROFILE_DIR = os.path.join(basedir, 'profiles')
+    # Columnar sales snapshot of the analytics reports, refreshed from the
+    # sales above its id watermark when older than this many seconds
+    ANALYTICS_DIR = os.environ.get('ANALYTICS_DIR') or os.path.join(
+        basedir, 'analytics')
+    ANALYTICS_REFRESH_SECONDS = 60
+    # bcrypt cost of new password hashes; logins rehash older ones
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    # Processes verifying passwords (0 checks in the request thread), the
+    # checks that may be pending at once and how long a login waits
+    PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', 0))
+    PASSWORD_QUEUE_SIZE = 64
+    PASSWORD_VERIFY_TIMEOUT = 10
+    # Change feed (/changes): largest page, longest long poll or event
+    # stream, seconds between polls of the log, and how long a gap in
+    # its sequence may be a transaction still committing. Changes older
+    # than CHANGE_LOG_RETENTION_DAYS are deleted by `flask prune-changes`.
+    CHANGE_FEED_MAX_LIMIT = 1000
+    CHANGE_FEED_MAX_WAIT = 30
+    CHANGE_FEED_POLL_SECONDS = 1
+    CHANGE_FEED_GAP_SECONDS = 10
+    CHANGE_LOG_RETENTION_DAYS = 30
+    # Bearer token required by /metrics when set; with
+    # METRICS_REQUIRE_TOKEN, /metrics is refused while it is unset
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_REQUIRE_TOKEN = False
+
+
+class DevelopmentConfig(Config):
     DEBUG = True
+
+
+class TestingConfig(Config):
+    # Two local SQLite files stand in for the primary and its replica;
+    # ``flask replica-sync`` copies the first onto the second.
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 4
+    SQLALCHEMY_DATABASE_URI = (
+        os.environ.get('TEST_DATABASE_URI')
+        or 'sqlite:///' + os.path.join(basedir, 'test.db'))
+    SQLALCHEMY_BINDS = {'replica': (
+        os.environ.get('TEST_REPLICA_DATABASE_URI')
+        or 'sqlite:///' + os.path.join(basedir, 'test_replica.db'))}
+
+
+class ProductionConfig(Config):
+    # Sized for MySQL: a bounded pool per process with a short overflow,
+    # connections recycled before the server's wait_timeout closes them,
+    # and READ COMMITTED to avoid InnoDB gap locks on the hot updates.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+        'isolation_level': os.environ.get('DB_ISOLATION_LEVEL',
+                                          'READ COMMITTED'),
+    }
+    METRICS_REQUIRE_TOKEN = True
+
+
+# APP_ENV value -> configuration class
+config_by_name = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+def get_config(name=None):
+    """ Return the configuration class of an environment.
+
+    Parameters:
+        name (str): 'development', 'testing' or 'production'; defaults to
+        the APP_ENV environment variable, then 'development'.
+
+    Returns:
+        type: The configuration class.
+    """
+    name = name or os.environ.get('APP_ENV', 'development')
+    try:
+        return config_by_name[name]
+    except KeyError:
+        raise ValueError(f'unknown APP_ENV {name!r}, expected one of '
+                         f'{sorted(config_by_name)}')